@@ -3,17 +3,33 @@
 from functools import reduce
 
 import sys
+import json
 import time
+import asyncio
+import threading
 import argparse
 import psutil
 import numpy as np
 
-from multiprocessing.sharedctypes import Value, Synchronized
-from ctypes import c_bool, c_int
-from multiprocessing import Process, Queue
+from multiprocessing.sharedctypes import Array, Synchronized, SynchronizedArray
+from ctypes import c_bool, c_int, c_double, c_ulonglong
+from multiprocessing import Process, Queue, Pipe
 from queue import Empty
 
 import av_stream_video_server as vs
+import av_stream_video_shm as shm
+import av_stream_video_hub as hub
+import av_stream_video_encode as enc
+import av_stream_video_watchdog as wd
+import av_stream_video_stats as st
+import av_stream_video_playback as pb
+import av_stream_video_output as out
+import av_stream_video_motion as mo
+import av_stream_video_thread as th
+import av_stream_video_notify as nt
+import av_stream_video_sync as sy
+import av_stream_video_mosaic as ms
+import av_stream_video_sched as sc
 
 
 LOGGING_PREFIX = '[av.stream_video] '
@@ -21,6 +37,14 @@ LOGGING_SUFFIX = '\n'
 UNKNOWN_PID = 0
 DEFAULT_MAX_QUEUE_SIZE = 4
 DEFAULT_VIDEO_FPS = 12
+DEFAULT_FRAME_WAIT_TIMEOUT = 1.0
+FRAME_WAIT_POLL_INTERVAL = 0.002
+ASYNC_CHECK_INTERVAL = 0.5  # The longest wait for a notification, so the watchdog still runs without frames.
+
+STALE_FRAME_REPEAT = 'repeat'
+STALE_FRAME_UNCHANGED = 'unchanged'
+STALE_FRAME_WAIT = 'wait'
+STALE_FRAME_LIST = [STALE_FRAME_REPEAT, STALE_FRAME_UNCHANGED, STALE_FRAME_WAIT]
 
 
 def print_out(message):
@@ -91,6 +115,118 @@ class NullDataException(TypeError):
     pass
 
 
+class UnchangedFrameException(NotReadyException):
+    """
+    No new frame has arrived since the previous ``on_run()``.
+    """
+
+
+class ServerChannels:
+    """
+    The flags and the frame channel of a single server process.
+    A standby process is created with its own channels, which the lambda adopts on a reopen.
+    """
+
+    def __init__(self):
+        self.exit_flag: Synchronized = None  # noqa
+        self.server_state: Synchronized = None  # noqa
+        self.refresh_flag: Synchronized = None  # noqa
+        self.heartbeat: Synchronized = None  # noqa
+        self.command_queue: Queue = None  # noqa
+        self.queue: Queue = None  # noqa
+        self.ring: shm.SharedFrameRing = None  # noqa
+        self.process: Process = None  # noqa
+        self.listener: nt.NotifyListener = None  # noqa
+        self.waker: nt.Notifier = None  # noqa
+        self.command_count: nt.StatusWord = None  # noqa
+        self.conn = None  # Sends the stream configuration to a standby process.
+        self.layout = None  # The frame channel a standby process was created for.
+
+    @classmethod
+    def create(cls):
+        channels = cls()
+        channels.exit_flag = nt.StatusWord(c_bool, False)
+        channels.server_state = nt.StatusWord(c_int, vs.SERVER_STATE_DONE)
+        channels.refresh_flag = nt.StatusWord(c_bool, False)
+        channels.heartbeat = nt.StatusWord(c_double, 0.0)
+        channels.command_queue = Queue()
+        return channels
+
+
+def create_pipes():
+    """
+    Creates the notification pipes and the command counter between the lambda and a new server.
+    Returns the frame listener and the waker of the lambda, and the kwargs of the server.
+    """
+
+    listener, frame_writer = nt.NotifyListener.create()
+    wakeup, wake_writer = nt.NotifyListener.create()
+    kwargs = {
+        'frame_notifier': nt.Notifier([frame_writer]),
+        'wakeup': wakeup,
+        'command_count': nt.StatusWord(c_ulonglong, 0),
+        'wake_on_consume': True,
+    }
+    return listener, nt.Notifier([wake_writer]), kwargs
+
+
+def close_server_ends(kwargs: dict):
+    """
+    Closes the lambda's copies of the server ends of the pipes, once the server process has started,
+    so the pipes are closed when the process is gone.
+    """
+
+    for conn in kwargs['frame_notifier'].conns:
+        conn.close()
+    kwargs['wakeup'].close()
+
+
+def reap_server(channels: ServerChannels, timeout: float):
+    """
+    Stops a retired or unused server process and releases its channels.
+    """
+
+    with channels.exit_flag.get_lock():
+        channels.exit_flag.value = True
+    if channels.waker is not None:
+        channels.waker.notify()
+    if channels.conn is not None:
+        try:
+            channels.conn.send(None)  # Cancel a standby process.
+        except (OSError, ValueError):
+            pass
+        channels.conn.close()
+        channels.conn = None
+
+    process = channels.process
+    if process is not None:
+        process.join(timeout=timeout)
+        if process.is_alive():
+            print_error(f'reap_server() Send a KILL signal to the server process: {process.pid}')
+            process.kill()
+            process.join(timeout=timeout)
+        print_out(f'reap_server() The exit code of {process.pid} is {process.exitcode}.')
+        if not process.is_alive():
+            process.close()
+        channels.process = None
+
+    for queue in (channels.queue, channels.command_queue):
+        if queue is not None:
+            queue.close()
+            queue.cancel_join_thread()
+    channels.queue = None
+    channels.command_queue = None
+
+    if channels.ring is not None:
+        channels.ring.close()
+        channels.ring.unlink()
+        channels.ring = None
+
+    if channels.listener is not None:
+        channels.listener.close()
+        channels.listener = None
+
+
 class StreamVideo:
     """
     """
@@ -107,24 +243,106 @@ class StreamVideo:
         self.stream_options: list = vs.opt_kwargs(kwargs, 'stream_options', [])
         self.reconnect_sleep: float = vs.opt_kwargs(kwargs, 'reconnect_sleep', vs.RECONNECT_SLEEP)
         self.iteration_sleep: float = vs.opt_kwargs(kwargs, 'iteration_sleep', vs.ITERATION_SLEEP)
+        self.open_timeout: float = vs.opt_kwargs(kwargs, 'open_timeout', vs.DEFAULT_OPEN_TIMEOUT)
+        self.read_timeout: float = vs.opt_kwargs(kwargs, 'read_timeout', vs.DEFAULT_READ_TIMEOUT)
         self.verbose: bool = vs.opt_kwargs(kwargs, 'verbose', False)
         self.low_delay: bool = vs.opt_kwargs(kwargs, 'low_delay', False)
+        self.decode_mode: str = vs.opt_kwargs(kwargs, 'decode_mode', vs.DECODE_MODE_ALL)
         self.refresh_error_threshold: int = vs.opt_kwargs(kwargs, 'refresh_error_threshold', vs.REFRESH_ERROR_THRESHOLD)
+        self.reconnect_max_sleep: float = vs.opt_kwargs(kwargs, 'reconnect_max_sleep', wd.DEFAULT_RECONNECT_MAX_SLEEP)
+        self.stall_seconds: float = vs.opt_kwargs(kwargs, 'stall_seconds', wd.DEFAULT_STALL_SECONDS)
+        self.reconnect_seconds: float = vs.opt_kwargs(kwargs, 'reconnect_seconds', wd.DEFAULT_RECONNECT_SECONDS)
+        self.respawn_seconds: float = vs.opt_kwargs(kwargs, 'respawn_seconds', wd.DEFAULT_RESPAWN_SECONDS)
+        self.warm_standby: bool = vs.opt_kwargs(kwargs, 'warm_standby', False)
+        self.stats_port: int = vs.opt_kwargs(kwargs, 'stats_port', 0)
 
         self.max_queue_size: int = vs.opt_kwargs(kwargs, 'max_queue_size', DEFAULT_MAX_QUEUE_SIZE)
         self.exit_timeout_seconds: float = vs.opt_kwargs(kwargs, 'exit_timeout_seconds', vs.DEFAULT_EXIT_TIMEOUT_SECONDS)
-
-        self.refresh_error_count = 0
-        self.refresh_flag: Synchronized = Value(c_bool, False)
+        self.transport: str = vs.opt_kwargs(kwargs, 'transport', vs.DEFAULT_TRANSPORT)
+        self.ring_slots: int = vs.opt_kwargs(kwargs, 'ring_slots', shm.DEFAULT_RING_SLOTS)
+        self.frame_copy: bool = vs.opt_kwargs(kwargs, 'frame_copy', False)
+        self.target_fps: float = vs.opt_kwargs(kwargs, 'target_fps', 0.0)
+        self.decimate_every_n: int = vs.opt_kwargs(kwargs, 'decimate_every_n', 1)
+        self.convert_on_consume: bool = vs.opt_kwargs(kwargs, 'convert_on_consume', False)
+        self.record_buffer_seconds: float = vs.opt_kwargs(kwargs, 'record_buffer_seconds', 0.0)
+        self.server_mode: str = vs.opt_kwargs(kwargs, 'server_mode', vs.SERVER_MODE_PROCESS)
+        self.worker_mode: str = vs.opt_kwargs(kwargs, 'worker_mode', vs.WORKER_MODE_PROCESS)
+        self.hub_address: str = vs.opt_kwargs(kwargs, 'hub_address', hub.DEFAULT_HUB_ADDRESS)
+        self.stream_key: str = vs.opt_kwargs(kwargs, 'stream_key', '')
+        self.frame_encoding: str = vs.opt_kwargs(kwargs, 'frame_encoding', enc.FRAME_ENCODING_NONE)
+        self.frame_encoding_quality: int = vs.opt_kwargs(kwargs, 'frame_encoding_quality',
+                                                         enc.DEFAULT_ENCODING_QUALITY)
+        self.stale_frame_mode: str = vs.opt_kwargs(kwargs, 'stale_frame_mode', STALE_FRAME_REPEAT)
+        self.frame_wait_timeout: float = vs.opt_kwargs(kwargs, 'frame_wait_timeout', DEFAULT_FRAME_WAIT_TIMEOUT)
+        self.playback_pacing: str = vs.opt_kwargs(kwargs, 'playback_pacing', pb.PLAYBACK_PACING_NONE)
+        self.playback_speed: float = vs.opt_kwargs(kwargs, 'playback_speed', pb.DEFAULT_PLAYBACK_SPEED)
+        self.playback_loop: bool = vs.opt_kwargs(kwargs, 'playback_loop', False)
+        self.playback_start: float = vs.opt_kwargs(kwargs, 'playback_start', 0.0)
+        self.playback_end: float = vs.opt_kwargs(kwargs, 'playback_end', 0.0)
+        self.keyframe_index_dir: str = vs.opt_kwargs(kwargs, 'keyframe_index_dir', '')
+        self.batch_size: int = vs.opt_kwargs(kwargs, 'batch_size', 1)
+        self.batch_timeout: float = vs.opt_kwargs(kwargs, 'batch_timeout', vs.DEFAULT_BATCH_TIMEOUT)
+        self.output_specs: str = vs.opt_kwargs(kwargs, 'output_specs', '')
+        self.extra_specs = out.parse_output_specs(self.output_specs)
+        self.frame_crop: str = vs.opt_kwargs(kwargs, 'frame_crop', '')
+        self.crop = out.parse_crop(self.frame_crop)
+        self.motion_gate: str = vs.opt_kwargs(kwargs, 'motion_gate', mo.MOTION_GATE_NONE)
+        self.motion_threshold: float = vs.opt_kwargs(kwargs, 'motion_threshold', mo.DEFAULT_MOTION_THRESHOLD)
+        self.motion_keepalive: float = vs.opt_kwargs(kwargs, 'motion_keepalive', mo.DEFAULT_MOTION_KEEPALIVE)
+        self.capture_clock: str = vs.opt_kwargs(kwargs, 'capture_clock', sy.CAPTURE_CLOCK_AUTO)
+        self.mosaic_name: str = vs.opt_kwargs(kwargs, 'mosaic_name', '')
+        self.mosaic_tile: int = vs.opt_kwargs(kwargs, 'mosaic_tile', 0)
+        self.decoder_threads: int = vs.opt_kwargs(kwargs, 'decoder_threads', 0)
+        self.decoder_thread_type: str = vs.opt_kwargs(kwargs, 'decoder_thread_type', sc.DECODER_THREAD_TYPE_AUTO)
+        self.cpu_affinity: str = vs.opt_kwargs(kwargs, 'cpu_affinity', sc.CPU_AFFINITY_INHERIT)
+        self.nice: int = vs.opt_kwargs(kwargs, 'nice', sc.NICE_INHERIT)
+
+        # Lock-free words, read by on_run() and written by the server.
+        self.refresh_flag: Synchronized = nt.StatusWord(c_bool, False)  # noqa
+        self.heartbeat: Synchronized = nt.StatusWord(c_double, 0.0)  # noqa
+        self.watchdog = wd.StallWatchdog()
 
         self.process: Process = None  # noqa
         self.pid = UNKNOWN_PID
 
-        self.server_state: Synchronized = Value(c_int, vs.SERVER_STATE_DONE)
+        self.server_state: Synchronized = nt.StatusWord(c_int, vs.SERVER_STATE_DONE)  # noqa
 
-        self.exit_flag: Synchronized = Value(c_bool, False)
+        self.exit_flag: Synchronized = nt.StatusWord(c_bool, False)  # noqa
         self.queue: Queue = None  # noqa
+        self.command_queue: Queue = None  # noqa
+        self.ring: shm.SharedFrameRing = None  # noqa
+        self.hub: hub.StreamVideoHubClient = None  # noqa
+        self.hub_pacer: hub.SubscriberPacer = None  # noqa  The pacing of this lambda on a shared stream.
+        self.hub_encoder: enc.FrameEncoder = None  # noqa  Without the encoding of the shared stream.
+        self.listener: nt.NotifyListener = None  # noqa  Readable when the server has pushed a frame.
+        self.waker: nt.Notifier = None  # noqa  Wakes up the server for an exit, a refresh or a command.
+        self.command_count: nt.StatusWord = None  # noqa
+        self.async_lock: asyncio.Lock = None  # noqa  One next_frame() at a time.
+        self.ring_cursor = 0
+        self.last_seq = 0
         self.last_image = None
+        self.last_encoded = None  # The encoded image of last_image. (bytes)
+        self.last_extras = list()  # The images of extra_specs, converted from the same frame as last_image.
+        self.last_meta = None  # The metadata of last_image. (seq, pts, index, timestamp, capture_time)
+        self.last_batch_meta = None  # The metadata of each frame, if last_image is a batch.
+        self.last_fresh = False  # Whether last_image was not delivered before.
+        self.empty_image = None
+
+        self.pool_counters: SynchronizedArray = Array(c_ulonglong, vs.POOL_COUNTER_SIZE)
+
+        # The server processes continue the same counters. The lambda adds the delivery times.
+        self.shared_stats: SynchronizedArray = Array(c_double, st.STATS_SIZE)
+        self.consumer_stats = st.PipelineStats()
+        self.stats_server: st.StatsHttpServer = None  # noqa
+
+        self.standby: ServerChannels = None  # noqa
+        self.reapers = list()
+
+        self.config_deferred = False  # Set by configure() to send several props at once.
+
+        self.recovery_begin = None
+        self.recovery_seconds = 0.0  # The last one.
+        self.recovery_count = 0
 
     def on_set(self, key, val):
         if key == 'video_src':
@@ -149,16 +367,111 @@ class StreamVideo:
             self.reconnect_sleep = float(val)
         elif key == 'iteration_sleep':
             self.iteration_sleep = float(val)
+        elif key == 'open_timeout':
+            self.open_timeout = float(val)
+        elif key == 'read_timeout':
+            self.read_timeout = float(val)
         elif key == 'verbose':
             self.verbose = val.lower() in ['y', 'yes', 'true']
         elif key == 'low_delay':
             self.low_delay = val.lower() in ['y', 'yes', 'true']
+        elif key == 'decode_mode':
+            self.decode_mode = val
         elif key == 'max_queue_size':
             self.max_queue_size = int(val)
         elif key == 'exit_timeout_seconds':
             self.exit_timeout_seconds = float(val)
         elif key == 'refresh_error_threshold':
-            self.refresh_error_threshold = int(val)
+            self.refresh_error_threshold = int(val)  # Deprecated: Replaced by the stall watchdog.
+        elif key == 'reconnect_max_sleep':
+            self.reconnect_max_sleep = float(val)
+        elif key == 'stall_seconds':
+            self.stall_seconds = float(val)
+        elif key == 'reconnect_seconds':
+            self.reconnect_seconds = float(val)
+        elif key == 'respawn_seconds':
+            self.respawn_seconds = float(val)
+        elif key == 'warm_standby':
+            self.warm_standby = val.lower() in ['y', 'yes', 'true']
+        elif key == 'stats_port':
+            self.stats_port = int(val)
+        elif key == 'transport':
+            self.transport = val
+        elif key == 'ring_slots':
+            self.ring_slots = int(val)
+        elif key == 'frame_copy':
+            self.frame_copy = val.lower() in ['y', 'yes', 'true']
+        elif key == 'target_fps':
+            self.target_fps = float(val)
+        elif key == 'decimate_every_n':
+            self.decimate_every_n = int(val)
+        elif key == 'convert_on_consume':
+            self.convert_on_consume = val.lower() in ['y', 'yes', 'true']
+        elif key == 'record_buffer_seconds':
+            self.record_buffer_seconds = float(val)
+        elif key == 'server_mode':
+            self.server_mode = val
+        elif key == 'worker_mode':
+            self.worker_mode = val
+        elif key == 'hub_address':
+            self.hub_address = val if val else hub.DEFAULT_HUB_ADDRESS
+        elif key == 'stream_key':
+            self.stream_key = val
+        elif key == 'frame_encoding':
+            self.frame_encoding = val if val else enc.FRAME_ENCODING_NONE
+        elif key == 'frame_encoding_quality':
+            self.frame_encoding_quality = int(val)
+        elif key == 'stale_frame_mode':
+            self.stale_frame_mode = val
+        elif key == 'frame_wait_timeout':
+            self.frame_wait_timeout = float(val)
+        elif key == 'playback_pacing':
+            self.playback_pacing = val if val else pb.PLAYBACK_PACING_NONE
+        elif key == 'playback_speed':
+            self.playback_speed = float(val)
+        elif key == 'playback_loop':
+            self.playback_loop = val.lower() in ['y', 'yes', 'true']
+        elif key == 'playback_start':
+            self.playback_start = float(val)
+        elif key == 'playback_end':
+            self.playback_end = float(val)
+        elif key == 'keyframe_index_dir':
+            self.keyframe_index_dir = val
+        elif key == 'batch_size':
+            self.batch_size = int(val)
+        elif key == 'batch_timeout':
+            self.batch_timeout = float(val)
+        elif key == 'output_specs':
+            self.extra_specs = out.parse_output_specs(val)
+            self.output_specs = val
+        elif key == 'frame_crop':
+            self.crop = out.parse_crop(val)
+            self.frame_crop = val
+        elif key == 'motion_gate':
+            self.motion_gate = val
+        elif key == 'motion_threshold':
+            self.motion_threshold = float(val)
+        elif key == 'motion_keepalive':
+            self.motion_keepalive = float(val)
+        elif key == 'capture_clock':
+            self.capture_clock = val
+        elif key == 'mosaic_name':
+            self.mosaic_name = val
+        elif key == 'mosaic_tile':
+            self.mosaic_tile = int(val)
+        elif key == 'decoder_threads':
+            self.decoder_threads = int(val)
+        elif key == 'decoder_thread_type':
+            self.decoder_thread_type = val
+        elif key == 'cpu_affinity':
+            self.cpu_affinity = val
+        elif key == 'nice':
+            self.nice = int(val)
+
+        if key in vs.LIVE_CONFIG_KEYS and not self.config_deferred and self._is_running():
+            self._apply_config([key])
+        if not self.config_deferred:
+            self._refresh_standby()
 
     def on_get(self, key):
         if key == 'video_src':
@@ -183,16 +496,116 @@ class StreamVideo:
             return self.reconnect_sleep
         elif key == 'iteration_sleep':
             return self.iteration_sleep
+        elif key == 'open_timeout':
+            return str(self.open_timeout)
+        elif key == 'read_timeout':
+            return str(self.read_timeout)
         elif key == 'verbose':
             return str(self.verbose)
         elif key == 'low_delay':
             return str(self.low_delay)
+        elif key == 'decode_mode':
+            return self.decode_mode
         elif key == 'max_queue_size':
             return str(self.max_queue_size)
         elif key == 'exit_timeout_seconds':
             return str(self.exit_timeout_seconds)
         elif key == 'refresh_error_threshold':
             return str(self.refresh_error_threshold)
+        elif key == 'reconnect_max_sleep':
+            return str(self.reconnect_max_sleep)
+        elif key == 'stall_seconds':
+            return str(self.stall_seconds)
+        elif key == 'reconnect_seconds':
+            return str(self.reconnect_seconds)
+        elif key == 'respawn_seconds':
+            return str(self.respawn_seconds)
+        elif key == 'stalled':
+            return str(self.watchdog.stalled)
+        elif key == 'warm_standby':
+            return str(self.warm_standby)
+        elif key == 'stats_port':
+            return str(self.stats_port)
+        elif key == 'stats':
+            return json.dumps(st.stats_to_dict(self.get_stats()))
+        elif key == 'recovery_seconds':
+            return str(self.recovery_seconds)
+        elif key == 'recovery_count':
+            return str(self.recovery_count)
+        elif key == 'transport':
+            return self.transport
+        elif key == 'ring_slots':
+            return str(self.ring_slots)
+        elif key == 'frame_copy':
+            return str(self.frame_copy)
+        elif key == 'target_fps':
+            return str(self.target_fps)
+        elif key == 'decimate_every_n':
+            return str(self.decimate_every_n)
+        elif key == 'convert_on_consume':
+            return str(self.convert_on_consume)
+        elif key == 'record_buffer_seconds':
+            return str(self.record_buffer_seconds)
+        elif key == 'server_mode':
+            return self.server_mode
+        elif key == 'worker_mode':
+            return self.worker_mode
+        elif key == 'hub_address':
+            return self.hub_address
+        elif key == 'stream_key':
+            return self.stream_key
+        elif key == 'frame_encoding':
+            return self.frame_encoding
+        elif key == 'frame_encoding_quality':
+            return str(self.frame_encoding_quality)
+        elif key == 'stale_frame_mode':
+            return self.stale_frame_mode
+        elif key == 'frame_wait_timeout':
+            return str(self.frame_wait_timeout)
+        elif key == 'playback_pacing':
+            return self.playback_pacing
+        elif key == 'playback_speed':
+            return str(self.playback_speed)
+        elif key == 'playback_loop':
+            return str(self.playback_loop)
+        elif key == 'playback_start':
+            return str(self.playback_start)
+        elif key == 'playback_end':
+            return str(self.playback_end)
+        elif key == 'keyframe_index_dir':
+            return self.keyframe_index_dir
+        elif key == 'batch_size':
+            return str(self.batch_size)
+        elif key == 'batch_timeout':
+            return str(self.batch_timeout)
+        elif key == 'output_specs':
+            return self.output_specs
+        elif key == 'frame_crop':
+            return self.frame_crop
+        elif key == 'motion_gate':
+            return self.motion_gate
+        elif key == 'motion_threshold':
+            return str(self.motion_threshold)
+        elif key == 'motion_keepalive':
+            return str(self.motion_keepalive)
+        elif key == 'capture_clock':
+            return self.capture_clock
+        elif key == 'mosaic_name':
+            return self.mosaic_name
+        elif key == 'mosaic_tile':
+            return str(self.mosaic_tile)
+        elif key == 'decoder_threads':
+            return str(self.decoder_threads)
+        elif key == 'decoder_thread_type':
+            return self.decoder_thread_type
+        elif key == 'cpu_affinity':
+            return self.cpu_affinity
+        elif key == 'nice':
+            return str(self.nice)
+        elif key == 'pool_hits':
+            return str(self._get_pool_counter(vs.POOL_COUNTER_HITS))
+        elif key == 'pool_misses':
+            return str(self._get_pool_counter(vs.POOL_COUNTER_MISSES))
 
     def _get_server_state(self):
         with self.server_state.get_lock():
@@ -205,6 +618,8 @@ class StreamVideo:
     def _set_exit_flag(self, value: bool):
         with self.exit_flag.get_lock():
             self.exit_flag.value = value
+        if value:
+            self._wake_server()
 
     def _get_exit_flag(self):
         with self.exit_flag.get_lock():
@@ -213,61 +628,344 @@ class StreamVideo:
     def _set_refresh_flag(self, value: bool):
         with self.refresh_flag.get_lock():
             self.refresh_flag.value = value
+        if value:
+            self._wake_server()
 
-    def do_refresh_ok(self):
-        self.refresh_error_count = 0
-        self._set_refresh_flag(False)
+    def _wake_server(self):
+        if self.waker is not None:
+            self.waker.notify()
 
-    def do_refresh_error(self):
-        if self.refresh_error_count < self.refresh_error_threshold:
-            self.refresh_error_count += 1
-            if self.verbose:
-                print_out(f'StreamVideo.do_refresh_error({self.refresh_error_count}/{self.refresh_error_threshold})')
-        else:
-            self.refresh_error_count = 0
-            self._set_refresh_flag(True)
-            print_error(f'StreamVideo.do_refresh_error() Enable refresh_flag')
-            return self.last_image
+    def _get_pool_counter(self, index: int):
+        with self.pool_counters.get_lock():
+            return self.pool_counters[index]
 
-    def do_refresh_error_v2(self):
+    def _get_heartbeat(self):
+        with self.heartbeat.get_lock():
+            return self.heartbeat.value
+
+    def check_watchdog(self):
         """
-        Fix: camera power off -> and power on case ...
+        Escalates when the server has not decoded a frame for a while. (see ``wd.StallWatchdog``)
+        A stall replaces the last frame with an empty one, a reconnect asks the server to reopen the source,
+        and a respawn kills the server process, which the next ``on_run()`` creates again. (a hub stream reopens)
         """
 
-        if self.refresh_error_count < self.refresh_error_threshold:
-            self.refresh_error_count += 1
-            if self.verbose:
-                print_out(f'StreamVideo.do_refresh_error_v2({self.refresh_error_count}/{self.refresh_error_threshold})')
-        else:
-            self.refresh_error_count = 0
+        now = time.monotonic()
+        action = self.watchdog.check(self._get_heartbeat(), now)
+        if action == wd.WATCHDOG_OK:
+            return
+
+        print_error(f'StreamVideo.check_watchdog() {wd.WATCHDOG_NAMES[action]} '
+                    f'(no frames for {self.watchdog.idle_seconds:.1f}s)')
+        if self.last_image is not None:
             self.last_image = self.get_empty_image(self.last_image)
+        self.last_extras = [np.zeros(extra.shape, np.uint8) for extra in self.last_extras]
+        self.last_encoded = None
+        self.last_meta = None
+        self.last_batch_meta = None
+
+        if action == wd.WATCHDOG_RECONNECT:
+            self._begin_recovery()
             self._set_refresh_flag(True)
-            if not self._get_exit_flag():
-                # assert self.process is not None
+        elif action == wd.WATCHDOG_RESPAWN:
+            self.watchdog.reset(now)
+            if not self._get_exit_flag() and self.process is not None:
+                # The next on_run() creates a new server process.
                 self.process.kill()
-            print_error(f'StreamVideo.do_refresh_error_v2() Enable refresh_flag')
-            return self.last_image
+            else:
+                # A hub stream reopens itself when it sees the refresh_flag.
+                self._set_refresh_flag(True)
+
+    def _begin_recovery(self):
+        if self.recovery_begin is None:
+            self.recovery_begin = time.monotonic()
+
+    def _end_recovery(self):
+        if self.recovery_begin is None:
+            return
+        self.recovery_seconds = time.monotonic() - self.recovery_begin
+        self.recovery_count += 1
+        self.recovery_begin = None
+        print_out(f'StreamVideo._end_recovery() Recovered in {self.recovery_seconds:.3f}s '
+                  f'(count={self.recovery_count})')
+
+    def _set_last_meta(self, meta: dict):
+        # A frame pushed again by the server keeps its sequence number.
+        self.last_fresh = self.last_meta is None or meta['seq'] != self.last_meta['seq']
+        self.last_meta = meta
+        if self.last_fresh:
+            self._end_recovery()
+            self.consumer_stats.observe(st.STATS_DELIVERY_SECONDS, max(time.time() - meta['timestamp'], 0.0))
+
+    def _set_batch_meta(self, batch_meta: list):
+        # A batch is fresh if its last frame is.
+        self.last_batch_meta = batch_meta
+        self._set_last_meta(batch_meta[-1])
+
+    def _read_ring_meta(self, seq: int):
+        meta = self.ring.read_meta(seq)
+        return {
+            'seq': meta['frame_seq'],
+            'pts': meta['pts'],
+            'index': meta['index'],
+            'timestamp': meta['timestamp'],
+            'capture_time': meta['capture_time'],
+        }
 
-    def get_last_image(self):
+    def _take_from_ring(self):
+        paced = self.hub_pacer is not None and self.hub_pacer.is_enabled()
+        # Marks the frame as consumed, so the server keeps it in its slot until the next take.
+        cursor = None if paced else self.ring_cursor
+        seq, image = self.ring.read_latest(self.last_seq, copy=self.frame_copy, cursor=cursor)
+        if image is None:
+            return False
+        meta = self._read_ring_meta(seq)
+        if paced:
+            # The hub paces the stream for its fastest subscriber.
+            stream_decimate_every_n = int(self.ring.header['decimate_every_n'])
+            if not self.hub_pacer.accept(meta['seq'], meta['capture_time'], stream_decimate_every_n):
+                self.last_seq = seq
+                return False
+            self.ring.mark_consumed(seq, self.ring_cursor)
+            if not self.ring.is_valid(seq):
+                return False  # Overwritten before it was marked.
+        batch_meta = self.ring.read_batch_meta(seq)  # None for a single frame.
+        self._on_consumed()
+        self.last_seq = seq
+        self.last_image = image
+        if batch_meta is not None:
+            self._set_batch_meta(batch_meta)
+            return True
+        self.last_batch_meta = None
+        if self.extra_specs:
+            self.last_extras = self.ring.read_extras(seq, copy=self.frame_copy) or []
+        if self._use_encoding():
+            # Read once per sequence number. Repeated calls reuse the cached bytes.
+            self.last_encoded = self._read_encoded(seq, image)
+        self._set_last_meta(meta)
+        return True
+
+    def _take_from_queue(self, timeout: float):
         try:
-            self.last_image = self.queue.get_nowait()
-            self.do_refresh_ok()
+            if timeout > 0:
+                data = self.queue.get(timeout=timeout)
+            else:
+                data = self.queue.get_nowait()
         except Empty:
-            # self.do_refresh_error()
-            self.do_refresh_error_v2()
+            return False
+        self._on_consumed()
+        self.last_image, meta, self.last_encoded, self.last_extras = data
+        if isinstance(meta, list):
+            self._set_batch_meta(meta)
+        else:
+            self.last_batch_meta = None
+            self._set_last_meta(meta)
+        return True
+
+    def _on_consumed(self):
+        if self.playback_pacing == pb.PLAYBACK_PACING_FAST:
+            self._wake_server()  # It waits for room for the next frame.
+
+    def get_last_image(self, timeout=0.0):
+        """
+        Takes the newest frame, or returns the last one again if nothing new has arrived.
+        With a positive ``timeout`` it waits up to ``timeout`` seconds for a frame not delivered before.
+        ``last_fresh`` tells whether the result is such a frame.
+        """
+
+        self.last_fresh = False
+        deadline = time.time() + timeout
+        taken = False
+        while True:
+            if self.ring is not None:
+                taken = self._take_from_ring() or taken
+            else:
+                taken = self._take_from_queue(deadline - time.time()) or taken
+            if self.last_fresh or time.time() >= deadline:
+                break
+            if self.ring is not None:
+                self._wait_notify(deadline - time.time())
+            self._drain_notify()
+
+        if not taken:
+            self.check_watchdog()
         return self.last_image
 
+    def _take_all_from_ring(self):
+        frames = list()
+        write_seq = self.ring.write_seq
+        if write_seq > self.last_seq:
+            self.ring.mark_consumed(write_seq, self.ring_cursor)  # Before the read, see read_latest().
+        for seq in range(max(self.last_seq + 1, write_seq - self.ring.slot_count + 1), write_seq + 1):
+            meta = self._read_ring_meta(seq)  # Before the image, which tells whether the slot was overwritten since.
+            image = self.ring.read(seq, copy=self.frame_copy)
+            if image is not None:
+                frames.append((seq, image, meta))
+        if not frames:
+            return frames
+        seq, self.last_image, meta = frames[-1]
+        self.ring.mark_consumed(seq, self.ring_cursor)
+        self._on_consumed()
+        self.last_seq = seq
+        self.last_batch_meta = None
+        if self.extra_specs:
+            self.last_extras = self.ring.read_extras(seq, copy=self.frame_copy) or []
+        if self._use_encoding():
+            self.last_encoded = self._read_encoded(seq, self.last_image)
+        self._set_last_meta(meta)
+        return frames
+
+    def _read_encoded(self, seq: int, image: np.ndarray):
+        if self.hub_encoder is None:
+            return self.ring.read_encoded(seq)
+        try:
+            return self.hub_encoder.encode(image, self.frame_format)
+        except Exception as e:
+            print_error(f'StreamVideo._read_encoded() Exception: {e}')
+            return None
+
+    def _take_all_from_queue(self):
+        frames = list()
+        while True:
+            try:
+                data = self.queue.get_nowait()
+            except Empty:
+                break
+            self._on_consumed()
+            self.last_image, meta, self.last_encoded, self.last_extras = data
+            self.last_batch_meta = None
+            self._set_last_meta(meta)
+            frames.append((0, self.last_image, meta))
+        return frames
+
+    def take_frames(self):
+        """
+        Takes every frame published since the last call, oldest first, as ``(slot, image, meta)`` tuples.
+
+        Nothing is copied unless ``frame_copy`` is set. A shared memory image is a view of the ring slot ``slot``,
+        which stays valid while ``ring.is_valid(slot)``. A queued image belongs to the caller and its ``slot`` is 0.
+        Only the frames still in the ring or the queue are returned, so take them at least every
+        ``ring_slots - 1`` (or ``max_queue_size``) frames. Batches are not supported.
+        """
+
+        if self.is_reopen():
+            self.reopen()
+        self._drain_notify()
+        self._check_server_state()
+        assert not self._use_batch()
+        if self.ring is not None:
+            frames = self._take_all_from_ring()
+        else:
+            frames = self._take_all_from_queue()
+        if not frames:
+            self.check_watchdog()
+        return frames
+
+    def keep_alive(self):
+        """
+        Restarts and watches the server of a stream whose frames are not taken through ``on_run()``,
+        e.g. a mosaic tile.
+        """
+
+        if self.is_reopen():
+            self.reopen()
+        self._drain_notify()
+        self.check_watchdog()
+
+    def _drain_notify(self):
+        if self.listener is not None:
+            self.listener.drain()
+
+    def _wait_notify(self, timeout: float):
+        if self.listener is not None and self.listener.alive:
+            self.listener.wait(timeout)
+        else:
+            time.sleep(FRAME_WAIT_POLL_INTERVAL)
+
+    def _create_pipes(self):
+        self.listener, self.waker, kwargs = create_pipes()
+        self.command_count = kwargs['command_count']
+        return kwargs
+
+    def _close_pipes(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        self.waker = None  # The write end is closed once the server is gone. (thread mode)
+        self.command_count = None
+
+    def _use_encoding(self):
+        return self.frame_encoding != enc.FRAME_ENCODING_NONE and not self._use_batch()
+
+    def _use_batch(self):
+        return self.batch_size > 1
+
     def get_empty_image(self, image):
-        return np.zeros((image.shape[0], image.shape[1], image.shape[2]), np.uint8)
+        if self.empty_image is None or self.empty_image.shape != image.shape:
+            self.empty_image = np.zeros(image.shape, np.uint8)
+            self.empty_image.flags.writeable = False
+        return self.empty_image
 
-    def _create_process_impl(self):
-        assert self.queue is None
-        assert self.process is None
+    def _use_shared_memory(self):
+        if self.transport != vs.TRANSPORT_SHM:
+            return False
+        if self.mosaic_name:
+            return False  # The frames go to the mosaic tile.
+        # A zero size takes the size of the crop, which bounds the output even if the crop is clipped.
+        crop_width, crop_height = out.crop_size(self.crop)
+        if not self._get_output_spec().is_fixed_size(crop_width, crop_height):
+            print_out(f'StreamVideo._use_shared_memory() '
+                      f'The frame size is unknown, so the {vs.TRANSPORT_QUEUE} transport is used.')
+            return False
+        if not self._use_batch() and not all(spec.is_fixed_size(crop_width, crop_height)
+                                             for spec in self.extra_specs):
+            print_out(f'StreamVideo._use_shared_memory() '
+                      f'The size of an extra output is unknown, so the {vs.TRANSPORT_QUEUE} transport is used.')
+            return False
+        return True
 
-        kwargs = {
-            'exit_flag': self.exit_flag,
-            'server_state': self.server_state,
-            'refresh_flag': self.refresh_flag,
+    def _get_output_spec(self):
+        return out.OutputSpec(max(self.frame_width, 0), max(self.frame_height, 0), self.frame_format)
+
+    def _calc_slot_bytes(self):
+        """
+        Returns the ring slot size for the current props, and the size of its encoded image.
+        """
+
+        crop_width, crop_height = out.crop_size(self.crop)
+        slot_bytes = self._get_output_spec().calc_bytes(crop_width, crop_height)
+        encoded_bytes = enc.calc_encoded_bytes(slot_bytes, self.frame_encoding)
+        if self._use_batch():
+            slot_bytes *= self.batch_size
+            encoded_bytes = 0
+        else:
+            extra_bytes = [spec.calc_bytes(crop_width, crop_height) for spec in self.extra_specs]
+            slot_bytes = shm.calc_slot_bytes(slot_bytes, extra_bytes)
+        return slot_bytes, encoded_bytes
+
+    def _new_ring(self):
+        slot_bytes, encoded_bytes = self._calc_slot_bytes()
+        ring = shm.SharedFrameRing.create(max(self.ring_slots, shm.MIN_RING_SLOTS), slot_bytes,
+                                          encoded_bytes=encoded_bytes, batch_size=max(self.batch_size, 1))
+        ring.open_cursor(0)
+        print_out(f'StreamVideo._new_ring() name={ring.name},slots={ring.slot_count},'
+                  f'bytes={slot_bytes},encoded_bytes={encoded_bytes}')
+        return ring
+
+    def _create_ring(self):
+        self.ring = self._new_ring()
+        self.ring_cursor = 0
+        self.last_seq = 0
+
+    def _close_ring(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+        self.last_seq = 0
+
+    def _server_kwargs(self):
+        return {
             'video_src': self.video_src,
             'video_index': self.video_index,
             'frame_format': self.frame_format,
@@ -278,16 +976,134 @@ class StreamVideo:
             'container_options': self.container_options,
             'stream_options': self.stream_options,
             'reconnect_sleep': self.reconnect_sleep,
+            'reconnect_max_sleep': self.reconnect_max_sleep,
             'iteration_sleep': self.iteration_sleep,
+            'open_timeout': self.open_timeout,
+            'read_timeout': self.read_timeout,
             'verbose': self.verbose,
             'low_delay': self.low_delay,
+            'decode_mode': self.decode_mode,
+            'max_queue_size': self.max_queue_size,
+            'target_fps': self.target_fps,
+            'decimate_every_n': self.decimate_every_n,
+            'convert_on_consume': self.convert_on_consume,
+            'record_buffer_seconds': self.record_buffer_seconds,
+            'frame_encoding': self.frame_encoding,
+            'frame_encoding_quality': self.frame_encoding_quality,
+            'playback_pacing': self.playback_pacing,
+            'playback_speed': self.playback_speed,
+            'playback_loop': self.playback_loop,
+            'playback_start': self.playback_start,
+            'playback_end': self.playback_end,
+            'keyframe_index_dir': self.keyframe_index_dir,
+            'batch_size': self.batch_size,
+            'batch_timeout': self.batch_timeout,
+            'output_specs': self.output_specs,
+            'frame_crop': self.frame_crop,
+            'motion_gate': self.motion_gate,
+            'motion_threshold': self.motion_threshold,
+            'motion_keepalive': self.motion_keepalive,
+            'capture_clock': self.capture_clock,
+            'mosaic_name': self.mosaic_name,
+            'mosaic_tile': self.mosaic_tile,
+            'decoder_threads': self.decoder_threads,
+            'decoder_thread_type': self.decoder_thread_type,
+            'cpu_affinity': self.cpu_affinity,
+            'nice': self.nice,
+        }
+
+    def _get_stream_key(self):
+        if self.stream_key:
+            return self.stream_key
+        # Lambdas with the same source and output geometry share one decoder in the hub.
+        return hub.stream_fingerprint(self._server_kwargs())
+
+    def _attach_hub_impl(self):
+        assert self.hub is None
+        assert self.ring is None
+
+        self.hub = hub.StreamVideoHubClient(self.hub_address)
+        if not self.hub.connect():
+            print_error(f'StreamVideo._attach_hub_impl() Cannot connect to the hub: {self.hub_address}')
+            return False
+
+        self.ring = self.hub.attach(self._get_stream_key(), self._server_kwargs(), self.ring_slots)
+        self.ring_cursor = self.hub.cursor
+        self.last_seq = 0
+        if not self._use_batch():
+            self.hub_pacer = hub.SubscriberPacer(self.target_fps, self.decimate_every_n)
+        if self._use_encoding() and self.hub.encoding != (self.frame_encoding, self.frame_encoding_quality):
+            # The ring holds the encoding of the lambda that created the stream.
+            self.hub_encoder = enc.FrameEncoder(self.frame_encoding, self.frame_encoding_quality)
+
+        # The flags live in the ring header, because the hub is not our child process.
+        self.server_state = shm.RingHeaderValue(self.ring, 'server_state')
+        self.refresh_flag = shm.RingHeaderValue(self.ring, 'refresh_flag', bool)
+        self.heartbeat = shm.RingHeaderValue(self.ring, 'heartbeat', float)
+        self.pid = self.hub.hub_pid
+
+        listener, writer = nt.NotifyListener.create()
+        try:
+            self.hub.add_listener(writer)
+            self.listener = listener
+        except (OSError, hub.HubAttachError) as e:
+            print_error(f'StreamVideo._attach_hub_impl() No frame notifications, the ring is polled: {e}')
+            listener.close()
+        finally:
+            writer.close()
+        print_out(f'StreamVideo._attach_hub_impl() key={self.hub.key},hub={self.pid}')
+        return True
+
+    def _detach_hub(self):
+        if self.hub is not None:
+            self.hub.detach(self.exit_timeout_seconds)
+            self.hub.close()
+            self.hub = None
+        self.hub_pacer = None
+        self.hub_encoder = None
+        self.ring = None
+        self._close_pipes()
+        self.last_seq = 0
+        self.pid = UNKNOWN_PID
+        self.server_state = nt.StatusWord(c_int, vs.SERVER_STATE_DONE)
+        self.refresh_flag = nt.StatusWord(c_bool, False)
+        self.heartbeat = nt.StatusWord(c_double, 0.0)
+        print_out(f'StreamVideo._detach_hub() Done.')
+
+    def _create_process_impl(self):
+        assert self.queue is None
+        assert self.ring is None
+        assert self.process is None
+
+        if self._use_shared_memory():
+            self._create_ring()
+
+        kwargs = {
+            'exit_flag': self.exit_flag,
+            'server_state': self.server_state,
+            'refresh_flag': self.refresh_flag,
+            'heartbeat': self.heartbeat,
+            'pool_counters': self.pool_counters,
+            'stats': self.shared_stats,
         }
+        kwargs.update(self._create_pipes())
+        kwargs.update(self._server_kwargs())
+
+        self.command_queue = Queue()
+        kwargs['command_queue'] = self.command_queue
+
+        if self.ring is not None:
+            kwargs['transport'] = vs.TRANSPORT_SHM
+            kwargs['ring_name'] = self.ring.name
+        else:
+            kwargs['transport'] = vs.TRANSPORT_QUEUE
+            self.queue = Queue(self.max_queue_size)
 
-        self.queue = Queue(self.max_queue_size)
         self.process = Process(target=vs.start_app, args=(self.queue,), kwargs=kwargs)
 
         self._set_server_state(vs.SERVER_STATE_OPENING)
         self.process.start()
+        close_server_ends(kwargs)
 
         if self.process.is_alive():
             self.pid = self.process.pid
@@ -298,8 +1114,68 @@ class StreamVideo:
             print_error(f'StreamVideo._create_process_impl() Server process is not alive.')
             return False
 
+    def _use_thread(self):
+        return self.worker_mode == vs.WORKER_MODE_THREAD and self.server_mode == vs.SERVER_MODE_PROCESS
+
+    def _create_thread_impl(self):
+        assert self.queue is None
+        assert self.ring is None
+        assert self.process is None
+
+        # New flags every time, since a stuck thread of the previous server may still hold the old ones.
+        self.exit_flag = th.ThreadValue(False)
+        self.server_state = th.ThreadValue(vs.SERVER_STATE_DONE)
+        self.refresh_flag = th.ThreadValue(False)
+        self.heartbeat = th.ThreadValue(0.0)
+
+        kwargs = {
+            'exit_flag': self.exit_flag,
+            'server_state': self.server_state,
+            'refresh_flag': self.refresh_flag,
+            'heartbeat': self.heartbeat,
+            'pool_counters': self.pool_counters,
+            'stats': self.shared_stats,
+        }
+        # The server ends are left to the thread, which may outlive the lambda's close.
+        kwargs.update(self._create_pipes())
+        kwargs.update(self._server_kwargs())
+
+        self.command_queue = th.new_command_queue()
+        kwargs['command_queue'] = self.command_queue
+        kwargs['transport'] = vs.TRANSPORT_QUEUE
+        kwargs['recycle_buffers'] = False
+        self.queue = th.FrameSlot(self.max_queue_size)
+
+        self.process = th.ServerThread(vs.start_app, args=(self.queue,), kwargs=kwargs)
+        self._set_server_state(vs.SERVER_STATE_OPENING)
+        self.process.start()
+        self.pid = self.process.pid
+        print_out(f'StreamVideo._create_thread_impl() Server thread in PID: {self.pid}')
+        return True
+
+    def _close_thread_impl(self):
+        self._set_exit_flag(True)
+        if self.process is not None:
+            self.process.join(timeout=self.exit_timeout_seconds)
+            if self.process.is_alive():
+                print_error(f'StreamVideo._close_thread_impl() The server thread did not exit in '
+                            f'{self.exit_timeout_seconds}s and is left behind.')
+        self.queue = None
+        self.command_queue = None
+        self._close_pipes()
+        self.process = None
+        self.pid = UNKNOWN_PID
+        self.server_state = th.ThreadValue(vs.SERVER_STATE_DONE)
+        print_out(f'StreamVideo._close_thread_impl() Done.')
+
     def _create_process(self):
+        self.watchdog = wd.StallWatchdog(self.stall_seconds, self.reconnect_seconds, self.respawn_seconds)
+        self.watchdog.reset(time.monotonic())
         try:
+            if self.server_mode == vs.SERVER_MODE_HUB:
+                return self._attach_hub_impl()
+            if self._use_thread():
+                return self._create_thread_impl()
             return self._create_process_impl()
         except Exception as e:
             print_error(f'StreamVideo._create_process() Exception: {e}')
@@ -332,6 +1208,14 @@ class StreamVideo:
             self.queue.cancel_join_thread()
             self.queue = None
 
+        if self.command_queue is not None:
+            self.command_queue.close()
+            self.command_queue.cancel_join_thread()
+            self.command_queue = None
+
+        self._close_ring()
+        self._close_pipes()
+
         if self.process is not None:
             if self.process.is_alive():
                 self.process.terminate()
@@ -347,27 +1231,175 @@ class StreamVideo:
         self._set_refresh_flag(False)
 
         assert self.queue is None
+        assert self.ring is None
         assert self.process is None
         assert self.pid is UNKNOWN_PID
         print_out(f'StreamVideo._close_process_impl() Done.')
 
     def _close_process(self):
+        self._cancel_standby()
+        self._join_reapers()
+
+        if self.hub is not None:
+            self._detach_hub()
+            return
+        if self._use_thread():
+            self._close_thread_impl()
+            return
+
         try:
             self._close_process_impl()
         except Exception as e:
             print_error(f'StreamVideo._close_process() Exception: {e}')
         finally:
             self.queue = None
+            self.command_queue = None
+            self._close_ring()
+            self._close_pipes()
             self.process = None
             self.pid = UNKNOWN_PID
 
+    def _spawn_standby(self):
+        assert self.standby is None
+
+        standby = ServerChannels.create()
+        kwargs = {
+            'exit_flag': standby.exit_flag,
+            'server_state': standby.server_state,
+            'refresh_flag': standby.refresh_flag,
+            'heartbeat': standby.heartbeat,
+            'pool_counters': self.pool_counters,
+            'stats': self.shared_stats,
+            'command_queue': standby.command_queue,
+        }
+        standby.listener, standby.waker, pipe_kwargs = create_pipes()
+        standby.command_count = pipe_kwargs['command_count']
+        kwargs.update(pipe_kwargs)
+        if self._use_shared_memory():
+            standby.ring = self._new_ring()
+            kwargs['transport'] = vs.TRANSPORT_SHM
+            kwargs['ring_name'] = standby.ring.name
+        else:
+            standby.queue = Queue(self.max_queue_size)
+            kwargs['transport'] = vs.TRANSPORT_QUEUE
+        standby.layout = self._standby_layout()
+
+        recv_conn, standby.conn = Pipe(duplex=False)
+        standby.process = Process(target=vs.start_standby, args=(recv_conn, standby.queue), kwargs=kwargs)
+        standby.process.start()
+        recv_conn.close()
+        close_server_ends(kwargs)
+        self.standby = standby
+        print_out(f'StreamVideo._spawn_standby() Standby process PID: {standby.process.pid}')
+
+    def _start_reaper(self, channels: ServerChannels):
+        self.reapers = [r for r in self.reapers if r.is_alive()]
+        reaper = threading.Thread(target=reap_server, args=(channels, self.exit_timeout_seconds), daemon=True)
+        reaper.start()
+        self.reapers.append(reaper)
+
+    def _cancel_standby(self):
+        if self.standby is not None:
+            reap_server(self.standby, self.exit_timeout_seconds)
+            self.standby = None
+
+    def _standby_layout(self):
+        """
+        Returns the transport and the ring size for the current props, which a standby process must match.
+        """
+
+        if not self._use_shared_memory():
+            return vs.TRANSPORT_QUEUE, self.max_queue_size
+        slot_bytes, encoded_bytes = self._calc_slot_bytes()
+        return vs.TRANSPORT_SHM, max(self.ring_slots, shm.MIN_RING_SLOTS), slot_bytes, encoded_bytes
+
+    def _refresh_standby(self):
+        """
+        Replaces the standby process when the props it was created for have changed,
+        e.g. a larger frame or batch would not fit in its ring.
+        """
+
+        if self.standby is None or self.standby.layout == self._standby_layout():
+            return
+        print_out(f'StreamVideo._refresh_standby() The frame channel has changed, respawn the standby.')
+        self._cancel_standby()
+        if self._use_standby():
+            self._spawn_standby()
+
+    def _join_reapers(self):
+        for reaper in self.reapers:
+            reaper.join(timeout=self.exit_timeout_seconds)
+        self.reapers = list()
+
+    def _take_over_standby(self):
+        """
+        Hands the stream to the standby process and stops the current process in the background.
+        """
+
+        standby = self.standby
+        self.standby = None
+        if standby is None:
+            return False
+        if not standby.process.is_alive():
+            self._start_reaper(standby)
+            return False
+        if standby.layout != self._standby_layout():
+            # Frames that do not fit in its ring would be dropped, so start a new server instead.
+            print_out(f'StreamVideo._take_over_standby() The standby is out of date.')
+            self._start_reaper(standby)
+            return False
+
+        retired = ServerChannels()
+        retired.exit_flag = self.exit_flag
+        retired.server_state = self.server_state
+        retired.refresh_flag = self.refresh_flag
+        retired.heartbeat = self.heartbeat
+        retired.command_queue = self.command_queue
+        retired.queue = self.queue
+        retired.ring = self.ring
+        retired.process = self.process
+        retired.listener = self.listener
+        retired.waker = self.waker
+        self._start_reaper(retired)
+
+        self.exit_flag = standby.exit_flag
+        self.server_state = standby.server_state
+        self.refresh_flag = standby.refresh_flag
+        self.heartbeat = standby.heartbeat
+        self.command_queue = standby.command_queue
+        self.queue = standby.queue
+        self.ring = standby.ring
+        self.ring_cursor = 0
+        self.last_seq = 0
+        self.process = standby.process
+        self.listener = standby.listener
+        self.waker = standby.waker
+        self.command_count = standby.command_count
+        self.pid = self.process.pid
+
+        self._set_server_state(vs.SERVER_STATE_OPENING)
+        standby.conn.send(self._server_kwargs())
+        standby.conn.close()
+
+        self.watchdog = wd.StallWatchdog(self.stall_seconds, self.reconnect_seconds, self.respawn_seconds)
+        self.watchdog.reset(time.monotonic())
+        print_out(f'StreamVideo._take_over_standby() Server process PID: {self.pid}')
+        return True
+
+    def _use_standby(self):
+        return self.warm_standby and self.server_mode == vs.SERVER_MODE_PROCESS and not self._use_thread()
+
     def create_process(self):
         if self._create_process():
+            if self._use_standby():
+                self._spawn_standby()
             return True
         self._close_process()
         return False
 
     def is_reopen(self):
+        if self.server_mode == vs.SERVER_MODE_HUB:
+            return self.hub is None or not self.hub.is_alive()
         if self.process is None:
             return True
         if not self.process.is_alive():
@@ -375,42 +1407,522 @@ class StreamVideo:
         return False
 
     def reopen(self):
+        self._begin_recovery()
+        self.last_meta = None  # The sequence numbers of the new server start over.
+
+        if self._take_over_standby():
+            self._spawn_standby()
+            return
+
         self._close_process()
         if self._create_process():
             print_out(f'Recreated Server process PID: {self.pid}')
+            if self._use_standby():
+                self._spawn_standby()
         else:
             raise CreateProcessError
 
+    def _is_running(self):
+        return self.process is not None or self.hub is not None
+
+    def _can_configure_live(self):
+        if self.hub is not None:
+            # The stream is shared by its source and geometry, and its pace is merged by the hub.
+            return False
+        if self.ring is None:
+            return True  # Queue items carry their own shape.
+        if not self._use_shared_memory():
+            return False
+        slot_bytes, encoded_bytes = self._calc_slot_bytes()
+        return slot_bytes <= self.ring.slot_bytes and encoded_bytes <= self.ring.encoded_bytes
+
+    def _apply_config(self, keys: list):
+        if self._can_configure_live():
+            kwargs = self._server_kwargs()
+            self.send_command(vs.COMMAND_CONFIGURE, {key: kwargs[key] for key in keys})
+            return True
+
+        # The standby was made for the old ring size.
+        print_out(f'StreamVideo._apply_config() Restart the server for {keys}')
+        self._cancel_standby()
+        self.reopen()
+        return False
+
+    def configure(self, **changes):
+        """
+        Changes the ``vs.LIVE_CONFIG_KEYS`` props without restarting the server process.
+
+        The output size, format, crop and motion gate only rebuild the converter of the server,
+        and a new ``video_src`` replaces the current one after its first frame is decoded, without a gap.
+        Frames that do not fit in the shared memory ring, and streams of the hub, restart the server instead.
+        Returns True if the changes were applied live.
+        """
+
+        for key in changes:
+            if key not in vs.LIVE_CONFIG_KEYS:
+                raise ValueError(f'Not configurable while running: {key}')
+        self.config_deferred = True
+        try:
+            for key, value in changes.items():
+                self.on_set(key, str(value))
+        finally:
+            self.config_deferred = False
+        if not self._is_running():
+            return False
+        applied = self._apply_config(list(changes))
+        self._refresh_standby()
+        return applied
+
+    def send_command(self, *command):
+        if self.hub is not None:
+            self.hub.send_command(command)
+        elif self.command_queue is not None:
+            self.command_queue.put_nowait(command)
+            if self.command_count is not None:
+                self.command_count.value += 1  # Only the lambda writes it.
+            self._wake_server()
+        else:
+            raise IllegalStateException
+
+    def record_event(self, path: str, pre_seconds: float, post_seconds: float):
+        """
+        Saves the last ``pre_seconds`` and the next ``post_seconds`` of the stream to ``path``.
+        The packets are remuxed only, so the container format follows the file extension. (e.g. mp4, mkv)
+        """
+
+        self.send_command(vs.COMMAND_RECORD, path, pre_seconds, post_seconds)
+
+    def get_stats(self):
+        """
+        Returns the values of the pipeline stats. (see ``st.stats_to_dict()``)
+        """
+
+        if self.hub is not None:
+            values = np.array(self.hub.get_stats(), dtype=np.float64)
+        else:
+            values = st.read_stats(self.shared_stats)
+        return values + self.consumer_stats.values
+
+    def get_prometheus_text(self):
+        return st.stats_to_prometheus(self.get_stats(), {'stream': self._get_stream_key()})
+
+    def _start_stats_server(self):
+        if self.stats_port <= 0 or self.stats_server is not None:
+            return
+        try:
+            self.stats_server = st.StatsHttpServer(self.stats_port, self.get_prometheus_text)
+            self.stats_server.start()
+        except OSError as e:
+            print_error(f'StreamVideo._start_stats_server() Exception: {e}')
+            self.stats_server = None
+
+    def _stop_stats_server(self):
+        if self.stats_server is not None:
+            self.stats_server.stop()
+            self.stats_server = None
+
     def on_init(self):
+        self._start_stats_server()
         return self.create_process()
 
     def on_valid(self):
         return self.pid != UNKNOWN_PID
 
-    def on_run(self):
-        if self.is_reopen():
-            self.reopen()
-
+    def _check_server_state(self):
         state = self._get_server_state()
         if state == vs.SERVER_STATE_DONE:
             raise IllegalStateException
         elif state == vs.SERVER_STATE_OPENING:
+            self.check_watchdog()  # The open itself can hang.
             raise NotReadyException
         elif state == vs.SERVER_STATE_RUNNING:
             pass  # OK!!
         else:
             raise InaccessibleException
 
-        frame = self.get_last_image()
+    def _read_result(self, timeout: float, fresh_only: bool):
+        # Drained before reading anything, so a frame pushed meanwhile wakes up the next wait.
+        self._drain_notify()
+        self._check_server_state()
+
+        frame = self.get_last_image(timeout)
+        if frame is None and self.last_meta is None:
+            # Running, but nothing published yet, e.g. while the first batch fills up.
+            raise NotReadyException
         if frame is None:
             raise NullDataException
+        if fresh_only and not self.last_fresh:
+            raise UnchangedFrameException
+
+        if self.last_batch_meta is not None:
+            # The last frame of the batch keeps the single frame outputs working.
+            return {
+                'frames': frame,
+                'frames_meta': self.last_batch_meta,
+                'frame': frame[-1],
+                'frame_meta': self.last_meta,
+                'frame_changed': self.last_fresh,
+            }
+
+        # With the motion gate, a repeated frame means that the scene has not changed.
+        result = {'frame': frame, 'frame_meta': self.last_meta, 'frame_changed': self.last_fresh}
+        if self._use_encoding():
+            result['encoded_frame'] = self.last_encoded
+        for i in range(len(self.extra_specs)):
+            result[out.output_key(i)] = self.last_extras[i] if i < len(self.last_extras) else None
+        return result
+
+    def on_run(self):
+        if self.is_reopen():
+            self.reopen()
+        timeout = self.frame_wait_timeout if self.stale_frame_mode == STALE_FRAME_WAIT else 0.0
+        return self._read_result(timeout, self.stale_frame_mode != STALE_FRAME_REPEAT)
 
-        return {'frame': frame}
+    async def next_frame(self, timeout=None):
+        """
+        Waits for a frame not delivered before, and returns it in the result of ``on_run()``.
+
+        The wait is woken up by the notification pipe of the server instead of polling,
+        so one event loop can serve many streams. A reopen runs on the default executor.
+        Raises ``asyncio.TimeoutError`` without a new frame for ``timeout`` seconds.
+        Cancelling the caller only cancels the wait.
+        """
+
+        if self.async_lock is None:
+            self.async_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        async with self.async_lock:
+            while True:
+                if self.is_reopen():
+                    await loop.run_in_executor(None, self.reopen)
+                try:
+                    return self._read_result(0.0, True)
+                except (NotReadyException, NullDataException):
+                    pass
+
+                wait = ASYNC_CHECK_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - loop.time())
+                    if wait <= 0:
+                        raise asyncio.TimeoutError
+                if self.listener is not None and self.listener.alive:
+                    await self.listener.wait_async(wait)
+                else:  # Polls until a reopen, once the server is gone.
+                    await asyncio.sleep(min(wait, FRAME_WAIT_POLL_INTERVAL))
+
+    async def frames(self, timeout=None):
+        """
+        Yields the result of ``next_frame()`` for every new frame.
+        """
+
+        while True:
+            yield await self.next_frame(timeout)
+
+    def __aiter__(self):
+        return self.frames()
 
     def on_destroy(self):
+        self._stop_stats_server()
         self._close_process()
 
 
+class StreamVideoBatch:
+    """
+    Stacks the latest frame of several streams into one ``(N, H, W, C)`` batch.
+
+    The batch is a double buffered shared memory canvas of a single column of tiles. (``ms.SharedMosaic``)
+    Each server converts its frames straight into its row of the canvas being filled,
+    and :meth:`collect` returns a read-only view of it, without a copy.
+    The result stays unchanged until the next :meth:`collect`, which hands the canvas back to the servers.
+    The streams are configured for their rows here, so create them without ``on_init()`` and initialize them after.
+    They need the same fixed frame size, and a format with channels. (``rgb24``, ``bgr24`` or ``gray``)
+    """
+
+    def __init__(self, videos: list, max_wait=vs.DEFAULT_BATCH_TIMEOUT):
+        assert videos
+        self.videos = videos
+        self.max_wait = max_wait
+
+        size = (videos[0].frame_width, videos[0].frame_height, videos[0].frame_format)
+        for i, video in enumerate(videos):
+            if video.pid != UNKNOWN_PID:
+                raise IllegalStateException(f'The stream {i} is already running')
+            if video._use_batch() or video.extra_specs:  # noqa
+                raise IllegalStateException(f'The stream {i} has batches or extra outputs')
+            if (video.frame_width, video.frame_height, video.frame_format) != size:
+                raise IllegalStateException(f'The frame size of stream {i} differs: '
+                                            f'{(video.frame_width, video.frame_height, video.frame_format)} != {size}')
+        width, height, frame_format = size
+        if width <= 0 or height <= 0:
+            raise IllegalStateException(f'The frame size of a batch must be fixed: {width}x{height}')
+        self.shape = ms.batch_shape(len(videos), width, height, frame_format)
+        self.mosaic = ms.SharedMosaic.create(1, len(videos), width, height, frame_format, buffers=2)
+        print_out(f'StreamVideoBatch() name={self.mosaic.name},shape={self.shape}')
+
+        for i, video in enumerate(videos):
+            if video.server_mode == vs.SERVER_MODE_HUB:
+                # The hub shares a stream between lambdas, but a row belongs to this batch.
+                print_error(f'StreamVideoBatch() The stream {i} is written by its own {vs.SERVER_MODE_PROCESS}.')
+                video.server_mode = vs.SERVER_MODE_PROCESS
+            video.mosaic_name = self.mosaic.name
+            video.mosaic_tile = i
+
+        self.row_versions = np.zeros(len(videos), dtype=np.uint64)  # The frame versions of the last batch.
+
+    def _get_row_versions(self):
+        return self.mosaic.latest_versions()[:len(self.videos)]
+
+    def collect(self):
+        """
+        Waits up to ``max_wait`` seconds for a new frame of every stream,
+        then returns ``(frames, frames_meta)``.
+        A stream without a new frame contributes its last frame, with ``'fresh'`` set to False in its metadata.
+        """
+
+        deadline = time.time() + self.max_wait
+        while True:
+            for video in self.videos:
+                video.keep_alive()
+            fresh = self._get_row_versions() != self.row_versions
+            if fresh.all() or time.time() >= deadline:
+                break
+            listeners = [video.listener for i, video in enumerate(self.videos) if not fresh[i]]
+            if not nt.wait_any(listeners, min(deadline - time.time(), ASYNC_CHECK_INTERVAL)):
+                time.sleep(FRAME_WAIT_POLL_INTERVAL)
+
+        for i, version in enumerate(self._get_row_versions()):
+            if version == 0:
+                raise NotReadyException(f'No frame of stream {i} yet')
+        index, canvas, metas = self.mosaic.swap()
+        batch = canvas.reshape(self.shape)
+        versions = self.mosaic.canvas_tile_headers[index]['version']
+
+        batch_meta = list()
+        for i in range(len(self.videos)):
+            meta = metas[i]
+            meta['stream'] = i
+            meta['fresh'] = bool(versions[i] != self.row_versions[i])
+            batch_meta.append(meta)
+        self.row_versions = versions[:len(self.videos)].copy()
+        return batch, batch_meta
+
+    def close(self):
+        """
+        Removes the shared batch. Destroy the streams first.
+        """
+
+        if self.mosaic is not None:
+            self.mosaic.close()
+            self.mosaic.unlink()
+            self.mosaic = None
+
+
+class StreamVideoSync:
+    """
+    Emits sets of frames of several streams that were captured at about the same time, e.g. for stereo.
+
+    The frames are matched by ``capture_time`` of their metadata (see ``capture_clock``),
+    within ``tolerance`` seconds from the first to the last frame of a set.
+    The window of each stream is its own ring or queue, so the frames are not copied:
+    a shared memory frame stays a view of its ring slot until the server wraps around the ring.
+    ``window`` seconds bound the frames kept for a stream without a match, e.g. while another stream is down.
+    """
+
+    def __init__(self,
+                 videos: list,
+                 tolerance=sy.DEFAULT_SYNC_TOLERANCE,
+                 window=sy.DEFAULT_SYNC_WINDOW,
+                 max_wait=sy.DEFAULT_SYNC_MAX_WAIT):
+        assert videos
+        self.videos = videos
+        self.max_wait = max_wait
+        self.synchronizer = sy.FrameSynchronizer(len(videos), tolerance, window, self._is_valid)
+        self.rings = [None] * len(videos)  # The ring each window refers to.
+        self.last_set = list()
+        self.last_skew = 0.0
+
+    def _is_valid(self, stream: int, token):
+        ring, slot = token
+        if ring is None:
+            return True  # A queued image belongs to us.
+        return ring is self.videos[stream].ring and ring.is_valid(slot)
+
+    def _take(self):
+        for i, video in enumerate(self.videos):
+            try:
+                frames = video.take_frames()
+            except (NotReadyException, NullDataException):
+                continue
+            if video.ring is not self.rings[i]:
+                self.synchronizer.clear(i)  # The slots of a new server start over.
+                self.rings[i] = video.ring
+            for slot, image, meta in frames:
+                self.synchronizer.add(i, meta['capture_time'], image, meta, (video.ring, slot))
+
+    def collect(self):
+        """
+        Waits up to ``max_wait`` seconds for the next set, then returns ``(frames, frames_meta)``.
+        ``frames_meta[i]['offset']`` is the capture time of frame ``i`` minus the mean of the set.
+        Raises ``NotReadyException`` without a set within the tolerance.
+        """
+
+        deadline = time.time() + self.max_wait
+        while True:
+            self._take()
+            final = time.time() >= deadline
+            entries = self.synchronizer.match(final)
+            if entries is not None:
+                break
+            if final:
+                self.synchronizer.stats.incomplete += 1
+                raise NotReadyException('No frame set within the tolerance')
+            listeners = [video.listener for video in self.videos]
+            if not nt.wait_any(listeners, min(deadline - time.time(), ASYNC_CHECK_INTERVAL)):
+                time.sleep(FRAME_WAIT_POLL_INTERVAL)
+
+        times = [entry.capture_time for entry in entries]
+        mean = sum(times) / len(times)
+        self.last_set = entries
+        self.last_skew = max(times) - min(times)
+        frames_meta = list()
+        for i, entry in enumerate(entries):
+            meta = dict(entry.meta)
+            meta['stream'] = i
+            meta['offset'] = entry.capture_time - mean
+            frames_meta.append(meta)
+        return [entry.image for entry in entries], frames_meta
+
+    def is_intact(self):
+        """
+        Whether no frame of the last set has been overwritten in its ring yet.
+        """
+
+        return all(self._is_valid(i, entry.token) for i, entry in enumerate(self.last_set))
+
+    def get_stats(self):
+        stats = self.synchronizer.stats.to_dict()
+        stats['last_skew_seconds'] = self.last_skew
+        return stats
+
+
+class StreamVideoMosaic:
+    """
+    Composes the frames of many streams into the tiles of one canvas, e.g. for a monitoring wall.
+
+    Each server scales its frames to the tile size and copies them straight into its tile of a shared canvas,
+    at the frame rate of its own stream, so the lambda takes one small frame instead of every full frame.
+    The streams are configured for their tiles here, so create them without ``on_init()`` and initialize them after.
+    A tile without a new frame for ``stale_seconds`` is stale, and is dimmed with ``mark_stale``.
+    The canvas is output at most ``max_fps`` times a second (0 outputs every new frame of any tile).
+    Two canvases are used in turn, so the previous result stays valid while the next one is filled.
+    """
+
+    def __init__(self,
+                 videos: list,
+                 columns: int,
+                 tile_width: int,
+                 tile_height: int,
+                 frame_format=vs.DEFAULT_FRAME_FORMAT,
+                 stale_seconds=ms.DEFAULT_TILE_STALE_SECONDS,
+                 mark_stale=True,
+                 max_fps=ms.DEFAULT_MOSAIC_FPS,
+                 max_wait=ms.DEFAULT_MOSAIC_MAX_WAIT):
+        assert videos
+        assert columns >= 1
+        self.videos = videos
+        self.stale_seconds = stale_seconds
+        self.mark_stale = mark_stale
+        self.max_fps = max_fps
+        self.max_wait = max_wait
+        self.last_time = 0.0
+        rows = (len(videos) + columns - 1) // columns
+        self.mosaic = ms.SharedMosaic.create(columns, rows, tile_width, tile_height, frame_format)
+        print_out(f'StreamVideoMosaic() name={self.mosaic.name},tiles={columns}x{rows},'
+                  f'tile={tile_width}x{tile_height},format={frame_format}')
+
+        for i, video in enumerate(videos):
+            if video.pid != UNKNOWN_PID:
+                raise IllegalStateException(f'The stream of tile {i} is already running')
+            if video._use_batch() or video.extra_specs:  # noqa
+                raise IllegalStateException(f'The stream of tile {i} has batches or extra outputs')
+            if video.server_mode == vs.SERVER_MODE_HUB:
+                # The hub shares a stream between lambdas, but a tile belongs to this mosaic.
+                print_error(f'StreamVideoMosaic() The tile {i} is written by its own {vs.SERVER_MODE_PROCESS}.')
+                video.server_mode = vs.SERVER_MODE_PROCESS
+            video.frame_width = tile_width
+            video.frame_height = tile_height
+            video.frame_format = frame_format
+            video.mosaic_name = self.mosaic.name
+            video.mosaic_tile = i
+
+        self.canvases = [None, None]
+        self.turn = 0
+        self.tile_seqs = np.zeros(len(videos), dtype=np.uint64)  # The tile sequence numbers of the last canvas.
+
+    def _acquire_canvas(self):
+        canvas = self.canvases[self.turn]
+        if canvas is None:
+            canvas = np.empty(self.mosaic.shape, dtype=np.uint8)
+            self.canvases[self.turn] = canvas
+        self.turn = 1 - self.turn
+        return canvas
+
+    def _get_tile_seqs(self):
+        return self.mosaic.tile_headers['seq'][:len(self.videos)].copy()
+
+    def collect(self):
+        """
+        Waits up to ``max_wait`` seconds for a new frame of any tile, then returns ``(canvas, tiles_meta)``.
+        ``tiles_meta[i]`` is the metadata of the frame in tile ``i``, with ``'fresh'`` if it is new since the last call,
+        ``'stale'`` and its ``'age'`` in seconds.
+        """
+
+        if self.max_fps > 0:
+            delay = self.last_time + 1.0 / self.max_fps - time.time()
+            if delay > 0:
+                time.sleep(delay)  # The tiles keep updating meanwhile.
+        deadline = time.time() + self.max_wait
+        while True:
+            for video in self.videos:
+                video.keep_alive()
+            if (self._get_tile_seqs() != self.tile_seqs).any() or time.time() >= deadline:
+                break
+            listeners = [video.listener for video in self.videos]
+            if not nt.wait_any(listeners, min(deadline - time.time(), ASYNC_CHECK_INTERVAL)):
+                time.sleep(FRAME_WAIT_POLL_INTERVAL)
+
+        seqs = self._get_tile_seqs()
+        canvas = self._acquire_canvas()
+        metas = self.mosaic.read(canvas)
+        out_planes = ms.canvas_planes(canvas, self.mosaic.frame_format)
+        now = time.time()
+        tiles_meta = list()
+        for i in range(len(self.videos)):
+            meta = metas[i]
+            written = meta['timestamp'] > 0
+            meta['tile'] = i
+            meta['fresh'] = bool(seqs[i] != self.tile_seqs[i])
+            meta['age'] = now - meta['timestamp'] if written else None
+            meta['stale'] = not written or meta['age'] > self.stale_seconds
+            if self.mark_stale and meta['stale'] and written:
+                ms.dim_planes(ms.tile_planes(out_planes, self.mosaic.frame_format, self.mosaic.tile_rect(i)))
+            tiles_meta.append(meta)
+        self.tile_seqs = seqs
+        self.last_time = now
+        return canvas, tiles_meta
+
+    def close(self):
+        """
+        Removes the shared canvas. Destroy the streams first.
+        """
+
+        if self.mosaic is not None:
+            self.mosaic.close()
+            self.mosaic.unlink()
+            self.mosaic = None
+
+
 MAIN_HANDLER = StreamVideo()
 
 
@@ -438,6 +1950,14 @@ def on_destroy():
     return MAIN_HANDLER.on_destroy()
 
 
+def record_event(path, pre_seconds, post_seconds):
+    return MAIN_HANDLER.record_event(path, pre_seconds, post_seconds)
+
+
+async def next_frame(timeout=None):
+    return await MAIN_HANDLER.next_frame(timeout)
+
+
 def main():
     parser = argparse.ArgumentParser(description='RealTimeVideo demo')
     parser.add_argument(
@@ -0,0 +1,735 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import importlib.util
+import psutil
+import numpy as np
+
+from multiprocessing.sharedctypes import Value, Synchronized
+from ctypes import c_bool, c_int, c_double
+from multiprocessing import Process, Queue
+
+import av_stream_video_server as vs
+import av_stream_video_sched as sc
+
+from av_stream_video_stats import STATS_OFFSETS, STATS_DECODED_FRAMES
+from av_stream_video_playback import EndOfFileException
+
+LOGGING_PREFIX = '[av.stream_video.bench] '
+LOGGING_SUFFIX = '\n'
+
+DEFAULT_CLIP_WIDTH = 1280
+DEFAULT_CLIP_HEIGHT = 720
+DEFAULT_CLIP_FPS = 30
+DEFAULT_CLIP_SECONDS = 10
+DEFAULT_CLIP_GOP = 30
+DEFAULT_CLIP_CODEC = 'libx264'
+DEFAULT_CLIP_BFRAMES = 2
+
+# Live cameras rarely use B-frames, so the playback clips have none.
+PLAYBACK_PRESETS = {
+    '360p15': {'codec': 'libx264', 'width': 640, 'height': 360, 'fps': 15},
+    '720p30': {'codec': 'libx264', 'width': 1280, 'height': 720, 'fps': 30},
+    '1080p30': {'codec': 'libx264', 'width': 1920, 'height': 1080, 'fps': 30},
+    '720p30-hevc': {'codec': 'libx265', 'width': 1280, 'height': 720, 'fps': 30},
+}
+DEFAULT_PLAYBACK_PRESETS = ['360p15', '720p30']
+DEFAULT_PLAYBACK_SECONDS = 10.0
+DEFAULT_PLAYBACK_WARMUP = 2.0  # Frames buffered while probing the stream arrive in a burst.
+DEFAULT_PLAYBACK_TRANSPORTS = [vs.TRANSPORT_QUEUE, vs.TRANSPORT_SHM]
+MPEGTS_TIME_BASE = 1.0 / 90000
+SENDER_CONNECT_TIMEOUT = 10.0
+SENDER_CONNECT_SLEEP = 0.05
+LATENCY_PERCENTILES = [50, 90, 99]
+DEFAULT_WORKER_SECONDS = 10.0
+WORKER_STARTUP_TIMEOUT = 10.0
+# (worker_mode, transport) pairs. A thread always hands over frames in memory.
+DEFAULT_WORKER_RUNS = [
+    (vs.WORKER_MODE_PROCESS, vs.TRANSPORT_QUEUE),
+    (vs.WORKER_MODE_PROCESS, vs.TRANSPORT_SHM),
+    (vs.WORKER_MODE_THREAD, vs.TRANSPORT_QUEUE),
+]
+DEFAULT_IDLE_STREAMS = 8
+DEFAULT_IDLE_SECONDS = 5.0
+IDLE_SETTLE_SECONDS = 4.0  # Long enough for the files to end, which is the idle case.
+IDLE_CONSUMER_FPS = 10
+# (name, lambda props) of the idle runs.
+IDLE_SCENARIOS = [
+    ('ended', {'playback_loop': False}),
+    ('fast', {'playback_pacing': vs.PLAYBACK_PACING_FAST, 'playback_loop': True, 'max_queue_size': 1}),
+    ('realtime', {'playback_pacing': vs.PLAYBACK_PACING_REALTIME, 'playback_loop': True}),
+]
+DEFAULT_THREAD_STREAMS = 16
+THREAD_SETTLE_SECONDS = 3.0  # The servers start one after another.
+# (name, lambda props) of the decoder thread runs. 'default' is the decoder of the releases before the props.
+THREAD_SCENARIOS = [
+    ('default', {}),
+    ('single', {'decoder_threads': 1}),
+    ('frame2', {'decoder_thread_type': sc.DECODER_THREAD_TYPE_FRAME, 'decoder_threads': 2}),
+    ('slice2', {'decoder_thread_type': sc.DECODER_THREAD_TYPE_SLICE, 'decoder_threads': 2}),
+    ('scheduler', {'cpu_affinity': sc.CPU_AFFINITY_AUTO}),
+]
+LAMBDA_FILE_NAME = 'av_stream_video.app.py'
+
+
+def print_out(message):
+    sys.stdout.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stdout.flush()
+
+
+def print_error(message):
+    sys.stderr.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stderr.flush()
+
+
+def load_lambda():
+    """
+    Imports ``av_stream_video.app.py``, whose file name is not a valid module name.
+    """
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), LAMBDA_FILE_NAME)
+    spec = importlib.util.spec_from_file_location('av_stream_video_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_environment():
+    import av
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'av': av.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def make_test_clip(path: str,
+                   width=DEFAULT_CLIP_WIDTH,
+                   height=DEFAULT_CLIP_HEIGHT,
+                   fps=DEFAULT_CLIP_FPS,
+                   seconds=DEFAULT_CLIP_SECONDS,
+                   gop=DEFAULT_CLIP_GOP,
+                   codec=DEFAULT_CLIP_CODEC,
+                   bframes=DEFAULT_CLIP_BFRAMES):
+    """
+    Encodes a synthetic clip with a moving pattern, so the encoder produces real P/B-frames.
+    Use the ``.ts`` extension for clips that are streamed by :func:`serve_clip`.
+    """
+
+    import av
+    container = av.open(path, 'w')
+    stream = container.add_stream(codec, rate=fps)
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = 'yuv420p'
+    if codec == 'libx265':
+        stream.options = {'x265-params': f'keyint={gop}:min-keyint={gop}:bframes={bframes}:log-level=error'}
+    else:
+        stream.options = {'g': str(gop), 'bf': str(bframes)}
+
+    xs = np.arange(width, dtype=np.uint16)
+    ys = np.arange(height, dtype=np.uint16)[:, np.newaxis]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    for i in range(fps * seconds):
+        image[:, :, 0] = (xs + i * 4) & 0xFF
+        image[:, :, 1] = (ys + i * 2) & 0xFF
+        image[:, :, 2] = (xs ^ ys) + i & 0xFF
+        frame = av.VideoFrame.from_ndarray(image, format='rgb24')
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    for packet in stream.encode():
+        container.mux(packet)
+    container.close()
+    return path
+
+
+def create_server(video_src: str, **kwargs):
+    kwargs['exit_flag'] = Value(c_bool, False)
+    kwargs['server_state'] = Value(c_int, vs.SERVER_STATE_DONE)
+    kwargs['refresh_flag'] = Value(c_bool, False)
+    kwargs['video_src'] = video_src
+    kwargs['transport'] = vs.TRANSPORT_QUEUE
+    return vs.StreamVideoServer(Queue(vs.DEFAULT_MAX_QUEUE_SIZE), **kwargs)
+
+
+def bench_decode(video_src: str, **kwargs):
+    """
+    Decodes the whole source in the calling process and measures its CPU time.
+    ``cpu_percent`` is the share of one core needed to keep up with the stream in real time.
+    """
+
+    server = create_server(video_src, **kwargs)
+    wall_begin = time.time()
+    cpu_begin = time.process_time()
+    if not server.open_video():
+        raise RuntimeError(f'Cannot open {video_src}')
+
+    first_pts = server.last_pts
+    converted = 1
+    try:
+        while True:
+            if server.read_next_frame():
+                converted += 1
+    except (StopIteration, EndOfFileException):  # A file ends, a live source stops.
+        pass
+
+    cpu_seconds = time.process_time() - cpu_begin
+    wall_seconds = time.time() - wall_begin
+    stream = server.container.streams.video[server.video_index]
+    media_seconds = float((server.last_pts - first_pts) * stream.time_base)
+    if stream.duration is not None:
+        media_seconds = max(media_seconds, float(stream.duration * stream.time_base))
+    server.close_video()
+    server.queue.close()
+    server.queue.cancel_join_thread()
+
+    return {
+        'decoded_frames': server.decoded_count,
+        'converted_frames': converted,
+        'media_seconds': media_seconds,
+        'cpu_seconds': cpu_seconds,
+        'wall_seconds': wall_seconds,
+        'cpu_percent': cpu_seconds / media_seconds * 100.0 if media_seconds > 0 else 0.0,
+    }
+
+
+def bench_decode_modes(video_src: str, **kwargs):
+    results = []
+    for decode_mode in vs.DECODE_MODE_LIST:
+        result = bench_decode(video_src, decode_mode=decode_mode, **kwargs)
+        result['decode_mode'] = decode_mode
+        print_out(f'decode_mode={decode_mode},'
+                  f'frames={result["decoded_frames"]},'
+                  f'cpu={result["cpu_seconds"]:.3f}s,'
+                  f'cpu_per_stream={result["cpu_percent"]:.1f}%')
+        results.append(result)
+    return results
+
+
+def bench_worker_mode(video_src: str, worker_mode: str, seconds=DEFAULT_WORKER_SECONDS, **kwargs):
+    """
+    Plays a file in real time through a lambda with ``worker_mode``.
+
+    ``startup_seconds`` is the time from creating the lambda to its first frame.
+    ``cpu_percent`` adds the CPU time of the lambda process and of its server process, if there is one,
+    and ``rss_mb`` their memory on top of the lambda process before the start.
+    """
+
+    module = load_lambda()
+    this = psutil.Process()
+    rss_begin = this.memory_info().rss
+    cpu_begin = this.cpu_times()
+    begin = time.perf_counter()
+    video = module.StreamVideo(video_src=video_src,
+                               worker_mode=worker_mode,
+                               playback_pacing=vs.PLAYBACK_PACING_REALTIME,
+                               playback_loop=True,
+                               stale_frame_mode=module.STALE_FRAME_WAIT,
+                               **kwargs)
+    video.on_init()
+
+    startup_seconds = None
+    frames = 0
+    end_time = begin + WORKER_STARTUP_TIMEOUT
+    while time.perf_counter() < end_time:
+        try:
+            video.on_run()
+        except (module.NotReadyException, module.NullDataException):
+            continue
+        if startup_seconds is None:
+            startup_seconds = time.perf_counter() - begin
+            end_time = time.perf_counter() + seconds
+        frames += 1
+    wall_seconds = time.perf_counter() - begin
+
+    cpu_end = this.cpu_times()
+    cpu_seconds = cpu_end.user + cpu_end.system - cpu_begin.user - cpu_begin.system
+    rss = this.memory_info().rss - rss_begin
+    if video.pid not in (module.UNKNOWN_PID, os.getpid()) and psutil.pid_exists(video.pid):
+        server = psutil.Process(video.pid)
+        server_cpu = server.cpu_times()
+        cpu_seconds += server_cpu.user + server_cpu.system
+        rss += server.memory_info().rss
+    video.on_destroy()
+
+    return {
+        'worker_mode': worker_mode,
+        'frames': frames,
+        'startup_seconds': startup_seconds,
+        'cpu_seconds': cpu_seconds,
+        'cpu_percent': cpu_seconds / wall_seconds * 100.0 if wall_seconds > 0 else 0.0,
+        'rss_mb': rss / 2 ** 20,
+    }
+
+
+def bench_worker_modes(video_src: str, runs=None, seconds=DEFAULT_WORKER_SECONDS, **kwargs):
+    results = []
+    for worker_mode, transport in runs or DEFAULT_WORKER_RUNS:
+        result = bench_worker_mode(video_src, worker_mode, seconds, transport=transport, **kwargs)
+        result['transport'] = transport
+        print_out(f'worker_mode={worker_mode},'
+                  f'transport={transport},'
+                  f'startup={result["startup_seconds"]}s,'
+                  f'cpu={result["cpu_percent"]:.1f}%,'
+                  f'rss={result["rss_mb"]:.1f}MB')
+        results.append(result)
+    return results
+
+
+def count_wakeups(pid: int):
+    """
+    The context switches of all threads of a process. Each sleep or blocking wait that ends is one.
+    """
+
+    count = 0
+    try:
+        for thread in psutil.Process(pid).threads():
+            with open(f'/proc/{pid}/task/{thread.id}/status') as f:
+                for line in f:
+                    if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+                        count += int(line.split()[1])
+    except (OSError, psutil.Error):
+        pass
+    return count
+
+
+def get_cpu_seconds(pid: int):
+    times = psutil.Process(pid).cpu_times()
+    return times.user + times.system
+
+
+def bench_idle(video_src: str, scenario: str, streams=DEFAULT_IDLE_STREAMS, seconds=DEFAULT_IDLE_SECONDS, **kwargs):
+    """
+    Runs ``streams`` lambdas of a file in the ``scenario`` of ``IDLE_SCENARIOS``,
+    polled ``IDLE_CONSUMER_FPS`` times a second, and measures the CPU usage and the wakeups per second
+    of their server processes and of the lambda process. (Linux only)
+    """
+
+    module = load_lambda()
+    props = dict(dict(IDLE_SCENARIOS)[scenario])
+    props.update(kwargs)
+    videos = [module.StreamVideo(video_src=video_src, **props) for _ in range(streams)]
+    for video in videos:
+        video.on_init()
+
+    def poll(duration: float):
+        calls = 0
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            for video in videos:
+                try:
+                    video.on_run()
+                    calls += 1
+                except (module.NotReadyException, module.NullDataException):
+                    pass
+            time.sleep(1.0 / IDLE_CONSUMER_FPS)
+        return calls
+
+    poll(IDLE_SETTLE_SECONDS)
+    pids = [video.pid for video in videos]
+    this = os.getpid()
+    server_cpu = sum(get_cpu_seconds(pid) for pid in pids)
+    server_wakeups = sum(count_wakeups(pid) for pid in pids)
+    lambda_cpu = get_cpu_seconds(this)
+    lambda_wakeups = count_wakeups(this)
+    begin = time.monotonic()
+    calls = poll(seconds)
+    wall_seconds = time.monotonic() - begin
+    server_cpu = sum(get_cpu_seconds(pid) for pid in pids) - server_cpu
+    server_wakeups = sum(count_wakeups(pid) for pid in pids) - server_wakeups
+    lambda_cpu = get_cpu_seconds(this) - lambda_cpu
+    lambda_wakeups = count_wakeups(this) - lambda_wakeups
+    for video in videos:
+        video.on_destroy()
+
+    return {
+        'scenario': scenario,
+        'streams': streams,
+        'server_cpu_percent': server_cpu / wall_seconds * 100.0,
+        'server_wakeups_per_second': server_wakeups / wall_seconds,
+        'lambda_cpu_percent': lambda_cpu / wall_seconds * 100.0,
+        'lambda_wakeups_per_second': lambda_wakeups / wall_seconds,
+        'calls_per_second': calls / wall_seconds,
+    }
+
+
+def bench_idle_suite(video_src: str, streams=DEFAULT_IDLE_STREAMS, seconds=DEFAULT_IDLE_SECONDS, **kwargs):
+    results = []
+    for scenario, _ in IDLE_SCENARIOS:
+        result = bench_idle(video_src, scenario, streams, seconds, **kwargs)
+        print_out(f'idle={scenario},'
+                  f'streams={streams},'
+                  f'server_cpu={result["server_cpu_percent"]:.1f}%,'
+                  f'server_wakeups={result["server_wakeups_per_second"]:.0f}/s,'
+                  f'lambda_cpu={result["lambda_cpu_percent"]:.1f}%,'
+                  f'lambda_wakeups={result["lambda_wakeups_per_second"]:.0f}/s')
+        results.append(result)
+    return results
+
+
+def bench_threads(video_src: str, scenario: str, streams=DEFAULT_THREAD_STREAMS, seconds=DEFAULT_IDLE_SECONDS, **kwargs):
+    """
+    Decodes a file in a loop as fast as possible on ``streams`` lambdas with the decoder props of
+    the ``scenario`` of ``THREAD_SCENARIOS``, and measures the aggregate throughput,
+    the threads and the context switches of their server processes. (Linux only)
+    """
+
+    module = load_lambda()
+    props = {
+        'playback_pacing': vs.PLAYBACK_PACING_NONE,
+        'playback_loop': True,
+        'iteration_sleep': 0.0,
+    }
+    props.update(dict(THREAD_SCENARIOS)[scenario])
+    props.update(kwargs)
+    videos = [module.StreamVideo(video_src=video_src, **props) for _ in range(streams)]
+    for video in videos:
+        video.on_init()
+    time.sleep(THREAD_SETTLE_SECONDS)
+
+    def decoded_frames():
+        return sum(float(video.get_stats()[STATS_OFFSETS[STATS_DECODED_FRAMES]]) for video in videos)
+
+    pids = [video.pid for video in videos]
+    threads = sum(psutil.Process(pid).num_threads() for pid in pids if psutil.pid_exists(pid))
+    frames = decoded_frames()
+    server_cpu = sum(get_cpu_seconds(pid) for pid in pids)
+    server_wakeups = sum(count_wakeups(pid) for pid in pids)
+    begin = time.monotonic()
+    time.sleep(seconds)
+    wall_seconds = time.monotonic() - begin
+    frames = decoded_frames() - frames
+    server_cpu = sum(get_cpu_seconds(pid) for pid in pids) - server_cpu
+    server_wakeups = sum(count_wakeups(pid) for pid in pids) - server_wakeups
+    for video in videos:
+        video.on_destroy()
+
+    return {
+        'scenario': scenario,
+        'props': dict(THREAD_SCENARIOS)[scenario],
+        'streams': streams,
+        'fps': frames / wall_seconds,
+        'fps_per_stream': frames / wall_seconds / streams,
+        'server_threads': threads,
+        'server_cpu_percent': server_cpu / wall_seconds * 100.0,
+        'server_wakeups_per_second': server_wakeups / wall_seconds,
+        'frames_per_cpu_second': frames / server_cpu if server_cpu > 0 else 0.0,
+    }
+
+
+def bench_threads_suite(video_src: str, streams=DEFAULT_THREAD_STREAMS, seconds=DEFAULT_IDLE_SECONDS, **kwargs):
+    results = []
+    for scenario, _ in THREAD_SCENARIOS:
+        result = bench_threads(video_src, scenario, streams, seconds, **kwargs)
+        print_out(f'threads={scenario},'
+                  f'streams={streams},'
+                  f'fps={result["fps"]:.1f},'
+                  f'server_threads={result["server_threads"]},'
+                  f'server_cpu={result["server_cpu_percent"]:.1f}%,'
+                  f'server_wakeups={result["server_wakeups_per_second"]:.0f}/s,'
+                  f'frames_per_cpu_second={result["frames_per_cpu_second"]:.1f}')
+        results.append(result)
+    return results
+
+
+def serve_clip(path: str, url: str, start_time: Synchronized):
+    """
+    A local stand-in for a live camera.
+    Connects to the listening server and sends the packets of an MPEG-TS clip on their dts schedule.
+    ``start_time`` receives the wall-clock time of pts 0.
+    """
+
+    import av
+    source = av.open(path)
+    stream = source.streams.video[0]
+    output = None
+    output_stream = None
+    begin = time.time()
+    while output is None:
+        output = av.open(url, 'w', format='mpegts')
+        output_stream = output.add_stream_from_template(stream)
+        try:
+            output.start_encoding()  # Connects to the server.
+        except (OSError, av.FFmpegError):
+            output = None
+            if time.time() - begin > SENDER_CONNECT_TIMEOUT:
+                print_error(f'serve_clip() Cannot connect to {url}')
+                source.close()
+                return
+            time.sleep(SENDER_CONNECT_SLEEP)
+
+    try:
+        origin = None
+        for packet in source.demux(stream):
+            if packet.dts is None:
+                continue
+            due = float(packet.dts * packet.time_base)
+            if origin is None:
+                origin = time.time() - due
+                with start_time.get_lock():
+                    start_time.value = origin
+            delay = origin + due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            packet.stream = output_stream
+            output.mux(packet)
+    except (OSError, av.FFmpegError) as e:
+        print_out(f'serve_clip() Stopped: {e}')  # The server closed the connection.
+    finally:
+        source.close()
+        try:
+            output.close()
+        except (OSError, av.FFmpegError):
+            pass
+
+
+def calc_percentiles(values: list):
+    if not values:
+        return {f'p{p}': None for p in LATENCY_PERCENTILES}
+    result = np.percentile(np.array(values) * 1000.0, LATENCY_PERCENTILES)
+    return {f'p{p}': float(v) for p, v in zip(LATENCY_PERCENTILES, result)}
+
+
+def bench_playback(clip_path: str, seconds: float, warmup=DEFAULT_PLAYBACK_WARMUP, **kwargs):
+    """
+    Streams a clip in real time through a lambda and measures what the consumer sees.
+
+    ``delivery_ms`` is the time from decoding to ``on_run()``,
+    and ``end_to_end_ms`` the time from sending a frame to ``on_run()``.
+    Frames of the first ``warmup`` seconds are not measured.
+    """
+
+    port = find_free_port()
+    start_time = Value(c_double, 0.0)
+    sender = Process(target=serve_clip, args=(clip_path, f'tcp://127.0.0.1:{port}', start_time))
+    sender.start()
+
+    module = load_lambda()
+    kwargs.setdefault('stale_frame_mode', module.STALE_FRAME_WAIT)
+    video = module.StreamVideo(video_src=f'tcp://127.0.0.1:{port}?listen=1', **kwargs)
+    video.on_init()
+
+    delivery = list()
+    end_to_end = list()
+    server_cpu = None
+    server_rss = 0
+    consumer_rss = 0
+    first_time = None
+    last_time = None
+    warmup_time = None
+    end_time = time.time() + seconds + SENDER_CONNECT_TIMEOUT
+    while time.time() < end_time:
+        try:
+            result = video.on_run()
+        except (module.NotReadyException, module.NullDataException):
+            if warmup_time is not None and not sender.is_alive():
+                break  # The clip has ended.
+            continue
+        now = time.time()
+        meta = result['frame_meta']
+        if meta is None:
+            continue
+        if warmup_time is None:
+            warmup_time = now + warmup
+            end_time = warmup_time + seconds
+        if now < warmup_time:
+            continue
+        if first_time is None:
+            first_time = now
+            server_cpu = psutil.Process(video.pid).cpu_times()
+        last_time = now
+        delivery.append(now - meta['timestamp'])
+        with start_time.get_lock():
+            origin = start_time.value
+        if origin > 0:
+            end_to_end.append(now - origin - meta['pts'] * MPEGTS_TIME_BASE)
+        server_rss = max(server_rss, psutil.Process(video.pid).memory_info().rss)
+        consumer_rss = max(consumer_rss, psutil.Process().memory_info().rss)
+
+    cpu_seconds = 0.0
+    if server_cpu is not None and psutil.pid_exists(video.pid):
+        cpu_times = psutil.Process(video.pid).cpu_times()
+        cpu_seconds = cpu_times.user + cpu_times.system - server_cpu.user - server_cpu.system
+    stats = json.loads(video.on_get('stats'))
+    video.on_destroy()
+    sender.join(timeout=1.0)
+    if sender.is_alive():
+        sender.kill()
+
+    duration = last_time - first_time if first_time is not None and last_time > first_time else 0.0
+    return {
+        'frames': len(delivery),
+        'seconds': duration,
+        'fps': (len(delivery) - 1) / duration if duration > 0 else 0.0,
+        'delivery_ms': calc_percentiles(delivery),
+        'end_to_end_ms': calc_percentiles(end_to_end),
+        'server_cpu_percent': cpu_seconds / duration * 100.0 if duration > 0 else 0.0,
+        'server_rss_mb': server_rss / 2 ** 20,
+        'consumer_rss_mb': consumer_rss / 2 ** 20,
+        'stats': stats,
+    }
+
+
+def bench_playback_suite(tmp_dir: str,
+                         presets=None,
+                         transports=None,
+                         seconds=DEFAULT_PLAYBACK_SECONDS,
+                         warmup=DEFAULT_PLAYBACK_WARMUP,
+                         **kwargs):
+    results = []
+    for preset in presets or DEFAULT_PLAYBACK_PRESETS:
+        clip = PLAYBACK_PRESETS[preset]
+        clip_path = os.path.join(tmp_dir, f'{preset}.ts')
+        try:
+            make_test_clip(clip_path, clip['width'], clip['height'], clip['fps'], int(seconds + warmup) + 2,
+                           gop=clip['fps'], codec=clip['codec'], bframes=0)
+        except Exception as e:
+            print_error(f'bench_playback_suite() Cannot encode {preset}: {e}')
+            results.append({'preset': preset, 'error': str(e)})
+            continue
+
+        for transport in transports or DEFAULT_PLAYBACK_TRANSPORTS:
+            result = bench_playback(clip_path, seconds,
+                                    warmup=warmup,
+                                    frame_width=clip['width'],
+                                    frame_height=clip['height'],
+                                    transport=transport,
+                                    **kwargs)
+            result.update({'preset': preset, 'transport': transport})
+            result.update({k: v for k, v in kwargs.items() if isinstance(v, (int, float, str, bool))})
+            print_out(f'preset={preset},'
+                      f'transport={transport},'
+                      f'fps={result["fps"]:.1f},'
+                      f'delivery_p50={result["delivery_ms"]["p50"]}ms,'
+                      f'cpu={result["server_cpu_percent"]:.1f}%')
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StreamVideoServer benchmark')
+    parser.add_argument(
+        '--src',
+        default='',
+        help='Source video. A synthetic clip is generated if omitted.')
+    parser.add_argument(
+        '--width',
+        type=int,
+        default=DEFAULT_CLIP_WIDTH,
+        help=f'Output frame width (default: {DEFAULT_CLIP_WIDTH})')
+    parser.add_argument(
+        '--height',
+        type=int,
+        default=DEFAULT_CLIP_HEIGHT,
+        help=f'Output frame height (default: {DEFAULT_CLIP_HEIGHT})')
+    parser.add_argument(
+        '--output',
+        default='',
+        help='JSON result file.')
+    parser.add_argument(
+        '--playback',
+        action='store_true',
+        help='Also stream synthetic clips in real time through the lambda.')
+    parser.add_argument(
+        '--presets',
+        default=','.join(DEFAULT_PLAYBACK_PRESETS),
+        help=f'Playback clips: {",".join(PLAYBACK_PRESETS.keys())} (default: {",".join(DEFAULT_PLAYBACK_PRESETS)})')
+    parser.add_argument(
+        '--transports',
+        default=','.join(DEFAULT_PLAYBACK_TRANSPORTS),
+        help=f'Playback transports (default: {",".join(DEFAULT_PLAYBACK_TRANSPORTS)})')
+    parser.add_argument(
+        '--seconds',
+        type=float,
+        default=DEFAULT_PLAYBACK_SECONDS,
+        help=f'Playback seconds per run (default: {DEFAULT_PLAYBACK_SECONDS})')
+    parser.add_argument(
+        '--worker-modes',
+        action='store_true',
+        help='Also compare the process and thread worker modes on the source.')
+    parser.add_argument(
+        '--idle',
+        action='store_true',
+        help=f'Also measure the CPU usage and wakeups of {DEFAULT_IDLE_STREAMS} streams that are idle or paced.')
+    parser.add_argument(
+        '--threads',
+        action='store_true',
+        help='Also compare the decoder thread props and the host scheduler on many streams of the source.')
+    parser.add_argument(
+        '--streams',
+        type=int,
+        default=DEFAULT_THREAD_STREAMS,
+        help=f'Streams of the --threads runs (default: {DEFAULT_THREAD_STREAMS})')
+    parser.add_argument(
+        '--server-mode',
+        default=vs.SERVER_MODE_PROCESS,
+        help=f'server_mode of the playback: {",".join(vs.SERVER_MODE_LIST)} (default: {vs.SERVER_MODE_PROCESS})')
+    parser.add_argument(
+        '--interpolation',
+        default=vs.INTERPOLATION_LIST[1],
+        help=f'frame_interpolation of the playback (default: {vs.INTERPOLATION_LIST[1]})')
+    parser.add_argument(
+        '--max-queue-size',
+        type=int,
+        default=vs.DEFAULT_MAX_QUEUE_SIZE,
+        help=f'max_queue_size of the playback (default: {vs.DEFAULT_MAX_QUEUE_SIZE})')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_src = args.src
+        if not video_src:
+            video_src = make_test_clip(os.path.join(tmp_dir, 'clip.mp4'))
+
+        results = {
+            'environment': get_environment(),
+            'decode_modes': bench_decode_modes(video_src, frame_width=args.width, frame_height=args.height),
+        }
+        if args.worker_modes:
+            results['worker_modes'] = bench_worker_modes(video_src,
+                                                         seconds=args.seconds,
+                                                         frame_width=args.width,
+                                                         frame_height=args.height)
+        if args.idle:
+            results['idle'] = bench_idle_suite(video_src,
+                                               seconds=args.seconds,
+                                               frame_width=args.width,
+                                               frame_height=args.height)
+        if args.threads:
+            results['threads'] = bench_threads_suite(video_src,
+                                                     streams=args.streams,
+                                                     seconds=args.seconds,
+                                                     frame_width=args.width,
+                                                     frame_height=args.height)
+        if args.playback:
+            results['playback'] = bench_playback_suite(tmp_dir,
+                                                       presets=args.presets.split(','),
+                                                       transports=args.transports.split(','),
+                                                       seconds=args.seconds,
+                                                       server_mode=args.server_mode,
+                                                       frame_interpolation=args.interpolation,
+                                                       max_queue_size=args.max_queue_size)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
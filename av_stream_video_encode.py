@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from fractions import Fraction
+
+FRAME_ENCODING_NONE = 'none'
+FRAME_ENCODING_JPEG = 'jpeg'
+FRAME_ENCODING_PNG = 'png'
+FRAME_ENCODING_LIST = [FRAME_ENCODING_NONE, FRAME_ENCODING_JPEG, FRAME_ENCODING_PNG]
+FRAME_ENCODING_MIMES = {
+    FRAME_ENCODING_JPEG: 'image/jpeg',
+    FRAME_ENCODING_PNG: 'image/png',
+}
+
+DEFAULT_ENCODING_QUALITY = 90
+MIN_ENCODING_QUALITY = 1
+MAX_ENCODING_QUALITY = 100
+
+# FFmpeg quantizer scale of the MJPEG encoder. (lower is better)
+MIN_JPEG_QSCALE = 2
+MAX_JPEG_QSCALE = 31
+
+CODEC_NAMES = {
+    FRAME_ENCODING_JPEG: 'mjpeg',
+    FRAME_ENCODING_PNG: 'png',
+}
+CODEC_PIX_FMTS = {
+    FRAME_ENCODING_JPEG: 'yuvj420p',
+    FRAME_ENCODING_PNG: 'rgb24',
+}
+
+
+def quality_to_qscale(quality: int):
+    quality = min(max(quality, MIN_ENCODING_QUALITY), MAX_ENCODING_QUALITY)
+    ratio = (quality - MIN_ENCODING_QUALITY) / (MAX_ENCODING_QUALITY - MIN_ENCODING_QUALITY)
+    return round(MAX_JPEG_QSCALE - ratio * (MAX_JPEG_QSCALE - MIN_JPEG_QSCALE))
+
+
+def calc_encoded_bytes(raw_bytes: int, encoding: str):
+    """
+    The capacity reserved for one encoded frame next to a raw frame of ``raw_bytes``.
+    """
+
+    if encoding == FRAME_ENCODING_JPEG:
+        return raw_bytes // 2
+    if encoding == FRAME_ENCODING_PNG:
+        # Incompressible images grow by the filter bytes, the deflate blocks and the chunks.
+        return raw_bytes + raw_bytes // 64 + 4096
+    return 0
+
+
+class FrameEncoder:
+    """
+    Compresses converted frames into JPEG or PNG images with the FFmpeg image encoders.
+    """
+
+    def __init__(self, encoding: str, quality=DEFAULT_ENCODING_QUALITY):
+        assert encoding in CODEC_NAMES
+        self.encoding = encoding
+        self.quality = quality
+        self.context = None
+        self.size = None
+        self.encoded_count = 0
+
+    @property
+    def mime(self):
+        return FRAME_ENCODING_MIMES[self.encoding]
+
+    def _open(self, width: int, height: int):
+        import av
+        context = av.CodecContext.create(CODEC_NAMES[self.encoding], 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = CODEC_PIX_FMTS[self.encoding]
+        context.time_base = Fraction(1, 1)
+        if self.encoding == FRAME_ENCODING_JPEG:
+            qscale = str(quality_to_qscale(self.quality))
+            context.options = {'qmin': qscale, 'qmax': qscale}
+        context.open()
+        self.context = context
+        self.size = (width, height)
+
+    def encode(self, image: np.ndarray, frame_format: str):
+        """
+        Returns the encoded bytes of ``image``, whose pixel layout is ``frame_format``.
+        """
+
+        import av
+        frame = av.VideoFrame.from_ndarray(image, format=frame_format)
+        if self.size != (frame.width, frame.height):
+            self._open(frame.width, frame.height)
+
+        pix_fmt = CODEC_PIX_FMTS[self.encoding]
+        if frame.format.name != pix_fmt:
+            frame = frame.reformat(format=pix_fmt)
+        packets = self.context.encode(frame)
+        self.encoded_count += 1
+        return b''.join(bytes(packet) for packet in packets)
+
+    def close(self):
+        self.context = None
+        self.size = None
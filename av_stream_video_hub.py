@@ -0,0 +1,694 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import math
+import stat
+import tempfile
+import threading
+import subprocess
+import psutil
+
+from queue import Queue
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, Connection, deliver_challenge, answer_challenge
+from multiprocessing.reduction import send_handle, recv_handle
+from multiprocessing.sharedctypes import Array, Synchronized, SynchronizedArray
+from ctypes import c_bool, c_double
+
+import av_stream_video_server as vs
+import av_stream_video_shm as shm
+import av_stream_video_encode as enc
+import av_stream_video_watchdog as wd
+import av_stream_video_stats as st
+import av_stream_video_output as out
+import av_stream_video_notify as nt
+
+LOGGING_PREFIX = '[av.stream_video.hub] '
+LOGGING_SUFFIX = '\n'
+
+# A directory of the current user, so other users cannot reach or replace the socket.
+DEFAULT_HUB_DIR = (os.environ.get('XDG_RUNTIME_DIR') or
+                   os.path.join(tempfile.gettempdir(), f'answer-lambda-av-{os.getuid()}'))
+DEFAULT_HUB_ADDRESS = os.path.join(DEFAULT_HUB_DIR, 'answer-lambda-av-hub.sock')
+AUTHKEY_SUFFIX = '.key'  # The authkey file is kept next to the socket.
+AUTHKEY_BYTES = 32
+DEFAULT_IDLE_TIMEOUT_SECONDS = 30.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10.0
+CONNECT_RETRY_SLEEP = 0.1
+IDLE_CHECK_INTERVAL = 1.0
+
+COMMAND_ATTACH = 'attach'
+COMMAND_DETACH = 'detach'
+COMMAND_CONTROL = 'control'
+COMMAND_STATS = 'stats'
+COMMAND_NOTIFY = 'notify'  # Followed by the write end of a notification pipe, passed over the socket.
+RESULT_OK = 'ok'
+RESULT_ERROR = 'error'
+
+# The props that decide the decoded frames and the layout of the ring.
+# Lambdas that agree on them share one decoder, whatever their other props.
+HUB_STREAM_KEYS = [
+    'video_src',
+    'video_index',
+    'options',
+    'container_options',
+    'stream_options',
+    'frame_width',
+    'frame_height',
+    'frame_format',
+    'frame_interpolation',
+    'frame_crop',
+    'output_specs',
+    'batch_size',
+]
+# The props the hub merges over the subscribers of a stream, and applies to its running server.
+HUB_MERGED_KEYS = [
+    'target_fps',
+    'decimate_every_n',
+    'record_buffer_seconds',
+    'motion_gate',
+    'motion_threshold',
+    'motion_keepalive',
+]
+
+
+def print_out(message):
+    sys.stdout.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stdout.flush()
+
+
+def print_error(message):
+    sys.stderr.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stderr.flush()
+
+
+class HubAttachError(Exception):
+    pass
+
+
+def check_owner(path: str, mode_mask: int):
+    """
+    Raises PermissionError unless the current user owns ``path`` and none of the ``mode_mask`` bits are set.
+    """
+
+    status = os.stat(path)
+    if status.st_uid != os.getuid():
+        raise PermissionError(f'Not owned by the current user: {path}')
+    if status.st_mode & mode_mask:
+        raise PermissionError(f'Accessible to other users: {path} ({oct(status.st_mode & 0o777)})')
+
+
+def prepare_address(address: str):
+    """
+    Creates the directory of the socket for the current user only, and checks an existing one.
+    """
+
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.stat(directory).st_mode & stat.S_ISVTX:
+        return  # e.g. /tmp: Other users cannot replace the socket or the key, which are checked themselves.
+    check_owner(directory, 0o022)
+
+
+def load_authkey(address: str):
+    """
+    Returns the key that the hub and its lambdas authenticate each other with, because replies are unpickled.
+    The first one to start creates it next to the socket, readable by the current user only.
+    """
+
+    prepare_address(address)
+    path = address + AUTHKEY_SUFFIX
+    if not os.path.exists(path):
+        # Linked into place complete, so a concurrent reader never sees a partial key.
+        temp_path = f'{path}.{os.getpid()}'
+        with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(os.urandom(AUTHKEY_BYTES))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass  # Another lambda was first.
+        finally:
+            os.unlink(temp_path)
+    check_owner(path, 0o077)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def stream_config(kwargs: dict):
+    """
+    The ``HUB_STREAM_KEYS`` of a server configuration.
+    """
+
+    return {key: kwargs.get(key) for key in HUB_STREAM_KEYS}
+
+
+def stream_fingerprint(kwargs: dict):
+    """
+    Server configurations of the same source and output geometry have identical fingerprints,
+    so the hub decodes them once and fans the frames out to every subscriber.
+    """
+
+    text = json.dumps(stream_config(kwargs), sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def merge_subscriber_kwargs(configs: list):
+    """
+    The ``HUB_MERGED_KEYS`` that serve every subscriber configuration in ``configs``:
+
+    - The frames of the fastest subscriber. Each subscriber drops the frames it does not want. (``SubscriberPacer``)
+    - The longest record buffer.
+    - A motion gate only if all subscribers use the same one, with the lowest threshold and keepalive,
+      so no subscriber loses a frame it would have passed.
+    """
+
+    def values(key, default):
+        return [vs.opt_kwargs(config, key, default) for config in configs]
+
+    target_fps = values('target_fps', 0.0)
+    motion_gates = values('motion_gate', vs.MOTION_GATE_NONE)
+    motion_gate = motion_gates[0] if len(set(motion_gates)) == 1 else vs.MOTION_GATE_NONE
+    return {
+        'target_fps': 0.0 if min(target_fps) <= 0 else max(target_fps),
+        'decimate_every_n': max(reduce_gcd(values('decimate_every_n', 1)), 1),
+        'record_buffer_seconds': max(values('record_buffer_seconds', 0.0)),
+        'motion_gate': motion_gate,
+        'motion_threshold': min(values('motion_threshold', vs.DEFAULT_MOTION_THRESHOLD)),
+        'motion_keepalive': min(values('motion_keepalive', vs.DEFAULT_MOTION_KEEPALIVE)),
+    }
+
+
+def reduce_gcd(numbers: list):
+    result = 0
+    for number in numbers:
+        result = math.gcd(result, number)
+    return result
+
+
+class SubscriberPacer:
+    """
+    Applies the ``target_fps`` and ``decimate_every_n`` of one subscriber to the frames of a shared stream,
+    which the hub paces for its fastest subscriber.
+
+    The frames are decimated by their ``frame_seq``, which counts the frames the server output,
+    each ``decimate_every_n`` of the ring header decoded frames apart,
+    and paced by their ``capture_time``, which follows the pts.
+    """
+
+    def __init__(self, target_fps=0.0, decimate_every_n=1):
+        self.decimate_every_n = decimate_every_n
+        self.time_pacer = vs.FramePacer(target_fps)
+        self.last_frame_seq = None
+
+    def is_enabled(self):
+        return self.decimate_every_n > 1 or self.time_pacer.is_enabled()
+
+    def accept(self, frame_seq: int, capture_time: float, stream_decimate_every_n: int):
+        if self.last_frame_seq is not None and frame_seq < self.last_frame_seq:
+            self.last_frame_seq = None  # The server has restarted.
+            self.time_pacer.reset()
+        if self.decimate_every_n > 1 and self.last_frame_seq is not None:
+            step = max(self.decimate_every_n // max(stream_decimate_every_n, 1), 1)
+            if frame_seq - self.last_frame_seq < step:
+                return False
+        if not self.time_pacer.accept(capture_time):
+            return False
+        self.last_frame_seq = frame_seq
+        return True
+
+
+class HubStream:
+    """
+    A single decoded stream hosted on a thread of the hub process.
+    """
+
+    def __init__(self, key: str, kwargs: dict, ring_slots: int):
+        self.key = key
+        self.config = stream_config(kwargs)
+        self.kwargs = dict(kwargs)  # The props of the first subscriber, and the merged ones of all.
+        self.subscribers = dict()  # connection id -> ring cursor
+        self.subscriber_kwargs = dict()  # connection id -> server kwargs of the subscriber
+        self.merged = merge_subscriber_kwargs([kwargs])
+        self.kwargs.update(self.merged)
+        # The ring is sized for the encoding of the first subscriber. The others encode on their own.
+        self.encoding = (vs.opt_kwargs(kwargs, 'frame_encoding', enc.FRAME_ENCODING_NONE),
+                         vs.opt_kwargs(kwargs, 'frame_encoding_quality', enc.DEFAULT_ENCODING_QUALITY))
+        self.notifier = nt.Notifier()
+        self.notify_conns = dict()  # connection id -> write end of the notification pipe
+
+        frame_width = max(vs.opt_kwargs(kwargs, 'frame_width', 0), 0)
+        frame_height = max(vs.opt_kwargs(kwargs, 'frame_height', 0), 0)
+        frame_format = vs.opt_kwargs(kwargs, 'frame_format', vs.DEFAULT_FRAME_FORMAT)
+        # A zero size takes the size of the crop.
+        crop_width, crop_height = out.crop_size(out.parse_crop(vs.opt_kwargs(kwargs, 'frame_crop', '')))
+        spec = out.OutputSpec(frame_width, frame_height, frame_format)
+        if not spec.is_fixed_size(crop_width, crop_height):
+            raise HubAttachError('The hub requires a fixed frame_width and frame_height, or frame_crop')
+        slot_bytes = spec.calc_bytes(crop_width, crop_height)
+        frame_encoding = vs.opt_kwargs(kwargs, 'frame_encoding', enc.FRAME_ENCODING_NONE)
+        encoded_bytes = enc.calc_encoded_bytes(slot_bytes, frame_encoding)
+        batch_size = max(vs.opt_kwargs(kwargs, 'batch_size', 1), 1)
+        if batch_size > 1:
+            slot_bytes *= batch_size
+            encoded_bytes = 0  # Batches are not encoded.
+        else:
+            extra_specs = out.parse_output_specs(vs.opt_kwargs(kwargs, 'output_specs', ''))
+            if not all(spec.is_fixed_size(crop_width, crop_height) for spec in extra_specs):
+                raise HubAttachError('The hub requires a fixed size of every extra output')
+            extra_bytes = [spec.calc_bytes(crop_width, crop_height) for spec in extra_specs]
+            slot_bytes = shm.calc_slot_bytes(slot_bytes, extra_bytes)
+        self.ring = shm.SharedFrameRing.create(max(ring_slots, shm.MIN_RING_SLOTS), slot_bytes,
+                                               encoded_bytes=encoded_bytes, batch_size=batch_size)
+        self.ring.header['decimate_every_n'] = self.merged['decimate_every_n']
+        self.exit_flag: Synchronized = nt.StatusWord(c_bool, False)  # noqa
+        wakeup, writer = nt.NotifyListener.create()
+        self.waker = nt.Notifier([writer])  # Wakes up the server for an exit or a command.
+
+        self.command_queue = Queue()
+        self.kwargs['command_queue'] = self.command_queue
+        self.kwargs['frame_notifier'] = self.notifier
+        self.kwargs['wakeup'] = wakeup
+        self.kwargs['exit_flag'] = self.exit_flag
+        self.kwargs['server_state'] = shm.RingHeaderValue(self.ring, 'server_state')
+        self.kwargs['refresh_flag'] = shm.RingHeaderValue(self.ring, 'refresh_flag', bool)
+        self.kwargs['heartbeat'] = shm.RingHeaderValue(self.ring, 'heartbeat', float)
+        self.stats: SynchronizedArray = Array(c_double, st.STATS_SIZE)
+        self.kwargs['stats'] = self.stats
+        self.kwargs['transport'] = vs.TRANSPORT_SHM
+        self.kwargs['ring_name'] = self.ring.name
+
+        self.backoff = wd.Backoff(vs.opt_kwargs(kwargs, 'reconnect_sleep', vs.RECONNECT_SLEEP),
+                                  vs.opt_kwargs(kwargs, 'reconnect_max_sleep', wd.DEFAULT_RECONNECT_MAX_SLEEP))
+        self.thread = threading.Thread(target=self._run, name=f'stream-{key}', daemon=True)
+
+    def _get_exit_flag(self):
+        with self.exit_flag.get_lock():
+            return self.exit_flag.value
+
+    def _run(self):
+        # Restart the server like the lambda respawns a dead server process.
+        while True:
+            begin = time.monotonic()
+            vs.start_app(None, **self.kwargs)
+            if self._get_exit_flag():
+                break
+            if time.monotonic() - begin > self.backoff.max_delay:
+                self.backoff.reset()  # It ran long enough to count as a fresh failure.
+            delay = self.backoff.next_delay()
+            print_error(f'HubStream._run() The server stopped unexpectedly, restart in {delay:.3f}s: {self.key}')
+            time.sleep(delay)
+
+    def _update_merged(self):
+        merged = merge_subscriber_kwargs(list(self.subscriber_kwargs.values()))
+        changes = {key: merged[key] for key in HUB_MERGED_KEYS if merged[key] != self.merged[key]}
+        if not changes:
+            return
+        print_out(f'HubStream._update_merged() {self.key}: {changes}')
+        self.merged = merged
+        self.kwargs.update(merged)  # Also for a restart.
+        self.ring.header['decimate_every_n'] = merged['decimate_every_n']
+        if self.thread.is_alive():
+            self.command_queue.put((vs.COMMAND_CONFIGURE, changes))
+            self.waker.notify()
+
+    def subscribe(self, owner: int, kwargs: dict):
+        if owner in self.subscribers:
+            raise HubAttachError(f'Already subscribed to the stream: {self.key}')
+        used = set(self.subscribers.values())
+        free = [i for i in range(shm.RING_CURSORS) if i not in used]
+        if not free:
+            raise HubAttachError(f'Too many subscribers of the stream: {self.key}')
+        cursor = free[0]
+        self.ring.open_cursor(cursor)
+        self.subscribers[owner] = cursor
+        self.subscriber_kwargs[owner] = dict(kwargs)
+        self._update_merged()
+        return cursor
+
+    def add_listener(self, owner: int, conn: Connection):
+        if owner not in self.subscribers:
+            conn.close()
+            raise HubAttachError(f'Not subscribed to the stream: {self.key}')
+        self.remove_listener(owner)
+        self.notify_conns[owner] = conn
+        self.notifier.add(conn)
+
+    def remove_listener(self, owner: int):
+        conn = self.notify_conns.pop(owner, None)
+        if conn is not None:
+            self.notifier.remove(conn)
+
+    def unsubscribe(self, owner: int):
+        cursor = self.subscribers.pop(owner, None)
+        if cursor is None:
+            return False
+        self.remove_listener(owner)
+        self.ring.close_cursor(cursor)
+        self.subscriber_kwargs.pop(owner, None)
+        if self.subscriber_kwargs:
+            self._update_merged()
+        return True
+
+    def start(self):
+        self.ring.header['server_state'] = vs.SERVER_STATE_OPENING
+        self.thread.start()
+
+    def stop(self, timeout: float):
+        with self.exit_flag.get_lock():
+            self.exit_flag.value = True
+        self.waker.notify()
+        self.thread.join(timeout=timeout)
+        if self.thread.is_alive():
+            # The thread is a daemon and keeps its own mapping of the ring.
+            print_error(f'HubStream.stop() The stream thread did not exit in {timeout}s: {self.key}')
+        self.ring.header['server_state'] = vs.SERVER_STATE_DONE
+        self.ring.close()
+        self.ring.unlink()
+
+
+class StreamVideoHub:
+    """
+    Hosts the streams of every lambda on the host in one process.
+
+    Each stream runs ``StreamVideoServer.run()`` on its own thread;
+    PyAV releases the GIL while demuxing and decoding.
+    Lambdas attach to a stream by key and read its frames from a shared frame ring.
+    A stream is reference counted: it starts with its first subscriber
+    and stops when the last one detaches.
+    """
+
+    def __init__(self, address=DEFAULT_HUB_ADDRESS, idle_timeout=DEFAULT_IDLE_TIMEOUT_SECONDS):
+        self.address = address
+        self.idle_timeout = idle_timeout
+        self.listener: Listener = None  # noqa
+        self.authkey = b''
+        self.lock = threading.Lock()
+        self.streams = dict()
+        self.idle_begin = time.time()
+        self.done = False
+
+    def _remove_stale_address(self):
+        if not os.path.exists(self.address):
+            return
+        check_owner(self.address, 0)
+        try:
+            Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.address)
+            return
+        raise FileExistsError(f'Another hub is serving {self.address}')
+
+    def attach(self, owner: int, key: str, kwargs: dict, ring_slots: int):
+        with self.lock:
+            stream = self.streams.get(key)
+            created = stream is None
+            if created:
+                stream = HubStream(key, kwargs, ring_slots)
+            elif stream.config != stream_config(kwargs):
+                raise HubAttachError(f'The stream key is used by another source or output: {key}')
+            cursor = stream.subscribe(owner, kwargs)
+            if created:
+                self.streams[key] = stream
+                stream.start()
+            count = len(stream.subscribers)
+        print_out(f'StreamVideoHub.attach(key={key},ring={stream.ring.name},subscribers={count})')
+        return stream.ring.name, cursor, stream.encoding
+
+    def detach(self, owner: int, key: str, timeout: float):
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or not stream.unsubscribe(owner):
+                return False
+            count = len(stream.subscribers)
+            if count == 0:
+                del self.streams[key]
+                if not self.streams:
+                    self.idle_begin = time.time()
+        print_out(f'StreamVideoHub.detach(key={key},subscribers={count})')
+        if count == 0:
+            stream.stop(timeout)
+        return True
+
+    def control(self, owner: int, key: str, command: tuple):
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or owner not in stream.subscribers:
+                raise HubAttachError(f'Not subscribed to the stream: {key}')
+            stream.command_queue.put(command)
+            stream.waker.notify()
+        return True
+
+    def add_listener(self, owner: int, key: str, fd: int):
+        conn = Connection(fd, readable=False)
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                conn.close()
+                raise HubAttachError(f'Not subscribed to the stream: {key}')
+            stream.add_listener(owner, conn)
+        return True
+
+    def get_stats(self, owner: int, key: str):
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or owner not in stream.subscribers:
+                raise HubAttachError(f'Not subscribed to the stream: {key}')
+        return st.read_stats(stream.stats).tolist()
+
+    def detach_all(self, owner: int, timeout: float):
+        with self.lock:
+            keys = [k for k, v in self.streams.items() if owner in v.subscribers]
+        for key in keys:
+            self.detach(owner, key, timeout)
+
+    def _handle_command(self, owner: int, command: tuple):
+        name = command[0]
+        if name == COMMAND_ATTACH:
+            key, kwargs, ring_slots = command[1:]
+            ring_name, cursor, encoding = self.attach(owner, key, kwargs, ring_slots)
+            return RESULT_OK, ring_name, cursor, os.getpid(), encoding
+        elif name == COMMAND_DETACH:
+            key, timeout = command[1:]
+            return RESULT_OK, self.detach(owner, key, timeout)
+        elif name == COMMAND_CONTROL:
+            key, control = command[1:]
+            return RESULT_OK, self.control(owner, key, control)
+        elif name == COMMAND_STATS:
+            key = command[1]
+            return RESULT_OK, self.get_stats(owner, key)
+        elif name == COMMAND_NOTIFY:
+            key, fd = command[1:]
+            return RESULT_OK, self.add_listener(owner, key, fd)
+        else:
+            raise ValueError(f'Unknown command: {name}')
+
+    def _authenticate(self, conn: Connection):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+            return True
+        except (AuthenticationError, EOFError, OSError) as e:
+            print_error(f'StreamVideoHub._authenticate() Rejected a connection: {e}')
+            return False
+
+    def _handle_connection(self, conn: Connection):
+        if not self._authenticate(conn):
+            conn.close()
+            return
+
+        owner = id(conn)
+        try:
+            while True:
+                command = conn.recv()
+                try:
+                    if command[0] == COMMAND_NOTIFY:
+                        command = command + (recv_handle(conn),)  # The descriptor follows the command.
+                    result = self._handle_command(owner, command)
+                except Exception as e:
+                    result = RESULT_ERROR, str(e)
+                conn.send(result)
+        except (EOFError, OSError):
+            pass  # The lambda is gone.
+        finally:
+            self.detach_all(owner, vs.DEFAULT_EXIT_TIMEOUT_SECONDS)
+            conn.close()
+
+    def _check_idle(self):
+        while not self.done:
+            time.sleep(IDLE_CHECK_INTERVAL)
+            with self.lock:
+                idle = not self.streams and time.time() - self.idle_begin >= self.idle_timeout
+            if idle and self.idle_timeout > 0:
+                print_out(f'StreamVideoHub._check_idle() No streams for {self.idle_timeout}s')
+                self.done = True
+                self._wake_up()
+
+    def _wake_up(self):
+        # Closing the listener does not interrupt a blocking accept(), so connect to it instead.
+        try:
+            Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass  # The listener closes it before the handshake.
+
+    def serve_forever(self):
+        self.authkey = load_authkey(self.address)
+        self._remove_stale_address()
+        # Authenticated on the thread of the connection, so a client cannot hold up or stop the accept loop.
+        self.listener = Listener(self.address, family='AF_UNIX')
+        os.chmod(self.address, 0o600)
+        print_out(f'StreamVideoHub.serve_forever(address={self.address},pid={os.getpid()})')
+
+        threading.Thread(target=self._check_idle, daemon=True).start()
+        try:
+            while not self.done:
+                try:
+                    conn = self.listener.accept()
+                except OSError:
+                    break
+                if self.done:
+                    conn.close()
+                    break
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.done = True
+            with self.lock:
+                streams = list(self.streams.values())
+                self.streams.clear()
+            for stream in streams:
+                stream.stop(vs.DEFAULT_EXIT_TIMEOUT_SECONDS)
+            self.listener.close()
+            print_out('StreamVideoHub.serve_forever() END.')
+
+
+def spawn_hub(address: str):
+    """
+    Starts a detached hub process that outlives the lambda which spawned it.
+    """
+
+    args = [sys.executable, os.path.abspath(__file__), '--address', address]
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, start_new_session=True)
+    print_out(f'spawn_hub() PID: {process.pid}')
+    return process.pid
+
+
+class StreamVideoHubClient:
+    """
+    The lambda side of a hub connection.
+    """
+
+    def __init__(self, address=DEFAULT_HUB_ADDRESS):
+        self.address = address
+        self.authkey = b''
+        self.conn: Connection = None  # noqa
+        self.key = ''
+        self.cursor = 0
+        self.hub_pid = 0
+        self.encoding = (enc.FRAME_ENCODING_NONE, enc.DEFAULT_ENCODING_QUALITY)  # (frame_encoding, quality) of the ring.
+        self.ring: shm.SharedFrameRing = None  # noqa
+        self.lock = threading.Lock()  # The stats endpoint requests from its own thread.
+
+    def _try_connect(self):
+        try:
+            check_owner(self.address, 0)  # Before anything is unpickled from it.
+            self.conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+
+    def connect(self, spawn=True, timeout=DEFAULT_CONNECT_TIMEOUT_SECONDS):
+        self.authkey = load_authkey(self.address)
+        if self._try_connect():
+            return True
+        if spawn:
+            spawn_hub(self.address)
+        begin = time.time()
+        while time.time() - begin < timeout:
+            if self._try_connect():
+                return True
+            time.sleep(CONNECT_RETRY_SLEEP)
+        return False
+
+    def _request(self, *command):
+        with self.lock:
+            self.conn.send(command)
+            result = self.conn.recv()
+        if result[0] != RESULT_OK:
+            raise HubAttachError(result[1])
+        return result[1:]
+
+    def attach(self, key: str, kwargs: dict, ring_slots: int):
+        ring_name, self.cursor, self.hub_pid, encoding = self._request(COMMAND_ATTACH, key, kwargs, ring_slots)
+        self.encoding = tuple(encoding)
+        self.key = key
+        self.ring = shm.SharedFrameRing.attach(ring_name, track=False)
+        return self.ring
+
+    def send_command(self, command: tuple):
+        self._request(COMMAND_CONTROL, self.key, command)
+
+    def add_listener(self, conn: Connection):
+        """
+        Passes the write end of a notification pipe to the hub, which notifies it for every frame of the stream.
+        """
+
+        with self.lock:
+            self.conn.send((COMMAND_NOTIFY, self.key))
+            send_handle(self.conn, conn.fileno(), self.hub_pid)
+            result = self.conn.recv()
+        if result[0] != RESULT_OK:
+            raise HubAttachError(result[1])
+
+    def get_stats(self):
+        return self._request(COMMAND_STATS, self.key)[0]
+
+    def detach(self, timeout: float):
+        if self.conn is not None and self.key:
+            try:
+                self._request(COMMAND_DETACH, self.key, timeout)
+            except (EOFError, OSError, HubAttachError) as e:
+                print_error(f'StreamVideoHubClient.detach() Exception: {e}')
+        self.key = ''
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def is_alive(self):
+        if self.conn is None or self.conn.closed:
+            return False
+        return psutil.pid_exists(self.hub_pid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StreamVideo hub')
+    parser.add_argument(
+        '--address',
+        default=DEFAULT_HUB_ADDRESS,
+        help=f'Unix socket address (default: {DEFAULT_HUB_ADDRESS})')
+    parser.add_argument(
+        '--idle-timeout',
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT_SECONDS,
+        help=f'Exit after this many seconds without streams. 0 never exits. '
+             f'(default: {DEFAULT_IDLE_TIMEOUT_SECONDS})')
+    args = parser.parse_args()
+
+    hub = StreamVideoHub(args.address, args.idle_timeout)
+    try:
+        hub.serve_forever()
+    except OSError as e:
+        print_error(f'main() Cannot serve {args.address}: {e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from av_stream_video_pool import FRAME_FORMAT_CHANNELS, FRAME_FORMAT_YUV420, FRAME_FORMAT_LIST, frame_shape
+from av_stream_video_shm import FRAME_FORMAT_CODES, FRAME_FORMAT_NAMES, shared_view, align_size
+
+MOSAIC_MAGIC = 0x4D535641  # 'AVSM'
+MOSAIC_VERSION = 2
+MOSAIC_READ_RETRIES = 8  # Copies of a tile that was being written, before it is taken as it is.
+MOSAIC_SWAP_TIMEOUT = 0.1  # The longest wait for the writes into a swapped canvas. (a writer may have died)
+MOSAIC_SWAP_SLEEP = 0.0005
+DEFAULT_MOSAIC_FPS = 30.0
+DEFAULT_MOSAIC_MAX_WAIT = 0.1
+DEFAULT_TILE_STALE_SECONDS = 2.0
+BLACK_CHROMA = 128
+
+MOSAIC_HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('columns', '<u4'),
+    ('rows', '<u4'),
+    ('tile_width', '<u4'),
+    ('tile_height', '<u4'),
+    ('format', '<u4'),
+    ('buffers', '<u4'),  # The number of canvases. 2 for a double buffered mosaic.
+    ('write_canvas', '<u4'),  # The canvas the writers fill. (set by the reader)
+    ('reserved0', '<u4'),
+])
+
+TILE_HEADER_DTYPE = np.dtype([
+    ('seq', '<u8'),  # Odd while the tile is being written.
+    ('frame_seq', '<u8'),
+    ('pts', '<i8'),
+    ('index', '<i8'),
+    ('timestamp', '<f8'),  # The wall-clock time of the decoding. 0 means never written.
+    ('capture_time', '<f8'),
+    ('version', '<u8'),  # Counts the frames of the tile, over all canvases.
+])
+
+
+def calc_canvas_bytes(columns: int, rows: int, tile_width: int, tile_height: int, frame_format: str):
+    return int(np.prod(frame_shape(columns * tile_width, rows * tile_height, frame_format)))
+
+
+def calc_mosaic_size(columns: int, rows: int, tile_width: int, tile_height: int, frame_format: str, buffers=1):
+    canvas_bytes = calc_canvas_bytes(columns, rows, tile_width, tile_height, frame_format)
+    return (align_size(MOSAIC_HEADER_DTYPE.itemsize)
+            + align_size(TILE_HEADER_DTYPE.itemsize * columns * rows) * buffers
+            + align_size(canvas_bytes) * buffers)
+
+
+def canvas_planes(canvas: np.ndarray, frame_format: str):
+    """
+    2-dimensional views of the planes of a canvas, in the order and shape of ``frame_planes()``.
+    """
+
+    if frame_format in FRAME_FORMAT_CHANNELS:
+        return [canvas.reshape(canvas.shape[0], -1)]
+    width = canvas.shape[1]
+    height = canvas.shape[0] * 2 // 3
+    flat = canvas.reshape(-1)
+    luma_size = width * height
+    y = flat[:luma_size].reshape(height, width)
+    if frame_format == 'nv12':
+        return [y, flat[luma_size:luma_size * 3 // 2].reshape(height // 2, width)]  # Interleaved U and V.
+    chroma_size = luma_size // 4
+    return [y,
+            flat[luma_size:luma_size + chroma_size].reshape(height // 2, width // 2),
+            flat[luma_size + chroma_size:luma_size + chroma_size * 2].reshape(height // 2, width // 2)]
+
+
+def batch_shape(count: int, width: int, height: int, frame_format: str):
+    """
+    The shape of a canvas of a single column of ``count`` tiles, viewed as a ``(N, H, W, C)`` batch.
+    Only the formats with channels stack, the planes of a 4:2:0 canvas are one after another.
+    """
+
+    if frame_format not in FRAME_FORMAT_CHANNELS:
+        raise ValueError(f'Unsupported batch format: {frame_format}')
+    return (count,) + frame_shape(width, height, frame_format)
+
+
+def tile_planes(planes: list, frame_format: str, rect: tuple):
+    """
+    Views of the rectangle ``(x, y, width, height)`` in each of the canvas ``planes``.
+    """
+
+    x, y, width, height = rect
+    if frame_format in FRAME_FORMAT_CHANNELS:
+        channels = FRAME_FORMAT_CHANNELS[frame_format]
+        return [planes[0][y:y + height, x * channels:(x + width) * channels]]
+    result = [planes[0][y:y + height, x:x + width]]
+    if frame_format == 'nv12':
+        result.append(planes[1][y // 2:(y + height) // 2, x:x + width])
+    else:
+        for plane in planes[1:]:
+            result.append(plane[y // 2:(y + height) // 2, x // 2:(x + width) // 2])
+    return result
+
+
+def clear_planes(planes: list):
+    """
+    Fills the planes with black.
+    """
+
+    planes[0].fill(0)
+    for plane in planes[1:]:
+        plane.fill(BLACK_CHROMA)
+
+
+def dim_planes(planes: list):
+    """
+    Marks a stale tile: half the brightness, and gray for the YUV formats.
+    """
+
+    np.right_shift(planes[0], 1, out=planes[0])
+    for plane in planes[1:]:
+        plane.fill(BLACK_CHROMA)
+
+
+class SharedMosaic:
+    """
+    A canvas of ``columns`` x ``rows`` tiles in shared memory, each written by the server of one stream.
+
+    Every server scales its frames to the tile size and copies them straight into its tile,
+    so a wall of many cameras is transferred as a single small frame, and no compositing pass is needed.
+    The tiles are written independently, each one guarded by its own sequence number,
+    which is odd while the tile is being written. :meth:`read` copies the canvas and copies a tile again
+    if it was written meanwhile.
+
+    With two ``buffers``, the writers fill one canvas while the reader uses the other without a copy.
+    :meth:`swap` moves the writers to the other canvas and returns the one they filled.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner=False):
+        self.shm = shm
+        self.owner = owner
+
+        self.header = shared_view((), dtype=MOSAIC_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        if int(self.header['magic']) != MOSAIC_MAGIC:
+            raise ValueError(f'Invalid shared mosaic: {shm.name}')
+        self.columns = int(self.header['columns'])
+        self.rows = int(self.header['rows'])
+        self.tile_width = int(self.header['tile_width'])
+        self.tile_height = int(self.header['tile_height'])
+        if int(self.header['version']) != MOSAIC_VERSION:
+            raise ValueError(f'Unsupported shared mosaic version {int(self.header["version"])}: {shm.name}')
+        self.frame_format = FRAME_FORMAT_NAMES[int(self.header['format'])]
+        self.tile_count = self.columns * self.rows
+        self.buffers = int(self.header['buffers'])
+
+        offset = align_size(MOSAIC_HEADER_DTYPE.itemsize)
+        self.canvas_tile_headers = list()
+        for _ in range(self.buffers):
+            self.canvas_tile_headers.append(shared_view((self.tile_count,), dtype=TILE_HEADER_DTYPE,
+                                                        buffer=shm.buf, offset=offset))
+            offset += align_size(TILE_HEADER_DTYPE.itemsize * self.tile_count)
+        self.shape = frame_shape(self.columns * self.tile_width, self.rows * self.tile_height, self.frame_format)
+        self.canvases = list()
+        for _ in range(self.buffers):
+            self.canvases.append(shared_view(self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset))
+            offset += align_size(int(np.prod(self.shape)))
+        self.canvas_tiles = list()
+        for canvas in self.canvases:
+            planes = canvas_planes(canvas, self.frame_format)
+            self.canvas_tiles.append([tile_planes(planes, self.frame_format, self.tile_rect(i))
+                                      for i in range(self.tile_count)])
+        # The first canvas, the only one of a single buffered mosaic.
+        self.tile_headers = self.canvas_tile_headers[0]
+        self.canvas = self.canvases[0]
+        self.planes = canvas_planes(self.canvas, self.frame_format)
+        self.tiles = self.canvas_tiles[0]
+
+    @classmethod
+    def create(cls, columns: int, rows: int, tile_width: int, tile_height: int, frame_format: str, name=None,
+               buffers=1):
+        assert columns >= 1 and rows >= 1
+        assert buffers in (1, 2)
+        assert tile_width >= 1 and tile_height >= 1
+        if frame_format not in FRAME_FORMAT_LIST:
+            raise ValueError(f'Unsupported mosaic format: {frame_format}')
+        if frame_format in FRAME_FORMAT_YUV420 and (tile_width % 2 or tile_height % 2):
+            raise ValueError(f'The tile size of a {frame_format} mosaic must be even: {tile_width}x{tile_height}')
+        size = calc_mosaic_size(columns, rows, tile_width, tile_height, frame_format, buffers)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = shared_view((), dtype=MOSAIC_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        header['version'] = MOSAIC_VERSION
+        header['columns'] = columns
+        header['rows'] = rows
+        header['tile_width'] = tile_width
+        header['tile_height'] = tile_height
+        header['format'] = FRAME_FORMAT_CODES[frame_format]
+        header['buffers'] = buffers
+        header['write_canvas'] = 0
+        header['magic'] = MOSAIC_MAGIC
+        del header
+        mosaic = cls(shm, owner=True)
+        for canvas in mosaic.canvases:
+            clear_planes(canvas_planes(canvas, frame_format))
+        return mosaic
+
+    @classmethod
+    def attach(cls, name: str):
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def tile_rect(self, tile: int):
+        """
+        ``(x, y, width, height)`` of the tile in the canvas, row by row.
+        """
+
+        return (tile % self.columns * self.tile_width,
+                tile // self.columns * self.tile_height,
+                self.tile_width,
+                self.tile_height)
+
+    def _claim_tile(self, tile: int):
+        """
+        Marks the tile of the canvas the writers fill as being written. Returns ``(canvas, seq)``.
+        """
+
+        while True:
+            canvas = int(self.header['write_canvas']) if self.buffers > 1 else 0
+            tile_header = self.canvas_tile_headers[canvas][tile]
+            seq = int(tile_header['seq'])
+            tile_header['seq'] = seq + 1  # Being written.
+            # The reader swaps the canvas before it waits for the writes into the old one.
+            if self.buffers == 1 or int(self.header['write_canvas']) == canvas:
+                return canvas, seq
+            tile_header['seq'] = seq
+
+    def latest_versions(self):
+        """
+        The ``version`` of the latest frame of each tile, in any canvas.
+        """
+
+        versions = self.canvas_tile_headers[0]['version'].copy()
+        for tile_headers in self.canvas_tile_headers[1:]:
+            np.maximum(versions, tile_headers['version'], out=versions)
+        return versions
+
+    def write_tile(self, tile: int, planes: list, frame_seq=0, pts=0, index=0, timestamp=0.0, capture_time=0.0):
+        """
+        Copies the planes of a tile-sized image, in the layout of ``frame_planes()``, into the tile.
+        """
+
+        version = int(max(tile_headers[tile]['version'] for tile_headers in self.canvas_tile_headers)) + 1
+        canvas, seq = self._claim_tile(tile)
+        tile_header = self.canvas_tile_headers[canvas][tile]
+        for src, dst in zip(planes, self.canvas_tiles[canvas][tile]):
+            np.copyto(dst, src)
+        tile_header['frame_seq'] = frame_seq
+        tile_header['pts'] = pts if pts is not None else 0
+        tile_header['index'] = index if index is not None else 0
+        tile_header['timestamp'] = timestamp
+        tile_header['capture_time'] = capture_time
+        tile_header['version'] = version
+        tile_header['seq'] = seq + 2  # Published.
+
+    def read_tile_meta(self, tile: int, canvas=0):
+        tile_header = self.canvas_tile_headers[canvas][tile]
+        return {
+            'seq': int(tile_header['frame_seq']),
+            'pts': int(tile_header['pts']),
+            'index': int(tile_header['index']),
+            'timestamp': float(tile_header['timestamp']),
+            'capture_time': float(tile_header['capture_time']),
+        }
+
+    def read(self, out: np.ndarray):
+        """
+        Copies the canvas into ``out``. A tile written during the copy is copied again on its own.
+        Returns the metadata of each tile, as of its copy.
+        """
+
+        before = self.tile_headers['seq'].copy()
+        np.copyto(out, self.canvas)
+        metas = [self.read_tile_meta(i) for i in range(self.tile_count)]
+        after = self.tile_headers['seq'].copy()
+        out_planes = canvas_planes(out, self.frame_format)
+        for tile in np.flatnonzero((before != after) | (before % 2 == 1)):
+            metas[tile] = self._read_tile(int(tile), tile_planes(out_planes, self.frame_format, self.tile_rect(tile)))
+        return metas
+
+    def _read_tile(self, tile: int, out_planes: list):
+        tile_header = self.tile_headers[tile]
+        meta = None
+        for _ in range(MOSAIC_READ_RETRIES):
+            seq = int(tile_header['seq'])
+            for src, dst in zip(self.tiles[tile], out_planes):
+                np.copyto(dst, src)
+            meta = self.read_tile_meta(tile)
+            if seq % 2 == 0 and int(tile_header['seq']) == seq:
+                break
+        return meta
+
+    def swap(self):
+        """
+        Moves the writers of a double buffered mosaic to the other canvas, and returns ``(index, canvas, metas)``:
+        the index and a read-only view of the canvas they filled, and the metadata of each of its tiles.
+
+        A tile without a frame since the last swap is brought up to date from the other canvas first,
+        so only the tiles of the streams that fell behind are copied.
+        The view stays unchanged until the next swap, when the writers fill it again.
+        """
+
+        assert self.buffers == 2
+        filled = int(self.header['write_canvas'])
+        other = 1 - filled
+        self.header['write_canvas'] = other
+        tile_headers = self.canvas_tile_headers[filled]
+        deadline = time.monotonic() + MOSAIC_SWAP_TIMEOUT
+        while (tile_headers['seq'] % 2 == 1).any() and time.monotonic() < deadline:
+            time.sleep(MOSAIC_SWAP_SLEEP)  # Writes that began before the swap.
+
+        for tile in np.flatnonzero(tile_headers['version'] < self.canvas_tile_headers[other]['version']):
+            self._catch_up_tile(int(tile), other, filled)
+        view = self.canvases[filled].view()
+        view.flags.writeable = False
+        return filled, view, [self.read_tile_meta(i, filled) for i in range(self.tile_count)]
+
+    def _catch_up_tile(self, tile: int, src: int, dst: int):
+        src_header = self.canvas_tile_headers[src][tile]
+        dst_header = self.canvas_tile_headers[dst][tile]
+        for _ in range(MOSAIC_READ_RETRIES):
+            seq = int(src_header['seq'])
+            for src_plane, dst_plane in zip(self.canvas_tiles[src][tile], self.canvas_tiles[dst][tile]):
+                np.copyto(dst_plane, src_plane)
+            header = src_header.copy()
+            if seq % 2 == 0 and int(src_header['seq']) == seq:
+                break
+        for field in ('frame_seq', 'pts', 'index', 'timestamp', 'capture_time', 'version'):
+            dst_header[field] = header[field]
+
+    def close(self):
+        self.header = None
+        self.canvas_tile_headers = []
+        self.tile_headers = None
+        self.canvases = []
+        self.canvas = None
+        self.canvas_tiles = []
+        self.planes = []
+        self.tiles = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views are still exported to the consumer. See SharedFrameRing.close().
+            self.shm._buf = None  # noqa
+            self.shm._mmap = None  # noqa
+
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from av_stream_video_output import SOURCE_LAYOUTS, fit_crop, frame_planes
+
+MOTION_GATE_NONE = 'none'
+MOTION_GATE_DIFF = 'diff'  # The mean absolute difference of the probe pixels.
+MOTION_GATE_BLOCK = 'block'  # The share of probe blocks whose mean has changed.
+MOTION_GATE_LIST = [MOTION_GATE_NONE, MOTION_GATE_DIFF, MOTION_GATE_BLOCK]
+
+DEFAULT_MOTION_THRESHOLD = 1.0  # Percent.
+DEFAULT_MOTION_KEEPALIVE = 10.0  # Seconds.
+MOTION_PROBE_WIDTH = 64
+MOTION_BLOCK_SIZE = 8  # Probe pixels.
+MOTION_BLOCK_DELTA = 6.0  # Luma levels. Below it, a block is considered as noise.
+
+
+class MotionGate:
+    """
+    A cheap change detector on a downscaled luma plane.
+
+    The probe is every n-th pixel of the luma plane (within the crop), about ``MOTION_PROBE_WIDTH`` pixels wide,
+    so a YUV frame is not converted at all. Other formats are scaled to a gray probe first.
+    Each frame is compared with the last frame that passed the gate, so a slow change adds up until it passes.
+    The score is in percent:
+
+    - ``diff``: The mean absolute difference of the probe pixels, relative to the full luma range.
+    - ``block``: The share of blocks of ``MOTION_BLOCK_SIZE`` probe pixels whose mean moved by more than
+      ``MOTION_BLOCK_DELTA``. A small moving object passes the gate regardless of the noise of the whole frame.
+
+    Without a pass for ``keepalive`` seconds, the next frame passes anyway. (``0`` disables it)
+    """
+
+    def __init__(self,
+                 mode=MOTION_GATE_DIFF,
+                 threshold=DEFAULT_MOTION_THRESHOLD,
+                 keepalive=DEFAULT_MOTION_KEEPALIVE,
+                 crop=None):
+        from av.video.reformatter import VideoReformatter
+        assert mode in MOTION_GATE_LIST and mode != MOTION_GATE_NONE
+        assert threshold >= 0
+        assert keepalive >= 0
+        self.mode = mode
+        self.threshold = threshold
+        self.keepalive = keepalive
+        self.crop = crop
+        self.reformatter = VideoReformatter()
+        self.reference = None
+        self.reference_time = 0.0
+        self.last_score = 0.0
+
+    def reset(self):
+        self.reference = None
+
+    def _probe(self, frame):
+        x, y, width, height = 0, 0, frame.width, frame.height
+        if self.crop is not None:
+            x, y, width, height = fit_crop(self.crop, frame.width, frame.height)
+        step = max(width // MOTION_PROBE_WIDTH, 1)
+
+        if SOURCE_LAYOUTS.get(frame.format.name) in ['yuv420p', 'nv12', 'gray']:
+            luma = frame_planes(frame, 'gray')[0][y:y + height:step, x:x + width:step]
+        else:
+            image = self.reformatter.reformat(frame,
+                                              width=max(frame.width // step, 1),
+                                              height=max(frame.height // step, 1),
+                                              format='gray')
+            luma = frame_planes(image, 'gray')[0][y // step:(y + height) // step, x // step:(x + width) // step]
+        return luma.astype(np.int16)
+
+    def _score(self, probe: np.ndarray):
+        rows = probe.shape[0] // MOTION_BLOCK_SIZE * MOTION_BLOCK_SIZE
+        cols = probe.shape[1] // MOTION_BLOCK_SIZE * MOTION_BLOCK_SIZE
+        if self.mode == MOTION_GATE_DIFF or rows == 0 or cols == 0:  # Also when the probe is smaller than a block.
+            return float(np.abs(probe - self.reference).mean()) * 100.0 / 255.0
+        shape = (rows // MOTION_BLOCK_SIZE, MOTION_BLOCK_SIZE, cols // MOTION_BLOCK_SIZE, MOTION_BLOCK_SIZE)
+        delta = (probe[:rows, :cols] - self.reference[:rows, :cols]).reshape(shape).mean(axis=(1, 3))
+        return float((np.abs(delta) > MOTION_BLOCK_DELTA).mean()) * 100.0
+
+    def check(self, frame, now: float):
+        """
+        Returns whether the frame has changed enough to be output.
+        """
+
+        probe = self._probe(frame)
+        if self.reference is None or self.reference.shape != probe.shape:
+            self.last_score = 100.0
+        else:
+            self.last_score = self._score(probe)
+            expired = self.keepalive > 0 and now - self.reference_time >= self.keepalive
+            if self.last_score < self.threshold and not expired:
+                return False
+        self.reference = probe
+        self.reference_time = now
+        return True
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import os
+import select
+import asyncio
+
+from contextlib import nullcontext
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from multiprocessing.sharedctypes import RawValue
+
+NOTIFY_BYTE = b'\x01'
+DRAIN_BYTES = 4096
+NULL_LOCK = nullcontext()
+
+
+class StatusWord:
+    """
+    A word of shared memory with the ``Synchronized`` interface, but without a lock.
+
+    The server flags and state are only ever assigned or read as a whole, never read-modify-written
+    by two processes, and an aligned word is loaded and stored atomically.
+    So a reader never takes a lock, like with ``RingHeaderValue``.
+    """
+
+    def __init__(self, value_type, value):
+        self.word = RawValue(value_type, value)
+
+    @staticmethod
+    def get_lock():
+        return NULL_LOCK
+
+    @property
+    def value(self):
+        return self.word.value
+
+    @value.setter
+    def value(self, value):
+        self.word.value = value
+
+
+class Notifier:
+    """
+    The write side of notification pipes. Writes a byte to the pipe of every listener.
+
+    The server notifies the lambda of each pushed frame and each change of its state,
+    and the lambda wakes up a waiting server for an exit, a refresh or a command.
+    The writes never block: a full pipe already has a wakeup pending, and a broken one has no listener left.
+    """
+
+    def __init__(self, conns=()):
+        self.conns = list(conns)
+
+    def add(self, conn: Connection):
+        self.conns = self.conns + [conn]
+
+    def remove(self, conn: Connection):
+        # The list is replaced instead of changed, so a notify() on another thread keeps the old one.
+        # The connection is not closed here for the same reason. It is closed once it is unreferenced.
+        self.conns = [c for c in self.conns if c is not conn]
+
+    def notify(self):
+        for conn in self.conns:
+            try:
+                os.write(conn.fileno(), NOTIFY_BYTE)
+            except (BlockingIOError, BrokenPipeError):
+                pass
+            except OSError:
+                pass  # Closed by the other side. (thread mode)
+
+
+class NotifyListener:
+    """
+    The read end of a notification pipe, which is readable while a notification is pending.
+    ``select()`` and ``loop.add_reader()`` can wait for it.
+
+    ``alive`` becomes False once every write end is closed, e.g. when the other process is gone.
+    A closed pipe is always readable, so it is not waited for anymore.
+    """
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.alive = True
+
+    @classmethod
+    def create(cls):
+        """
+        Returns the listener and the write end for the ``Notifier`` of the other side.
+        """
+
+        reader, writer = Pipe(duplex=False)
+        os.set_blocking(reader.fileno(), False)
+        os.set_blocking(writer.fileno(), False)
+        return cls(reader), writer
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def drain(self):
+        """
+        Reads the pending notifications. Returns False once every write end is closed.
+        """
+
+        while self.alive:
+            try:
+                data = os.read(self.conn.fileno(), DRAIN_BYTES)
+            except BlockingIOError:
+                break
+            if not data:
+                self.alive = False
+            elif len(data) < DRAIN_BYTES:
+                break
+        return self.alive
+
+    def wait(self, timeout: float):
+        """
+        Waits up to ``timeout`` seconds for a notification. Returns whether one is pending.
+        """
+
+        if not self.alive:
+            return False
+        readable, _, _ = select.select([self.conn], [], [], max(timeout, 0.0))
+        return bool(readable)
+
+    async def wait_async(self, timeout: float):
+        """
+        Waits up to ``timeout`` seconds for a notification without blocking the event loop.
+        Returns whether one is pending. The reader is registered only during the wait,
+        so a cancelled wait leaves nothing behind.
+        """
+
+        if not self.alive:
+            await asyncio.sleep(timeout)
+            return False
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, lambda: future.done() or future.set_result(True))
+        try:
+            return await asyncio.wait_for(future, max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    def close(self):
+        self.conn.close()
+        self.alive = False
+
+
+def wait_any(listeners: list, timeout: float):
+    """
+    Waits up to ``timeout`` seconds for a notification of any of ``listeners``.
+    """
+
+    conns = [listener.conn for listener in listeners if listener is not None and listener.alive]
+    if not conns:
+        return False
+    readable, _, _ = select.select(conns, [], [], max(timeout, 0.0))
+    return bool(readable)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from av_stream_video_pool import (
+    FRAME_FORMAT_CHANNELS,
+    FRAME_FORMAT_YUV420,
+    FRAME_FORMAT_LIST,
+    frame_shape,
+    plane_view,
+)
+
+MAX_OUTPUT_SPECS = 4
+OUTPUT_KEY_PREFIX = 'frame_'
+OUTPUT_SPEC_SEPARATOR = ','
+OUTPUT_SPEC_FIELD_SEPARATOR = ':'
+DEFAULT_OUTPUT_FORMAT = 'bgr24'
+DEFAULT_OUTPUT_INTERPOLATION = 'BILINEAR'
+CROP_SEPARATOR = ','
+
+# The plane layout of decoder formats that can be output or cropped without a conversion.
+SOURCE_LAYOUTS = {
+    'yuv420p': 'yuv420p',
+    'yuvj420p': 'yuv420p',
+    'nv12': 'nv12',
+    'gray': 'gray',
+    'bgr24': 'bgr24',
+    'rgb24': 'rgb24',
+}
+CROP_FALLBACK_FORMAT = 'yuv420p'
+
+
+def output_key(index: int):
+    """
+    The output key of the extra output at ``index``. (``frame_1``, ``frame_2``, ...)
+    """
+
+    return f'{OUTPUT_KEY_PREFIX}{index + 1}'
+
+
+class OutputSpec:
+    """
+    The size, format and interpolation of an output image.
+    A zero width or height keeps that dimension of the decoded frame.
+
+    The text form is ``WIDTHxHEIGHT[:FORMAT[:INTERPOLATION]]``, e.g. ``416x416:rgb24:AREA``.
+    """
+
+    def __init__(self,
+                 width=0,
+                 height=0,
+                 frame_format=DEFAULT_OUTPUT_FORMAT,
+                 interpolation=DEFAULT_OUTPUT_INTERPOLATION):
+        assert width >= 0
+        assert height >= 0
+        if frame_format not in FRAME_FORMAT_LIST:
+            raise ValueError(f'Unsupported output format: {frame_format}')
+        if frame_format in FRAME_FORMAT_YUV420 and (width % 2 or height % 2):
+            raise ValueError(f'The size of a {frame_format} output must be even: {width}x{height}')
+        self.width = width
+        self.height = height
+        self.frame_format = frame_format
+        self.interpolation = interpolation
+
+    def __repr__(self):
+        return f'OutputSpec({self.to_text()})'
+
+    def __eq__(self, other):
+        return isinstance(other, OutputSpec) and self.to_text() == other.to_text()
+
+    def get_size(self, src_width=0, src_height=0):
+        """
+        The output size for a source (or crop) of ``src_width`` x ``src_height``. Zero means unknown.
+        """
+
+        return self.width or src_width, self.height or src_height
+
+    def is_fixed_size(self, src_width=0, src_height=0):
+        width, height = self.get_size(src_width, src_height)
+        return width > 0 and height > 0
+
+    def calc_bytes(self, src_width=0, src_height=0):
+        """
+        The size of the output image, or ``0`` if it depends on the decoded frame.
+        """
+
+        if not self.is_fixed_size(src_width, src_height):
+            return 0
+        size = 1
+        for n in frame_shape(*self.get_size(src_width, src_height), self.frame_format):
+            size *= n
+        return size
+
+    def to_text(self):
+        return OUTPUT_SPEC_FIELD_SEPARATOR.join([f'{self.width}x{self.height}', self.frame_format, self.interpolation])
+
+    @classmethod
+    def parse(cls, text: str):
+        fields = [field.strip() for field in text.strip().split(OUTPUT_SPEC_FIELD_SEPARATOR)]
+        size = fields[0].lower().split('x')
+        if len(size) != 2:
+            raise ValueError(f'Invalid output size: {fields[0]}')
+        width = int(size[0]) if size[0] else 0
+        height = int(size[1]) if size[1] else 0
+        frame_format = fields[1] if len(fields) >= 2 and fields[1] else DEFAULT_OUTPUT_FORMAT
+        interpolation = fields[2].upper() if len(fields) >= 3 and fields[2] else DEFAULT_OUTPUT_INTERPOLATION
+        return cls(width, height, frame_format, interpolation)
+
+
+def parse_output_specs(text: str):
+    """
+    Parses comma-separated output specs. (e.g. ``1920x1080,416x416:rgb24:AREA``)
+    """
+
+    if not text or not text.strip():
+        return []
+    specs = [OutputSpec.parse(item) for item in text.split(OUTPUT_SPEC_SEPARATOR) if item.strip()]
+    if len(specs) > MAX_OUTPUT_SPECS:
+        raise ValueError(f'Too many output specs: {len(specs)} > {MAX_OUTPUT_SPECS}')
+    return specs
+
+
+def parse_crop(text: str):
+    """
+    Parses ``x,y,width,height``. An empty text means no crop.
+    A zero width or height extends the crop to the edge of the frame.
+    """
+
+    if not text or not text.strip():
+        return None
+    values = [int(value) for value in text.split(CROP_SEPARATOR)]
+    if len(values) != 4 or min(values) < 0:
+        raise ValueError(f'Invalid crop rectangle: {text}')
+    return tuple(values)
+
+
+def crop_size(crop):
+    """
+    The size of a crop rectangle, or zero where it depends on the decoded frame.
+    """
+
+    if crop is None:
+        return 0, 0
+    return crop[2], crop[3]
+
+
+def fit_crop(crop: tuple, width: int, height: int):
+    """
+    Clips the crop rectangle to the frame.
+    Offsets and sizes are rounded down to even numbers, so the 4:2:0 chroma planes are cropped exactly.
+    """
+
+    x, y, crop_width, crop_height = crop
+    x = min(x, width) // 2 * 2
+    y = min(y, height) // 2 * 2
+    crop_width = min(crop_width or width, width - x) // 2 * 2
+    crop_height = min(crop_height or height, height - y) // 2 * 2
+    if crop_width <= 0 or crop_height <= 0:
+        raise ValueError(f'The crop rectangle {crop} is outside of the {width}x{height} frame')
+    return x, y, crop_width, crop_height
+
+
+def frame_planes(frame, layout: str):
+    """
+    Views of the planes of ``frame`` in the order of ``layout``, without their line padding.
+    A ``gray`` layout of a YUV frame is its luma plane.
+    """
+
+    width, height = frame.width, frame.height
+    planes = frame.planes
+    if layout in FRAME_FORMAT_CHANNELS:
+        return [plane_view(planes[0], height, width * FRAME_FORMAT_CHANNELS[layout])]
+    if layout == 'nv12':
+        return [plane_view(planes[0], height, width), plane_view(planes[1], height // 2, width)]
+    return [plane_view(planes[0], height, width),
+            plane_view(planes[1], height // 2, width // 2),
+            plane_view(planes[2], height // 2, width // 2)]
+
+
+def crop_planes(planes: list, layout: str, crop: tuple):
+    x, y, width, height = crop
+    if layout in FRAME_FORMAT_CHANNELS:
+        channels = FRAME_FORMAT_CHANNELS[layout]
+        return [planes[0][y:y + height, x * channels:(x + width) * channels]]
+    result = [planes[0][y:y + height, x:x + width]]
+    if layout == 'nv12':
+        result.append(planes[1][y // 2:(y + height) // 2, x:x + width])  # Interleaved U and V.
+    else:
+        for plane in planes[1:]:
+            result.append(plane[y // 2:(y + height) // 2, x // 2:(x + width) // 2])
+    return result
+
+
+class FrameConverter:
+    """
+    Converts each decoded frame for several output specs.
+
+    ``VideoFrame.reformat()`` builds a new scaler context for every frame,
+    so one reformatter is kept per spec and reused while the input size and format stay the same.
+
+    An output in the decoded format and size is not converted at all: its planes are copied as they are,
+    and a ``gray`` output of a YUV frame is its luma plane.
+    The crop rectangle is applied before scaling, so only the cropped pixels are converted.
+    """
+
+    def __init__(self, specs: list, crop=None):
+        from av.video.reformatter import VideoReformatter
+        self.specs = specs
+        self.crop = crop
+        self.reformatters = [VideoReformatter() for _ in specs]
+        self.source_reformatter = VideoReformatter()  # For crops of formats without a known layout.
+        self.cropped = None  # (decoded frame, cropped frame), shared by the specs.
+
+    def _crop_frame(self, frame, crop: tuple):
+        if self.cropped is not None and self.cropped[0] is frame:
+            return self.cropped[1]
+
+        import av
+        source = frame
+        layout = SOURCE_LAYOUTS.get(source.format.name)
+        if layout is None:
+            source = self.source_reformatter.reformat(source, format=CROP_FALLBACK_FORMAT)
+            layout = CROP_FALLBACK_FORMAT
+        cropped = av.VideoFrame(crop[2], crop[3], source.format.name)
+        for src, dst in zip(crop_planes(frame_planes(source, layout), layout, crop), frame_planes(cropped, layout)):
+            np.copyto(dst, src)
+        self.cropped = (frame, cropped)
+        return cropped
+
+    def convert(self, frame, index: int):
+        """
+        Returns ``(planes, width, height)`` of the output ``index``.
+        The planes are views to copy out before the next frame is decoded.
+        """
+
+        spec = self.specs[index]
+        crop = fit_crop(self.crop, frame.width, frame.height) if self.crop is not None else None
+        src_width, src_height = (crop[2], crop[3]) if crop is not None else (frame.width, frame.height)
+        width, height = spec.get_size(src_width, src_height)
+
+        layout = SOURCE_LAYOUTS.get(frame.format.name)
+        if width == src_width and height == src_height and layout is not None:
+            if spec.frame_format == layout or (spec.frame_format == 'gray' and layout in FRAME_FORMAT_YUV420):
+                planes = frame_planes(frame, spec.frame_format)
+                if crop is not None:
+                    planes = crop_planes(planes, spec.frame_format, crop)
+                return planes, width, height
+
+        source = self._crop_frame(frame, crop) if crop is not None else frame
+        image = self.reformatters[index].reformat(source,
+                                                  width=width,
+                                                  height=height,
+                                                  format=spec.frame_format,
+                                                  interpolation=spec.interpolation)
+        return frame_planes(image, spec.frame_format), image.width, image.height
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+
+from bisect import bisect_right
+
+LOGGING_PREFIX = '[av.stream_video.playback] '
+LOGGING_SUFFIX = '\n'
+
+PLAYBACK_PACING_NONE = 'none'  # Decode as fast as the source delivers. (live streams)
+PLAYBACK_PACING_REALTIME = 'realtime'  # Follow the pts, scaled by the playback speed.
+PLAYBACK_PACING_FAST = 'fast'  # As fast as possible, but wait for the consumer instead of dropping.
+PLAYBACK_PACING_LIST = [PLAYBACK_PACING_NONE, PLAYBACK_PACING_REALTIME, PLAYBACK_PACING_FAST]
+
+DEFAULT_PLAYBACK_SPEED = 1.0
+PLAYBACK_CLOCK_JUMP_SECONDS = 1.0
+KEYFRAME_INDEX_VERSION = 1
+KEYFRAME_INDEX_DIR_NAME = 'answer-lambda-av-index'
+
+
+def print_out(message):
+    sys.stdout.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stdout.flush()
+
+
+def print_error(message):
+    sys.stderr.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stderr.flush()
+
+
+def is_file_source(video_src: str):
+    return bool(video_src) and os.path.isfile(video_src)
+
+
+def default_index_dir():
+    return os.path.join(tempfile.gettempdir(), KEYFRAME_INDEX_DIR_NAME)
+
+
+class EndOfFileException(Exception):
+    pass
+
+
+class PlaybackClock:
+    """
+    Paces frames on their presentation time.
+
+    The first frame after a ``reset()`` anchors the clock, so seeking and looping do not need a catch-up.
+    """
+
+    def __init__(self, speed=DEFAULT_PLAYBACK_SPEED):
+        assert speed > 0
+        self.speed = speed
+        self.origin_time = None
+        self.origin_wall = 0.0
+
+    def reset(self):
+        self.origin_time = None
+
+    def get_delay(self, frame_time: float, now: float):
+        """
+        Returns the seconds to wait until the frame is due.
+        """
+
+        if self.origin_time is None:
+            self.origin_time = frame_time
+            self.origin_wall = now
+            return 0.0
+        delay = self.origin_wall + (frame_time - self.origin_time) / self.speed - now
+        if delay < -PLAYBACK_CLOCK_JUMP_SECONDS or delay > PLAYBACK_CLOCK_JUMP_SECONDS / self.speed + 1.0:
+            # A timestamp discontinuity, or the consumer stalled the playback. Start over from this frame.
+            self.origin_time = frame_time
+            self.origin_wall = now
+            return 0.0
+        return max(delay, 0.0)
+
+
+class KeyframeIndex:
+    """
+    The keyframe timestamps of a video stream in a file.
+
+    Building the index demuxes the whole file without decoding.
+    It is cached on disk, keyed by the file path, and rebuilt when the file size or mtime changes.
+    """
+
+    def __init__(self, keyframes: list, time_base_num: int, time_base_den: int):
+        self.keyframes = keyframes  # The pts in the stream time base, in ascending order.
+        self.time_base_num = time_base_num
+        self.time_base_den = time_base_den
+
+    def to_seconds(self, pts: int):
+        return pts * self.time_base_num / self.time_base_den
+
+    def to_pts(self, seconds: float):
+        return int(seconds * self.time_base_den / self.time_base_num)
+
+    def find(self, seconds: float):
+        """
+        Returns the pts of the last keyframe at or before ``seconds``, or None.
+        """
+
+        if not self.keyframes:
+            return None
+        i = bisect_right(self.keyframes, self.to_pts(seconds))
+        return self.keyframes[max(i - 1, 0)]
+
+    @classmethod
+    def build(cls, path: str, video_index=0):
+        import av
+        begin = time.perf_counter()
+        with av.open(path) as container:
+            stream = container.streams.video[video_index]
+            keyframes = list()
+            for packet in container.demux(stream):
+                if packet.is_keyframe and packet.pts is not None:
+                    keyframes.append(packet.pts)
+            time_base = stream.time_base
+        keyframes.sort()
+        print_out(f'KeyframeIndex.build(path={path}) {len(keyframes)} keyframes, '
+                  f'{time.perf_counter() - begin:.3f}s')
+        return cls(keyframes, time_base.numerator, time_base.denominator)
+
+    @staticmethod
+    def get_cache_path(path: str, video_index: int, index_dir: str):
+        key = f'{os.path.abspath(path)}#{video_index}'.encode('utf-8')
+        return os.path.join(index_dir, hashlib.sha1(key).hexdigest() + '.json')
+
+    @classmethod
+    def load(cls, path: str, video_index=0, index_dir=''):
+        """
+        Reads the cached index, or builds and caches it.
+        """
+
+        index_dir = index_dir or default_index_dir()
+        cache_path = cls.get_cache_path(path, video_index, index_dir)
+        stat = os.stat(path)
+        try:
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+            if cache['version'] == KEYFRAME_INDEX_VERSION \
+                    and cache['size'] == stat.st_size \
+                    and cache['mtime'] == stat.st_mtime:
+                return cls(cache['keyframes'], cache['time_base'][0], cache['time_base'][1])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(path, video_index)
+        cache = {
+            'version': KEYFRAME_INDEX_VERSION,
+            'path': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'time_base': [index.time_base_num, index.time_base_den],
+            'keyframes': index.keyframes,
+        }
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            temp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temp_path, cache_path)  # Other processes never see a partial file.
+        except OSError as e:
+            print_error(f'KeyframeIndex.load() Cannot write the cache: {e}')
+        return index
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import weakref
+
+import numpy as np
+
+from collections import deque
+
+DEFAULT_MAX_FREE_BUFFERS = 8
+
+FRAME_FORMAT_CHANNELS = {
+    'bgr24': 3,
+    'rgb24': 3,
+    'gray': 1,
+}
+
+# 4:2:0 formats are stored as their planes one after another, in a (height * 3 / 2, width) image.
+FRAME_FORMAT_YUV420 = ['yuv420p', 'nv12']
+FRAME_FORMAT_LIST = list(FRAME_FORMAT_CHANNELS.keys()) + FRAME_FORMAT_YUV420
+
+
+def frame_shape(width: int, height: int, frame_format: str):
+    if frame_format in FRAME_FORMAT_YUV420:
+        return height * 3 // 2, width
+    channels = FRAME_FORMAT_CHANNELS[frame_format]
+    if channels == 1:
+        return height, width
+    return height, width, channels
+
+
+def split_planes(image: np.ndarray, frame_format: str):
+    """
+    Returns views of the planes of a 4:2:0 image.
+    ``(y, u, v)`` for yuv420p and ``(y, uv)`` for nv12, where ``uv`` has the shape ``(h / 2, w / 2, 2)``.
+    Other formats have a single plane.
+    """
+
+    if frame_format not in FRAME_FORMAT_YUV420:
+        return image,
+    width = image.shape[1]
+    height = image.shape[0] * 2 // 3
+    flat = image.reshape(-1)
+    luma_size = width * height
+    y = flat[:luma_size].reshape(height, width)
+    if frame_format == 'nv12':
+        return y, flat[luma_size:luma_size * 3 // 2].reshape(height // 2, width // 2, 2)
+    chroma_size = luma_size // 4
+    u = flat[luma_size:luma_size + chroma_size].reshape(height // 2, width // 2)
+    v = flat[luma_size + chroma_size:luma_size + chroma_size * 2].reshape(height // 2, width // 2)
+    return y, u, v
+
+
+def plane_view(plane, rows: int, row_bytes: int):
+    """
+    A ``(rows, row_bytes)`` view of a video plane without its line padding.
+    """
+
+    src = np.frombuffer(plane, np.uint8, count=plane.line_size * rows)
+    return src.reshape(rows, plane.line_size)[:, :row_bytes]
+
+
+def copy_planes(planes: list, out: np.ndarray):
+    """
+    Copies 2-dimensional plane views one after another into ``out``.
+    """
+
+    flat = out.reshape(-1)
+    offset = 0
+    for plane in planes:
+        np.copyto(flat[offset:offset + plane.size].reshape(plane.shape), plane)
+        offset += plane.size
+    return out
+
+
+def copy_plane(plane, out: np.ndarray):
+    """
+    Copies a packed video plane into ``out``, skipping the line padding of the plane.
+    """
+
+    height = out.shape[0]
+    row_bytes = out.size // height
+    src = np.frombuffer(plane, np.uint8, count=plane.line_size * height)
+    src = src.reshape(height, plane.line_size)[:, :row_bytes]
+    np.copyto(out.reshape(height, row_bytes), src)
+    return out
+
+
+class FrameBufferPool:
+    """
+    Recycles frame buffers keyed by ``(width, height, format)``.
+
+    The buffers it handed out are tracked by weak references, so a buffer dropped by the consumer
+    is forgotten instead of its ``id()`` matching an unrelated array later.
+    """
+
+    def __init__(self, max_free_buffers=DEFAULT_MAX_FREE_BUFFERS):
+        self.max_free_buffers = max_free_buffers
+        self.free = dict()
+        self.owned = dict()  # id(buffer): (key, weakref of the buffer)
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, width: int, height: int, frame_format: str, count=0):
+        """
+        With a positive ``count`` the buffer holds a batch of ``count`` frames.
+        """
+
+        key = (width, height, frame_format, count)
+        free = self.free.get(key)
+        if free:
+            self.hits += 1
+            return free.pop()
+
+        self.misses += 1
+        shape = frame_shape(width, height, frame_format)
+        if count > 0:
+            shape = (count,) + shape
+        buffer = np.empty(shape, dtype=np.uint8)
+        self._own(buffer, key)
+        return buffer
+
+    def _own(self, buffer: np.ndarray, key: tuple):
+        buffer_id = id(buffer)
+        owned = self.owned
+
+        def forget(ref):
+            if owned.get(buffer_id, (None, None))[1] is ref:
+                del owned[buffer_id]
+
+        owned[buffer_id] = key, weakref.ref(buffer, forget)
+
+    def is_owned(self, buffer: np.ndarray):
+        entry = self.owned.get(id(buffer))
+        return entry is not None and entry[1]() is buffer
+
+    def release(self, buffer: np.ndarray):
+        if not self.is_owned(buffer):
+            return  # Not owned by this pool.
+
+        key = self.owned[id(buffer)][0]
+        free = self.free.setdefault(key, list())
+        if len(free) < self.max_free_buffers:
+            free.append(buffer)
+        else:
+            del self.owned[id(buffer)]  # Dropped, the pool does not take it back.
+
+    def clear(self):
+        self.free.clear()
+        self.owned.clear()
+
+
+class DelayedRelease:
+    """
+    Returns buffers to the pool only after ``delay`` newer buffers were handed out.
+
+    ``multiprocessing.Queue`` pickles items lazily in its feeder thread,
+    so a pushed buffer must not be rewritten until the queue has moved past it.
+    """
+
+    def __init__(self, pool: FrameBufferPool, delay: int):
+        assert delay >= 0
+        self.pool = pool
+        self.delay = delay
+        self.in_flight = deque()
+
+    def retire(self, buffer: np.ndarray):
+        self.in_flight.append(buffer)
+        while len(self.in_flight) > self.delay:
+            self.pool.release(self.in_flight.popleft())
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+
+from collections import deque
+from queue import Queue
+
+LOGGING_PREFIX = '[av.stream_video.record] '
+LOGGING_SUFFIX = '\n'
+
+DEFAULT_RECORD_BUFFER_SECONDS = 10.0
+RECORDER_JOIN_TIMEOUT = 2.0
+
+
+def print_out(message):
+    sys.stdout.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stdout.flush()
+
+
+def print_error(message):
+    sys.stderr.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stderr.flush()
+
+
+def packet_time(packet):
+    timestamp = packet.pts if packet.pts is not None else packet.dts
+    if timestamp is None or packet.time_base is None:
+        return None
+    return float(timestamp * packet.time_base)
+
+
+class PacketBuffer:
+    """
+    A time-bounded ring of demuxed packets that always starts at a keyframe.
+    """
+
+    def __init__(self, seconds=DEFAULT_RECORD_BUFFER_SECONDS):
+        self.seconds = seconds
+        self.packets = deque()
+        self.last_time = None
+
+    def clear(self):
+        self.packets.clear()
+        self.last_time = None
+
+    def append(self, packet):
+        timestamp = packet_time(packet)
+        if timestamp is None:
+            return
+        if not self.packets and not packet.is_keyframe:
+            return  # A recording can not start without a keyframe.
+        self.packets.append((timestamp, packet))
+        self.last_time = timestamp
+        self._trim(timestamp - self.seconds)
+
+    def _trim(self, cutoff: float):
+        # Drop a whole GOP only while the next GOP still covers the cutoff.
+        while self.packets and self.packets[0][0] <= cutoff:
+            next_keyframe = None
+            for i, (timestamp, packet) in enumerate(self.packets):
+                if i > 0 and packet.is_keyframe:
+                    next_keyframe = (i, timestamp)
+                    break
+            if next_keyframe is None or next_keyframe[1] > cutoff:
+                return
+            for _ in range(next_keyframe[0]):
+                self.packets.popleft()
+
+    def snapshot(self, seconds: float):
+        """
+        Returns the packets of the last ``seconds``, starting at the keyframe just before them.
+        """
+
+        if not self.packets:
+            return []
+        cutoff = self.last_time - seconds
+        begin = 0
+        for i, (timestamp, packet) in enumerate(self.packets):
+            if timestamp > cutoff:
+                break
+            if packet.is_keyframe:
+                begin = i
+        return [packet for _, packet in list(self.packets)[begin:]]
+
+
+class PacketRecorder:
+    """
+    Remuxes packets into a file on its own thread, without decoding or encoding.
+    """
+
+    def __init__(self, path: str, template_stream, end_time: float):
+        self.path = path
+        self.template_stream = template_stream
+        self.end_time = end_time
+        self.queue = Queue()
+        self.done = False
+        self.thread = threading.Thread(target=self._run, name=f'record-{path}', daemon=True)
+
+    def start(self, packets: list):
+        for packet in packets:
+            self.queue.put(packet)
+        self.thread.start()
+
+    def write(self, packet):
+        """
+        Returns False once the recording has reached its end time.
+        """
+
+        if self.done:
+            return False
+        timestamp = packet_time(packet)
+        if timestamp is not None and timestamp > self.end_time:
+            self.finish()
+            return False
+        self.queue.put(packet)
+        return True
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            self.queue.put(None)
+
+    def join(self, timeout=RECORDER_JOIN_TIMEOUT):
+        if self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def _add_stream(self, container):
+        if hasattr(container, 'add_stream_from_template'):
+            return container.add_stream_from_template(self.template_stream)
+        return container.add_stream(template=self.template_stream)
+
+    def _run(self):
+        import av
+        output = None
+        count = 0
+        try:
+            output = av.open(self.path, 'w')
+            stream = self._add_stream(output)
+            offset = None
+            while True:
+                packet = self.queue.get()
+                if packet is None:
+                    break
+                if packet.dts is None:
+                    continue
+                if offset is None:
+                    offset = packet.dts
+
+                # Copy the packet, because the decoder and other recorders still share the original.
+                copied = av.Packet(bytes(packet))
+                copied.pts = packet.pts - offset if packet.pts is not None else None
+                copied.dts = packet.dts - offset
+                copied.time_base = packet.time_base
+                copied.is_keyframe = packet.is_keyframe
+                copied.stream = stream
+                output.mux(copied)
+                count += 1
+        except Exception as e:
+            print_error(f'PacketRecorder._run() Exception: {e}')
+        finally:
+            self.done = True
+            if output is not None:
+                try:
+                    output.close()
+                except Exception as e:
+                    print_error(f'PacketRecorder._run() Close exception: {e}')
+            print_out(f'PacketRecorder._run() Saved {count} packets to {self.path}')
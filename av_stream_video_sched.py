@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import glob
+import tempfile
+import threading
+
+DECODER_THREAD_TYPE_AUTO = 'auto'  # Frame and slice threads, as the codec supports. (FFmpeg default)
+DECODER_THREAD_TYPE_FRAME = 'frame'  # A frame per thread. Adds a frame of delay per thread.
+DECODER_THREAD_TYPE_SLICE = 'slice'  # The slices of one frame in parallel. No delay, if the stream has slices.
+DECODER_THREAD_TYPE_NONE = 'none'  # Decodes on the thread of the server only.
+DECODER_THREAD_TYPES = {
+    DECODER_THREAD_TYPE_AUTO: 'AUTO',
+    DECODER_THREAD_TYPE_FRAME: 'FRAME',
+    DECODER_THREAD_TYPE_SLICE: 'SLICE',
+    DECODER_THREAD_TYPE_NONE: 'NONE',
+}
+DECODER_THREAD_TYPE_LIST = list(DECODER_THREAD_TYPES.keys())
+
+CPU_AFFINITY_INHERIT = ''
+CPU_AFFINITY_AUTO = 'auto'  # Assigned by the HostScheduler.
+NICE_INHERIT = 0  # Keeps the priority of the parent.
+
+# The most decoder threads the scheduler gives a stream. More hardly speed up a single stream.
+AUTO_MAX_DECODER_THREADS = 4
+DEFAULT_LEASE_PATH = os.path.join(tempfile.gettempdir(), 'answer-lambda-av-sched.json')
+NUMA_NODE_PATTERN = '/sys/devices/system/node/node[0-9]*'
+
+
+def parse_cpu_list(text: str):
+    """
+    Parses a CPU list in the format of ``taskset -c`` and of sysfs, e.g. ``0-3,8,10-11``.
+    """
+
+    cpus = set()
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            if int(last) < int(first):
+                raise ValueError(f'Invalid CPU range: {part}')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    if any(cpu < 0 for cpu in cpus):
+        raise ValueError(f'Invalid CPU list: {text}')
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    ranges = list()
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else f'{first}-{last}' for first, last in ranges)
+
+
+def get_allowed_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def read_numa_nodes(allowed=None):
+    """
+    The allowed CPUs of each NUMA node, from sysfs. A single node without NUMA information.
+    """
+
+    allowed = set(get_allowed_cpus() if allowed is None else allowed)
+    nodes = list()
+    for path in sorted(glob.glob(NUMA_NODE_PATTERN), key=lambda p: int(os.path.basename(p)[4:])):
+        try:
+            with open(os.path.join(path, 'cpulist')) as f:
+                cpus = [cpu for cpu in parse_cpu_list(f.read().strip()) if cpu in allowed]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(allowed)]
+
+
+def set_thread_affinity(cpus):
+    """
+    Pins the calling thread. The threads it starts afterwards, e.g. the decoder threads of FFmpeg, inherit the mask.
+    """
+
+    os.sched_setaffinity(0, cpus)
+
+
+def set_thread_nice(nice: int):
+    """
+    Sets the nice value of the calling thread, and of the threads it starts afterwards.
+    Raising the priority (a lower value) needs CAP_SYS_NICE.
+    """
+
+    # On Linux, the priority of "the process" 0 is that of the calling thread.
+    os.setpriority(os.PRIO_PROCESS, 0, nice)
+
+
+def current_lease_key():
+    return f'{os.getpid()}:{threading.get_native_id()}'
+
+
+def is_lease_alive(key: str):
+    pid, tid = key.split(':', 1)
+    return os.path.exists(f'/proc/{pid}/task/{tid}')
+
+
+class HostScheduler:
+    """
+    Spreads the streams of a host over its NUMA nodes and cores.
+
+    The servers of all lambdas on the host share a lease table in ``lease_path``, locked with ``flock``.
+    Each server leases the CPUs it is pinned to, keyed by its process and thread,
+    so a server that died without releasing its lease is found and dropped by the next one.
+
+    A new stream goes to the NUMA node with the fewest decoder threads per CPU, and is pinned to the
+    least used CPUs of that node, one per decoder thread. Without a thread count of its own, a stream gets
+    one thread per CPU of the node that no other stream uses, at least 1 and at most ``AUTO_MAX_DECODER_THREADS``,
+    so the threads of many streams stop outnumbering the cores.
+    """
+
+    def __init__(self, lease_path=DEFAULT_LEASE_PATH, nodes=None):
+        self.lease_path = lease_path
+        self.nodes = nodes if nodes is not None else read_numa_nodes()
+
+    def _update(self, func):
+        import fcntl
+        fd = os.open(self.lease_path, os.O_RDWR | os.O_CREAT, 0o666)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    leases = json.loads(f.read() or '{}')
+                except ValueError:
+                    leases = dict()  # Broken by a crash. The live servers are running anyway.
+                leases = {key: lease for key, lease in leases.items() if is_lease_alive(key)}
+                result = func(leases)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(leases))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _assign(self, leases: dict, threads: int):
+        node_threads = [0] * len(self.nodes)
+        cpu_threads = dict()
+        for lease in leases.values():
+            if 0 <= lease['node'] < len(self.nodes):
+                node_threads[lease['node']] += lease['threads']
+            for cpu in lease['cpus']:
+                cpu_threads[cpu] = cpu_threads.get(cpu, 0) + 1
+
+        node = min(range(len(self.nodes)), key=lambda i: (node_threads[i] / len(self.nodes[i]), i))
+        cpus = self.nodes[node]
+        if threads <= 0:
+            idle = sum(1 for cpu in cpus if not cpu_threads.get(cpu))
+            threads = max(1, min(AUTO_MAX_DECODER_THREADS, idle))
+        chosen = sorted(cpus, key=lambda cpu: (cpu_threads.get(cpu, 0), cpu))[:min(threads, len(cpus))]
+        return {'node': node, 'cpus': sorted(chosen), 'threads': threads}
+
+    def acquire(self, threads=0, key=None):
+        """
+        Leases CPUs for a stream with ``threads`` decoder threads, or a thread count chosen by the scheduler if 0.
+        Returns ``(node, cpus, threads)``.
+        """
+
+        key = key or current_lease_key()
+
+        def acquire_lease(leases):
+            leases.pop(key, None)
+            lease = self._assign(leases, threads)
+            leases[key] = lease
+            return lease['node'], lease['cpus'], lease['threads']
+
+        return self._update(acquire_lease)
+
+    def release(self, key=None):
+        key = key or current_lease_key()
+        self._update(lambda leases: leases.pop(key, None))
+
+    def get_leases(self):
+        return self._update(lambda leases: dict(leases))
@@ -3,18 +3,90 @@
 import sys
 import traceback
 import time
+import threading
 import numpy as np
 
 from enum import Enum
-from multiprocessing.sharedctypes import Synchronized
+from itertools import chain
+from multiprocessing.sharedctypes import Synchronized, SynchronizedArray
 from multiprocessing import Queue
 from queue import Full, Empty
 
+from av_stream_video_shm import SharedFrameRing, RingFullException
+from av_stream_video_mosaic import SharedMosaic
+from av_stream_video_pool import FrameBufferPool, DelayedRelease, FRAME_FORMAT_LIST, frame_shape, copy_planes
+from av_stream_video_record import PacketBuffer, PacketRecorder
+from av_stream_video_stats import (
+    PipelineStats,
+    STATS_DECODED_FRAMES,
+    STATS_CONVERTED_FRAMES,
+    STATS_DROPPED_FRAMES,
+    STATS_PUSHED_FRAMES,
+    STATS_OVERWRITTEN_FRAMES,
+    STATS_STATIC_FRAMES,
+    STATS_OPENS,
+    STATS_OPEN_FAILURES,
+    STATS_READ_ERRORS,
+    STATS_CONNECT_SECONDS,
+    STATS_FIRST_FRAME_SECONDS,
+    STATS_QUEUE_OCCUPANCY,
+    STATS_DEMUX_SECONDS,
+    STATS_DECODE_SECONDS,
+    STATS_CONVERT_SECONDS,
+    STATS_ENCODE_SECONDS,
+    STATS_PUSH_SECONDS,
+    STATS_PTS_DELAY_SECONDS,
+)
+from av_stream_video_notify import Notifier, NotifyListener, StatusWord
+from av_stream_video_watchdog import Backoff, DEFAULT_RECONNECT_MAX_SLEEP
+from av_stream_video_encode import FrameEncoder, FRAME_ENCODING_NONE, FRAME_ENCODING_LIST, DEFAULT_ENCODING_QUALITY
+from av_stream_video_output import OutputSpec, FrameConverter, parse_output_specs, parse_crop
+from av_stream_video_motion import (
+    MotionGate,
+    MOTION_GATE_NONE,
+    MOTION_GATE_LIST,
+    DEFAULT_MOTION_THRESHOLD,
+    DEFAULT_MOTION_KEEPALIVE,
+)
+from av_stream_video_sync import CaptureClock, CAPTURE_CLOCK_AUTO, CAPTURE_CLOCK_LIST
+from av_stream_video_sched import (
+    HostScheduler,
+    parse_cpu_list,
+    format_cpu_list,
+    set_thread_affinity,
+    set_thread_nice,
+    DECODER_THREAD_TYPES,
+    DECODER_THREAD_TYPE_AUTO,
+    DECODER_THREAD_TYPE_LIST,
+    CPU_AFFINITY_INHERIT,
+    CPU_AFFINITY_AUTO,
+    NICE_INHERIT,
+)
+from av_stream_video_playback import (
+    PlaybackClock,
+    KeyframeIndex,
+    EndOfFileException,
+    is_file_source,
+    PLAYBACK_PACING_NONE,
+    PLAYBACK_PACING_REALTIME,
+    PLAYBACK_PACING_FAST,
+    PLAYBACK_PACING_LIST,
+    DEFAULT_PLAYBACK_SPEED,
+)
+
 EMPTY_IMAGE = np.zeros((300, 300, 3), dtype=np.uint8)
 DEFAULT_EXIT_TIMEOUT_SECONDS = 8.0
 RECONNECT_SLEEP = 1.0
 ITERATION_SLEEP = 0.001
+EXIT_CHECK_INTERVAL = 0.1  # Without a wakeup pipe.
+IDLE_WAIT_SECONDS = 1.0  # The longest wait for a wakeup, so the heartbeat stays fresh.
+DEFAULT_OPEN_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 10.0
 REFRESH_ERROR_THRESHOLD = 100
+DEFAULT_MAX_QUEUE_SIZE = 4
+DEFAULT_BATCH_TIMEOUT = 0.5
+FRAME_TIME_TOLERANCE = 0.001
+FRAME_TIME_JUMP_SECONDS = 1.0
 DEFAULT_FRAME_FORMAT = 'bgr24'
 INTERPOLATION_LIST = [
     'FAST_BILINEAR',
@@ -30,6 +102,58 @@ INTERPOLATION_LIST = [
     'SPLINE'
 ]
 
+DECODE_MODE_ALL = 'all'
+DECODE_MODE_NONREF_SKIP = 'nonref_skip'
+DECODE_MODE_KEYFRAMES_ONLY = 'keyframes_only'
+DECODE_MODE_SKIP_FRAME = {
+    DECODE_MODE_ALL: 'DEFAULT',
+    DECODE_MODE_NONREF_SKIP: 'NONREF',
+    DECODE_MODE_KEYFRAMES_ONLY: 'NONKEY',
+}
+DECODE_MODE_LIST = list(DECODE_MODE_SKIP_FRAME.keys())
+
+TRANSPORT_QUEUE = 'queue'
+TRANSPORT_SHM = 'shm'
+TRANSPORT_LIST = [TRANSPORT_SHM, TRANSPORT_QUEUE]
+DEFAULT_TRANSPORT = TRANSPORT_SHM
+
+COMMAND_RECORD = 'record'
+COMMAND_CONFIGURE = 'configure'
+
+# The props a running server applies without a restart.
+OUTPUT_CONFIG_KEYS = [
+    'frame_width',
+    'frame_height',
+    'frame_format',
+    'frame_interpolation',
+    'output_specs',
+    'frame_crop',
+    'motion_gate',
+    'motion_threshold',
+    'motion_keepalive',
+]
+PACING_CONFIG_KEYS = [
+    'target_fps',
+    'decimate_every_n',
+    'playback_pacing',
+    'playback_speed',
+]
+SOURCE_CONFIG_KEYS = ['video_src']
+RECORD_CONFIG_KEYS = ['record_buffer_seconds']
+LIVE_CONFIG_KEYS = OUTPUT_CONFIG_KEYS + PACING_CONFIG_KEYS + SOURCE_CONFIG_KEYS + RECORD_CONFIG_KEYS
+
+SERVER_MODE_PROCESS = 'process'
+SERVER_MODE_HUB = 'hub'
+SERVER_MODE_LIST = [SERVER_MODE_PROCESS, SERVER_MODE_HUB]
+
+WORKER_MODE_PROCESS = 'process'
+WORKER_MODE_THREAD = 'thread'  # In the process of the lambda. Frames are handed over without pickling.
+WORKER_MODE_LIST = [WORKER_MODE_PROCESS, WORKER_MODE_THREAD]
+
+POOL_COUNTER_HITS = 0
+POOL_COUNTER_MISSES = 1
+POOL_COUNTER_SIZE = 2
+
 SERVER_STATE_DONE = 0
 SERVER_STATE_OPENING = 1
 SERVER_STATE_RUNNING = 2  # This value can be changed in the server module.
@@ -58,6 +182,50 @@ class NoneFramesException(Exception):
     pass
 
 
+class FramePacer:
+    """
+    Decides which decoded frames are converted and pushed.
+    """
+
+    def __init__(self, target_fps=0.0, decimate_every_n=1):
+        self.target_fps = target_fps
+        self.decimate_every_n = decimate_every_n
+        self.interval = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.counter = 0
+        self.next_time = None
+
+    def is_enabled(self):
+        return self.interval > 0 or self.decimate_every_n > 1
+
+    def reset(self):
+        self.counter = 0
+        self.next_time = None
+
+    def _accept_decimate(self):
+        accept = self.counter % self.decimate_every_n == 0
+        self.counter += 1
+        return accept
+
+    def _accept_time(self, frame_time: float):
+        if self.next_time is not None:
+            early = self.next_time - frame_time
+            if FRAME_TIME_TOLERANCE < early <= self.interval + FRAME_TIME_JUMP_SECONDS:
+                return False
+            # Otherwise the frame is due, or the clock jumped backwards. (e.g. reconnect)
+        if self.next_time is None or abs(frame_time - self.next_time) > self.interval:
+            self.next_time = frame_time + self.interval
+        else:
+            self.next_time += self.interval
+        return True
+
+    def accept(self, frame_time: float):
+        if self.decimate_every_n > 1 and not self._accept_decimate():
+            return False
+        if self.interval > 0 and not self._accept_time(frame_time):
+            return False
+        return True
+
+
 class StreamVideoServer:
     """
     """
@@ -69,6 +237,14 @@ class StreamVideoServer:
         self.exit_flag: Synchronized = opt_kwargs(kwargs, 'exit_flag')
         self.server_state: Synchronized = opt_kwargs(kwargs, 'server_state')
         self.refresh_flag: Synchronized = opt_kwargs(kwargs, 'refresh_flag')
+        self.heartbeat: Synchronized = opt_kwargs(kwargs, 'heartbeat')
+        self.pool_counters: SynchronizedArray = opt_kwargs(kwargs, 'pool_counters')
+        self.shared_stats: SynchronizedArray = opt_kwargs(kwargs, 'stats')
+        self.command_queue: Queue = opt_kwargs(kwargs, 'command_queue')
+        self.frame_notifier: Notifier = opt_kwargs(kwargs, 'frame_notifier')
+        self.wakeup: NotifyListener = opt_kwargs(kwargs, 'wakeup')
+        self.command_count: StatusWord = opt_kwargs(kwargs, 'command_count')  # Incremented by the lambda.
+        self.wake_on_consume: bool = opt_kwargs(kwargs, 'wake_on_consume', False)
 
         self.video_src: str = opt_kwargs(kwargs, 'video_src', '')
         self.video_index: int = opt_kwargs(kwargs, 'video_index', 0)
@@ -80,20 +256,145 @@ class StreamVideoServer:
         self.container_options: dict = opt_kwargs(kwargs, 'container_options', {})
         self.stream_options: list = opt_kwargs(kwargs, 'stream_options', [])
         self.reconnect_sleep: float = opt_kwargs(kwargs, 'reconnect_sleep', RECONNECT_SLEEP)
+        self.reconnect_max_sleep: float = opt_kwargs(kwargs, 'reconnect_max_sleep', DEFAULT_RECONNECT_MAX_SLEEP)
         self.iteration_sleep: float = opt_kwargs(kwargs, 'iteration_sleep', ITERATION_SLEEP)
+        self.open_timeout: float = opt_kwargs(kwargs, 'open_timeout', DEFAULT_OPEN_TIMEOUT)
+        self.read_timeout: float = opt_kwargs(kwargs, 'read_timeout', DEFAULT_READ_TIMEOUT)
         self.verbose: bool = opt_kwargs(kwargs, 'verbose', False)
         self.low_delay: bool = opt_kwargs(kwargs, 'low_delay', False)
+        self.decode_mode: str = opt_kwargs(kwargs, 'decode_mode', DECODE_MODE_ALL)
+        self.transport: str = opt_kwargs(kwargs, 'transport', TRANSPORT_QUEUE)
+        self.ring_name: str = opt_kwargs(kwargs, 'ring_name', '')
+        self.max_queue_size: int = opt_kwargs(kwargs, 'max_queue_size', DEFAULT_MAX_QUEUE_SIZE)
+        self.target_fps: float = opt_kwargs(kwargs, 'target_fps', 0.0)
+        self.decimate_every_n: int = opt_kwargs(kwargs, 'decimate_every_n', 1)
+        self.convert_on_consume: bool = opt_kwargs(kwargs, 'convert_on_consume', False)
+        self.record_buffer_seconds: float = opt_kwargs(kwargs, 'record_buffer_seconds', 0.0)
+        self.frame_encoding: str = opt_kwargs(kwargs, 'frame_encoding', FRAME_ENCODING_NONE)
+        self.frame_encoding_quality: int = opt_kwargs(kwargs, 'frame_encoding_quality', DEFAULT_ENCODING_QUALITY)
+        self.playback_pacing: str = opt_kwargs(kwargs, 'playback_pacing', PLAYBACK_PACING_NONE)
+        self.playback_speed: float = opt_kwargs(kwargs, 'playback_speed', DEFAULT_PLAYBACK_SPEED)
+        self.playback_loop: bool = opt_kwargs(kwargs, 'playback_loop', False)
+        self.playback_start: float = opt_kwargs(kwargs, 'playback_start', 0.0)
+        self.playback_end: float = opt_kwargs(kwargs, 'playback_end', 0.0)
+        self.keyframe_index_dir: str = opt_kwargs(kwargs, 'keyframe_index_dir', '')
+        self.batch_size: int = opt_kwargs(kwargs, 'batch_size', 1)
+        self.batch_timeout: float = opt_kwargs(kwargs, 'batch_timeout', DEFAULT_BATCH_TIMEOUT)
+        self.output_specs: str = opt_kwargs(kwargs, 'output_specs', '')
+        self.frame_crop: str = opt_kwargs(kwargs, 'frame_crop', '')
+        self.motion_gate: str = opt_kwargs(kwargs, 'motion_gate', MOTION_GATE_NONE)
+        self.motion_threshold: float = opt_kwargs(kwargs, 'motion_threshold', DEFAULT_MOTION_THRESHOLD)
+        self.motion_keepalive: float = opt_kwargs(kwargs, 'motion_keepalive', DEFAULT_MOTION_KEEPALIVE)
+        self.recycle_buffers: bool = opt_kwargs(kwargs, 'recycle_buffers', True)
+        self.capture_clock_mode: str = opt_kwargs(kwargs, 'capture_clock', CAPTURE_CLOCK_AUTO)
+        self.mosaic_name: str = opt_kwargs(kwargs, 'mosaic_name', '')
+        self.mosaic_tile: int = opt_kwargs(kwargs, 'mosaic_tile', 0)
+        self.decoder_threads: int = opt_kwargs(kwargs, 'decoder_threads', 0)
+        self.decoder_thread_type: str = opt_kwargs(kwargs, 'decoder_thread_type', DECODER_THREAD_TYPE_AUTO)
+        self.cpu_affinity: str = opt_kwargs(kwargs, 'cpu_affinity', CPU_AFFINITY_INHERIT)
+        self.nice: int = opt_kwargs(kwargs, 'nice', NICE_INHERIT)
+
+        self.extra_specs = list()
+        self.extra_formats = list()
+        self.converter: FrameConverter = None  # noqa
+        self.gate: MotionGate = None  # noqa
+        self._build_outputs()
+
+        self.pacer = FramePacer(self.target_fps, self.decimate_every_n)
+        self.backoff = Backoff(self.reconnect_sleep, self.reconnect_max_sleep)
+        self.decoded_count = 0
+        self.dropped_count = 0
+        self.stats = PipelineStats(self.shared_stats)
+        self.pts_anchor = None  # The smallest (wall-clock - pts) since the last open.
+        self.capture_clock = CaptureClock(self.capture_clock_mode)
+        self.commands_done = 0
+
+        # A local file ends instead of failing, and can be paced, looped and seeked.
+        self.file_source = is_file_source(self.video_src)
+        self.clock = PlaybackClock(self.playback_speed)
+        self.keyframe_index: KeyframeIndex = None  # noqa
+        self.time_origin = 0.0  # The start time of the stream, which playback_start/end are relative to.
+        self.skip_until = 0.0  # Earlier frames are decoded but not converted. (after a seek)
+        self.ended = False
+        self.loop_count = 0
+        self.source_opener: SourceOpener = None  # noqa  The next source, opened while the current one plays.
+
+        self.ring: SharedFrameRing = None  # noqa
+        if self.transport == TRANSPORT_SHM:
+            self.ring = SharedFrameRing.attach(self.ring_name)
+        self.ring_pending = False
+
+        # A mosaic tile replaces the ring and the queue. The frame is scaled to the tile size
+        # and copied straight into the tile of the shared canvas, without a frame buffer of its own.
+        self.mosaic: SharedMosaic = None  # noqa
+        self.mosaic_planes = None  # The planes of the last converted frame, until they are pushed.
+        if self.mosaic_name:
+            self.mosaic = SharedMosaic.attach(self.mosaic_name)
+
+        # The ring slots are preallocated, so the pool only serves the queue transport
+        # and frames that do not fit in a ring slot.
+        # A consumer in the same process keeps the pushed buffers themselves, so they are never reused then.
+        self.pool = FrameBufferPool() if self.recycle_buffers else FrameBufferPool(max_free_buffers=0)
+        self.pool_release = DelayedRelease(self.pool, (self.max_queue_size + 1) * (1 + len(self.extra_specs)))
 
         self.container = None
         self.frames = None
 
+        # Demuxed packets are kept for passthrough recording.
+        self.packet_buffer: PacketBuffer = None  # noqa
+        if self.record_buffer_seconds > 0:
+            self.packet_buffer = PacketBuffer(self.record_buffer_seconds)
+        self.recorders = list()
+
+        # Each converted frame is encoded once here, instead of once per downstream consumer.
+        self.encoder: FrameEncoder = None  # noqa
+        if self.frame_encoding != FRAME_ENCODING_NONE:
+            if self.batch_size > 1:
+                print_error(f'StreamVideoServer() Batches are not encoded: {self.frame_encoding}')
+            else:
+                self.encoder = FrameEncoder(self.frame_encoding, self.frame_encoding_quality)
+        self.last_encoded = None
+
+        # Consecutive frames are converted straight into the rows of a (N, H, W, C) batch,
+        # which is a ring slot if it fits, so the batch is never copied again.
+        self.batch: np.ndarray = None  # noqa
+        self.batch_in_ring = False
+        self.batch_count = 0
+        self.batch_meta = list()  # (frame_seq, pts, index, timestamp, capture_time) of each row.
+        self.batch_begin = 0.0
+
         self.last_frame = EMPTY_IMAGE
+        self.last_extras = list()  # The images of extra_specs.
         self.last_index = 0
         self.last_pts = 0
+        self.last_seq = 0  # Increases with every converted frame.
+        self.last_time = 0.0  # The wall-clock time of the decoding.
+        self.last_capture_time = 0.0  # The estimated wall-clock time of the capture.
+        self.scheduler: HostScheduler = None  # noqa
+        self.thread_count = self.decoder_threads  # Decoder threads, as budgeted by the scheduler.
 
         assert self.frame_width >= 0
         assert self.frame_height >= 0
         assert self.frame_interpolation in INTERPOLATION_LIST
+        assert self.decode_mode in DECODE_MODE_LIST
+        assert self.capture_clock_mode in CAPTURE_CLOCK_LIST
+        assert self.decoder_threads >= 0
+        assert self.decoder_thread_type in DECODER_THREAD_TYPE_LIST
+        if self.cpu_affinity != CPU_AFFINITY_AUTO:
+            parse_cpu_list(self.cpu_affinity)  # Raises on an invalid list.
+        assert self.transport in TRANSPORT_LIST
+        assert self.target_fps >= 0
+        assert self.decimate_every_n >= 1
+        assert self.frame_format in FRAME_FORMAT_LIST
+        assert self.motion_gate in MOTION_GATE_LIST
+        assert self.frame_encoding in FRAME_ENCODING_LIST
+        assert self.playback_pacing in PLAYBACK_PACING_LIST
+        assert self.playback_speed > 0
+        assert self.playback_start >= 0
+        assert self.playback_end >= 0
+        assert self.batch_size >= 1
+        assert self.batch_timeout >= 0
+        assert all(spec.interpolation in INTERPOLATION_LIST for spec in self.extra_specs)
 
         if self.verbose:
             print_out(f' - video_src: {self.video_src}')
@@ -106,12 +407,204 @@ class StreamVideoServer:
             print_out(f' - container_options: {self.container_options}')
             print_out(f' - stream_options: {self.stream_options}')
             print_out(f' - reconnect_sleep: {self.reconnect_sleep}')
+            print_out(f' - reconnect_max_sleep: {self.reconnect_max_sleep}')
             print_out(f' - iteration_sleep: {self.iteration_sleep}')
+            print_out(f' - open_timeout: {self.open_timeout}')
+            print_out(f' - read_timeout: {self.read_timeout}')
             print_out(f' - verbose: {self.verbose}')
             print_out(f' - low_delay: {self.low_delay}')
+            print_out(f' - decode_mode: {self.decode_mode}')
+            print_out(f' - transport: {self.transport}')
+            print_out(f' - ring_name: {self.ring_name}')
+            print_out(f' - max_queue_size: {self.max_queue_size}')
+            print_out(f' - target_fps: {self.target_fps}')
+            print_out(f' - decimate_every_n: {self.decimate_every_n}')
+            print_out(f' - convert_on_consume: {self.convert_on_consume}')
+            print_out(f' - record_buffer_seconds: {self.record_buffer_seconds}')
+            print_out(f' - frame_encoding: {self.frame_encoding}')
+            print_out(f' - frame_encoding_quality: {self.frame_encoding_quality}')
+            print_out(f' - playback_pacing: {self.playback_pacing}')
+            print_out(f' - playback_speed: {self.playback_speed}')
+            print_out(f' - playback_loop: {self.playback_loop}')
+            print_out(f' - playback_start: {self.playback_start}')
+            print_out(f' - playback_end: {self.playback_end}')
+            print_out(f' - keyframe_index_dir: {self.keyframe_index_dir}')
+            print_out(f' - batch_size: {self.batch_size}')
+            print_out(f' - batch_timeout: {self.batch_timeout}')
+            print_out(f' - output_specs: {self.output_specs}')
+            print_out(f' - frame_crop: {self.frame_crop}')
+            print_out(f' - motion_gate: {self.motion_gate}')
+            print_out(f' - motion_threshold: {self.motion_threshold}')
+            print_out(f' - motion_keepalive: {self.motion_keepalive}')
+            print_out(f' - recycle_buffers: {self.recycle_buffers}')
+            print_out(f' - capture_clock: {self.capture_clock_mode}')
+            print_out(f' - mosaic_name: {self.mosaic_name}')
+            print_out(f' - mosaic_tile: {self.mosaic_tile}')
+            print_out(f' - decoder_threads: {self.decoder_threads}')
+            print_out(f' - decoder_thread_type: {self.decoder_thread_type}')
+            print_out(f' - cpu_affinity: {self.cpu_affinity}')
+            print_out(f' - nice: {self.nice}')
 
         print_out(f'StreamVideoServer() constructor done')
 
+    def _build_outputs(self):
+        # The frame and every extra output are converted from the same decoded frame.
+        extra_specs = parse_output_specs(self.output_specs)
+        if extra_specs and self.batch_size > 1:
+            print_error(f'StreamVideoServer() The extra outputs are disabled in batches: {self.output_specs}')
+            extra_specs = []
+        main_spec = OutputSpec(self.frame_width, self.frame_height, self.frame_format, self.frame_interpolation)
+        crop = parse_crop(self.frame_crop)
+        converter = FrameConverter([main_spec] + extra_specs, crop)
+        gate = None
+        if self.motion_gate != MOTION_GATE_NONE:
+            # Only the crop is watched, since nothing else is output.
+            gate = MotionGate(self.motion_gate, self.motion_threshold, self.motion_keepalive, crop)
+
+        self.extra_specs = extra_specs
+        self.extra_formats = [spec.frame_format for spec in extra_specs]
+        self.converter = converter
+        self.gate = gate
+
+    def configure(self, changes: dict):
+        """
+        Applies the ``LIVE_CONFIG_KEYS`` in ``changes`` to the running stream.
+
+        Output changes only rebuild the reformatters, and pacing changes only the pacer.
+        The packet buffer keeps its packets when ``record_buffer_seconds`` changes.
+        A new ``video_src`` is opened in the background while the current source keeps playing,
+        and replaces it once its first frame is decoded.
+        Invalid changes are rolled back.
+        """
+
+        print_out(f'StreamVideoServer.configure({changes})')
+        unknown = [key for key in changes if key not in LIVE_CONFIG_KEYS]
+        if unknown:
+            raise ValueError(f'Not configurable while running: {unknown}')
+
+        previous = {key: getattr(self, key) for key in changes if key not in SOURCE_CONFIG_KEYS}
+        try:
+            for key, value in previous.items():
+                setattr(self, key, changes[key])
+            assert self.frame_format in FRAME_FORMAT_LIST
+            assert self.playback_pacing in PLAYBACK_PACING_LIST
+            if any(key in OUTPUT_CONFIG_KEYS for key in changes):
+                self._build_outputs()
+            if any(key in PACING_CONFIG_KEYS for key in changes):
+                self.pacer = FramePacer(self.target_fps, self.decimate_every_n)
+                self.clock = PlaybackClock(self.playback_speed)
+            if 'record_buffer_seconds' in changes:
+                self._resize_packet_buffer()
+        except Exception:
+            for key, value in previous.items():
+                setattr(self, key, value)
+            self._build_outputs()
+            raise
+
+        self.pool_release.delay = (self.max_queue_size + 1) * (1 + len(self.extra_specs))
+        video_src = changes.get('video_src')
+        if video_src is not None and video_src != self.video_src:
+            self.switch_source(video_src)
+
+    def _resize_packet_buffer(self):
+        if self.record_buffer_seconds <= 0:
+            self.packet_buffer = None
+        elif self.packet_buffer is None:
+            self.packet_buffer = PacketBuffer(self.record_buffer_seconds)
+        else:
+            self.packet_buffer.seconds = self.record_buffer_seconds
+
+    def switch_source(self, video_src: str):
+        """
+        Make-before-break: the current source keeps playing until the new one has decoded a frame.
+        """
+
+        if not self.is_opened_video():
+            self.video_src = video_src
+            self.file_source = is_file_source(video_src)
+            self.keyframe_index = None
+            self.reopen_video()
+            return
+        if self.source_opener is not None:
+            self.source_opener.cancel()
+        self.stats.count(STATS_OPENS)
+        self.source_opener = SourceOpener(self, video_src)
+        self.source_opener.start()
+
+    def _poll_source_opener(self):
+        opener = self.source_opener
+        if opener is None or opener.is_alive():
+            return
+        self.source_opener = None
+        if opener.error is not None:
+            self.stats.count(STATS_OPEN_FAILURES)
+            print_error(f'StreamVideoServer._poll_source_opener() Keep {self.video_src}: {opener.error}')
+            return
+
+        self.push_batch(force=True)
+        self._reset_batch()
+        self.finish_recorders()
+        previous = self.container
+        self.container = opener.container
+        self.video_src = opener.video_src
+        self.stats.set(STATS_CONNECT_SECONDS, opener.connect_seconds)
+        try:
+            previous.close()
+        except Exception as e:
+            print_error(f'StreamVideoServer._poll_source_opener() Exception: {e}')
+
+        stream = self.container.streams.video[self.video_index]
+        self.frames = chain(opener.frames, self._demux_and_decode(stream))
+        self.keyframe_index = None
+        self._start_source(stream)
+        print_out(f'StreamVideoServer._poll_source_opener() Switched to {self.video_src}')
+
+    def _open_container(self, video_src: str):
+        import av
+        # The timeouts are checked by the interrupt callback of FFmpeg, so a blocking demux returns
+        # when a live source stops sending, and the server sees its flags again.
+        container = av.open(
+            video_src,
+            options=self.options,
+            container_options=self.container_options,
+            stream_options=self.stream_options,
+            timeout=(self.open_timeout or None, self.read_timeout or None)
+        )
+        stream = container.streams.video[self.video_index]
+        stream.thread_type = DECODER_THREAD_TYPES[self.decoder_thread_type]
+        if self.thread_count > 0:
+            # 0 leaves it to FFmpeg, which starts a thread per CPU of the affinity mask.
+            stream.codec_context.thread_count = self.thread_count
+        if self.low_delay:
+            stream.codec_context.flags = 'LOW_DELAY'
+        if self.decode_mode != DECODE_MODE_ALL:
+            # The skipped frames never leave the decoder, so they cost neither decode nor conversion.
+            stream.codec_context.skip_frame = DECODE_MODE_SKIP_FRAME[self.decode_mode]
+        return container
+
+    def _start_source(self, stream):
+        """
+        Resets the playback state for the frames of a newly opened ``stream``.
+        """
+
+        if self.packet_buffer is not None:
+            self.packet_buffer.clear()
+        self.ended = False
+        self.skip_until = 0.0
+        self.clock.reset()
+        self.file_source = is_file_source(self.video_src)
+        self.time_origin = 0.0
+        if self.file_source:
+            if stream.start_time is not None:
+                self.time_origin = float(stream.start_time * stream.time_base)
+            if self.playback_start > 0:
+                self.seek_video(self.playback_start)
+        self.pacer.reset()
+        self.pts_anchor = None
+        self.capture_clock.reset(stream.container)
+        if self.gate is not None:
+            self.gate.reset()  # The first frame always passes.
+
     def _put_nowait(self, data):
         try:
             self.queue.put_nowait(data)
@@ -125,14 +618,148 @@ class StreamVideoServer:
         except Empty:
             pass
 
-    def push(self, data):
+    def _write_ring(self, data, encoded=None, batch_meta=None, extras=None):
+        if self.ring_pending:
+            # The frame was decoded in place by read_next_frame().
+            self.ring_pending = False
+            self.ring.commit_write(data.shape, pts=self.last_pts, index=self.last_index,
+                                   frame_format=self.frame_format, timestamp=self.last_time,
+                                   encoded=encoded, frame_seq=self.last_seq, batch_meta=batch_meta,
+                                   extra_formats=self.extra_formats, capture_time=self.last_capture_time)
+            return True
+        seq = self.ring.write(data, pts=self.last_pts, index=self.last_index,
+                              frame_format=self.frame_format, timestamp=self.last_time,
+                              encoded=encoded, frame_seq=self.last_seq, batch_meta=batch_meta,
+                              extras=extras, extra_formats=self.extra_formats,
+                              capture_time=self.last_capture_time)
+        return seq != 0
+
+    def get_last_meta(self):
+        return {
+            'seq': self.last_seq,
+            'pts': self.last_pts,
+            'index': self.last_index,
+            'timestamp': self.last_time,
+            'capture_time': self.last_capture_time,
+        }
+
+    @staticmethod
+    def _batch_meta_to_dict(batch_meta: list):
+        return [{'seq': seq, 'pts': pts, 'index': index, 'timestamp': timestamp, 'capture_time': capture_time}
+                for seq, pts, index, timestamp, capture_time in batch_meta]
+
+    def _push_impl(self, data, encoded=None, batch_meta=None, extras=None):
+        if self.ring is not None:
+            if not self.ring.is_consumed():
+                self.stats.count(STATS_OVERWRITTEN_FRAMES)
+            return self._write_ring(data, encoded, batch_meta, extras)
+        if batch_meta is not None:
+            data = (data, self._batch_meta_to_dict(batch_meta), encoded, [])
+        else:
+            data = (data, self.get_last_meta(), encoded, extras or [])
         if self._put_nowait(data):
             return True
+        self.stats.count(STATS_OVERWRITTEN_FRAMES)
         self._get_nowait()
         return self._put_nowait(data)
 
+    def _get_queue_occupancy(self):
+        if self.ring is not None:
+            return self.ring.get_lag()
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:  # macOS
+            return 0
+
+    def push(self, data, encoded=None, batch_meta=None, extras=None):
+        begin = time.perf_counter()
+        result = self._push_impl(data, encoded, batch_meta, extras)
+        if result:
+            self._notify()
+        self.stats.observe(STATS_PUSH_SECONDS, time.perf_counter() - begin)
+        self.stats.count(STATS_PUSHED_FRAMES, len(batch_meta) if batch_meta is not None else 1)
+        self.stats.set(STATS_QUEUE_OCCUPANCY, self._get_queue_occupancy())
+        return result
+
+    def push_tile(self):
+        """
+        Copies the last converted frame into the mosaic tile.
+        A frame pushed again, e.g. after a read error, is already there.
+        """
+
+        if self.mosaic_planes is None:
+            return False
+        begin = time.perf_counter()
+        self.mosaic.write_tile(self.mosaic_tile, self.mosaic_planes, frame_seq=self.last_seq, pts=self.last_pts,
+                               index=self.last_index, timestamp=self.last_time, capture_time=self.last_capture_time)
+        self.mosaic_planes = None
+        self._notify()
+        self.stats.observe(STATS_PUSH_SECONDS, time.perf_counter() - begin)
+        self.stats.count(STATS_PUSHED_FRAMES)
+        return True
+
     def push_last_frame(self):
-        self.push(self.last_frame)
+        if self.mosaic is not None:
+            self.push_tile()
+            return
+        if self.batch_size > 1:
+            self.push_batch()  # Frames are only pushed as a part of a batch.
+            return
+        self.push(self.last_frame, self.last_encoded, extras=self.last_extras)
+
+    def push_batch(self, force=False):
+        """
+        Pushes the batch when it is full, when its first frame has waited ``batch_timeout`` seconds,
+        or with ``force``. A batch pushed early has fewer rows.
+        """
+
+        if self.batch is None or self.batch_count == 0:
+            return False
+        if not force \
+                and self.batch_count < self.batch_size \
+                and time.monotonic() - self.batch_begin < self.batch_timeout:
+            return False
+        batch, batch_in_ring = self.batch, self.batch_in_ring
+        result = self.push(batch[:self.batch_count], batch_meta=self.batch_meta)
+        self._reset_batch()
+        if not batch_in_ring:
+            self.pool_release.retire(batch)
+        return result
+
+    def _reset_batch(self):
+        if self.batch_in_ring:
+            self.ring_pending = False  # An unpublished slot is simply written again.
+        self.batch = None
+        self.batch_in_ring = False
+        self.batch_count = 0
+        self.batch_meta = list()
+
+    def _acquire_batch_row(self, width: int, height: int):
+        shape = frame_shape(width, height, self.frame_format)
+        if self.batch is not None and self.batch.shape[1:] != shape:
+            self.push_batch(force=True)  # The frame size has changed.
+        if self.batch is None:
+            self.batch_in_ring = False
+            if self.ring is not None:
+                try:
+                    self.batch = self.ring.begin_write((self.batch_size,) + shape)
+                    self.batch_in_ring = True
+                    self.ring_pending = True
+                except RingFullException:
+                    pass
+            if self.batch is None:
+                self.ring_pending = False
+                self.batch = self.pool.acquire(width, height, self.frame_format, self.batch_size)
+                self._update_pool_counters()
+            self.batch_begin = time.monotonic()
+        return self.batch[self.batch_count]
+
+    def _add_to_batch(self):
+        self.batch_meta.append((self.last_seq, self.last_pts or 0, self.last_index or 0, self.last_time,
+                                self.last_capture_time))
+        self.batch_count += 1
+        if self.batch_count >= self.batch_size:
+            self.push_batch()
 
     def _get_exit_flag(self):
         with self.exit_flag.get_lock():
@@ -149,34 +776,75 @@ class StreamVideoServer:
     def _set_server_state(self, value: int):
         with self.server_state.get_lock():
             self.server_state.value = value
+        self._notify()
+
+    def _notify(self):
+        # Wakes up the consumers waiting in select() or an event loop.
+        if self.frame_notifier is not None:
+            self.frame_notifier.notify()
+
+    def _set_heartbeat(self):
+        if self.heartbeat is None:
+            return
+        with self.heartbeat.get_lock():
+            self.heartbeat.value = time.monotonic()
+
+    def _wait(self, seconds: float):
+        """
+        Sleeps up to ``seconds``, or until the lambda wakes up the server. Returns whether it was woken up.
+        """
+
+        if self.wakeup is None or not self.wakeup.alive:
+            time.sleep(min(seconds, EXIT_CHECK_INTERVAL))
+            return False
+        if not self.wakeup.wait(seconds):
+            return False
+        self.wakeup.drain()
+        return True
+
+    def _sleep(self, seconds: float):
+        # Wake up for the exit flag, because the backoff can grow to tens of seconds.
+        end = time.monotonic() + seconds
+        while not self._get_exit_flag():
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wait(remaining)
+
+    def _update_pool_counters(self):
+        if self.pool_counters is None:
+            return
+        with self.pool_counters.get_lock():
+            self.pool_counters[POOL_COUNTER_HITS] = self.pool.hits
+            self.pool_counters[POOL_COUNTER_MISSES] = self.pool.misses
 
     def open_video(self):
         print_out(f'StreamVideoServer.open_video(src={self.video_src},index={self.video_index})')
+        self.stats.count(STATS_OPENS)
         try:
-            import av
-            self.container = av.open(  # noqa
-                self.video_src,
-                options=self.options,
-                container_options=self.container_options,
-                stream_options=self.stream_options
-            )
-            self.container.streams.video[self.video_index].thread_type = 'AUTO'  # Go faster!
-            if self.low_delay:
-                self.container.streams.video[self.video_index].codec_context.flags = 'LOW_DELAY'
-            self.frames = self.container.decode(video=self.video_index)
+            open_begin = time.perf_counter()
+            self.container = self._open_container(self.video_src)
+            self.stats.set(STATS_CONNECT_SECONDS, time.perf_counter() - open_begin)
+            stream = self.container.streams.video[self.video_index]
+            self.frames = self._demux_and_decode(stream)
             if self.verbose:
                 print_out(f'StreamVideoServer.open_video() Video open success!')
+            self._start_source(stream)
 
             # [WARNING]
             # It takes a long time to acquire the first frame.
             # Therefore, it changes the server state after acquiring the first frame.
-            self.read_next_frame()
+            while not self.read_next_frame(force=True):
+                pass  # Frames before playback_start.
+            self.stats.set(STATS_FIRST_FRAME_SECONDS, time.perf_counter() - open_begin)
             self.push_last_frame()  # Don't miss the first frame!
             self._set_server_state(SERVER_STATE_RUNNING)
+            self.stats.publish(force=True)
 
             return True
         except Exception as e:
             print_error(f'StreamVideoServer.open_video() Exception: {e}')
+            self.stats.count(STATS_OPEN_FAILURES)
             return False
 
     def is_opened_video(self):
@@ -192,25 +860,340 @@ class StreamVideoServer:
 
         self.container = None
         self.frames = None
+        self._reset_batch()
+        self.finish_recorders()
 
     def reopen_video(self):
         self._set_server_state(SERVER_STATE_OPENING)
         self.close_video()
         return self.open_video()
 
-    def read_next_frame(self):
+    def seek_video(self, seconds: float):
+        """
+        Seeks a file source to ``seconds`` after its start,
+        through the keyframe just before it, without reopening the file.
+        """
+
+        stream = self.container.streams.video[self.video_index]
+        pts = None
+        if seconds > 0:
+            if self.keyframe_index is None:
+                self.keyframe_index = KeyframeIndex.load(self.video_src, self.video_index, self.keyframe_index_dir)
+            pts = self.keyframe_index.find(self.time_origin + seconds)
+        if pts is None:
+            pts = stream.start_time or 0
+        self.container.seek(pts, stream=stream, backward=True, any_frame=False)  # Flushes the decoder.
+        self.frames = self._demux_and_decode(stream)
+        self.skip_until = self.time_origin + seconds if seconds > 0 else 0.0
+        self.clock.reset()
+        self.pacer.reset()
+        self.capture_clock.reset(self.container)  # The pts jump, the capture times go on.
+        if self.packet_buffer is not None:
+            self.packet_buffer.clear()
+
+    def _is_past_end(self, frame):
+        if self.playback_end <= 0 or frame.time is None:
+            return False
+        return frame.time >= self.time_origin + self.playback_end
+
+    def _next_frame(self):
         if self.frames is None:
             raise NoneFramesException
-        frame = next(self.frames)
-        self.last_frame = frame.to_ndarray(width=self.frame_width,
-                                           height=self.frame_height,
-                                           format=self.frame_format,
-                                           interpolation=self.frame_interpolation)
+        if not self.file_source:
+            return next(self.frames)
+
+        for _ in range(2):  # A single loop restart must be enough.
+            frame = next(self.frames, None)
+            if frame is not None and not self._is_past_end(frame):
+                return frame
+            if not self.playback_loop:
+                raise EndOfFileException
+            self.loop_count += 1
+            if self.verbose:
+                print_out(f'StreamVideoServer._next_frame() Loop {self.loop_count}')
+            self.seek_video(self.playback_start)
+        raise EndOfFileException  # No frames between playback_start and playback_end.
+
+    def _wait_for_frame_time(self, frame):
+        if frame.time is None or frame.time < self.skip_until:
+            return
+        delay = self.clock.get_delay(frame.time, time.monotonic())
+        if delay > 0:
+            self._sleep(delay)
+
+    def _demux_and_decode(self, stream):
+        """
+        Equivalent to ``container.decode()``, but times demuxing and decoding separately
+        and keeps the demuxed packets for recording.
+        """
+
+        packets = self.container.demux(stream)
+        while True:
+            begin = time.perf_counter()
+            try:
+                packet = next(packets)
+            except StopIteration:
+                return
+            self.stats.observe(STATS_DEMUX_SECONDS, time.perf_counter() - begin)
+
+            if self.packet_buffer is not None:
+                self.packet_buffer.append(packet)
+                if self.recorders:
+                    self.recorders = [r for r in self.recorders if r.write(packet)]
+
+            begin = time.perf_counter()
+            frames = packet.decode()
+            self.stats.observe(STATS_DECODE_SECONDS, time.perf_counter() - begin)
+            for frame in frames:
+                yield frame
+
+    def start_recorder(self, path: str, pre_seconds: float, post_seconds: float):
+        if self.packet_buffer is None:
+            print_error(f'StreamVideoServer.start_recorder() The packet buffer is disabled.')
+            return False
+        if self.container is None or self.packet_buffer.last_time is None:
+            print_error(f'StreamVideoServer.start_recorder() No packets to record.')
+            return False
+
+        stream = self.container.streams.video[self.video_index]
+        recorder = PacketRecorder(path, stream, self.packet_buffer.last_time + post_seconds)
+        recorder.start(self.packet_buffer.snapshot(pre_seconds))
+        self.recorders.append(recorder)
+        print_out(f'StreamVideoServer.start_recorder(path={path},pre={pre_seconds}s,post={post_seconds}s)')
+        return True
+
+    def finish_recorders(self):
+        for recorder in self.recorders:
+            recorder.finish()
+        for recorder in self.recorders:
+            recorder.join()  # Don't lose the tail of the file when the process exits.
+        self.recorders = list()
+
+    def handle_command(self, command: tuple):
+        name = command[0]
+        if name == COMMAND_RECORD:
+            self.start_recorder(*command[1:])
+        elif name == COMMAND_CONFIGURE:
+            self.configure(command[1])
+        else:
+            print_error(f'StreamVideoServer.handle_command() Unknown command: {name}')
+
+    def _has_commands(self):
+        if self.command_queue is None:
+            return False
+        if self.command_count is not None:
+            # A word in shared memory instead of a poll() of the queue pipe in every iteration.
+            return self.commands_done < self.command_count.value
+        return not self.command_queue.empty()
+
+    def process_commands(self):
+        if not self._has_commands():
+            return
+        while True:
+            try:
+                command = self.command_queue.get_nowait()
+            except Empty:
+                return
+            self.commands_done += 1
+            try:
+                self.handle_command(command)
+            except Exception as e:
+                print_error(f'StreamVideoServer.process_commands() Exception: {e}')
+
+    def is_consumed(self):
+        """
+        Whether the consumer has taken the last pushed frame.
+        """
+
+        if self.ring is not None:
+            return self.ring.is_consumed()
+        return self.queue.empty()
+
+    def has_room(self):
+        """
+        Whether the next push would not overwrite a frame the consumer has not taken.
+        """
+
+        if self.ring is not None:
+            return self.ring.is_consumed()
+        return not self.queue.full()
+
+    def should_convert(self, frame):
+        if not self.pacer.accept(frame.time if frame.time is not None else time.monotonic()):
+            return False
+        if self.convert_on_consume and not self.is_consumed():
+            return False
+        return True
+
+    def read_next_frame(self, force=False):
+        """
+        Decodes the next frame and converts it unless the pacing drops it.
+        Dropped frames are still decoded to keep the codec state intact,
+        but they skip scaling and colour conversion entirely.
+
+        Returns True if ``last_frame`` was updated.
+        """
+
+        frame = self._next_frame()
+        if self.playback_pacing == PLAYBACK_PACING_REALTIME:
+            self._wait_for_frame_time(frame)
+        decoded_time = time.time()
+        self.decoded_count += 1
+        self.stats.count(STATS_DECODED_FRAMES)
+        self._set_heartbeat()
+        self._observe_pts_delay(frame, decoded_time)
+        capture_time = self.capture_clock.capture_time(frame, decoded_time)  # Every frame moves the pts anchor.
+        if frame.time is not None and frame.time < self.skip_until:
+            self.dropped_count += 1
+            self.stats.count(STATS_DROPPED_FRAMES)
+            return False
+        if not force and not self.should_convert(frame):
+            self.dropped_count += 1
+            self.stats.count(STATS_DROPPED_FRAMES)
+            return False
+        if self.gate is not None and not self.gate.check(frame, time.monotonic()):
+            # Nothing is pushed, so the consumer sees no new frame.
+            self.stats.count(STATS_STATIC_FRAMES)
+            return False
+
+        convert_begin = time.perf_counter()
+
+        planes, width, height = self.converter.convert(frame, 0)
+        if self.mosaic is not None:
+            self.mosaic_planes = planes  # Copied into the tile by push_last_frame().
+            self.stats.observe(STATS_CONVERT_SECONDS, time.perf_counter() - convert_begin)
+            self.stats.count(STATS_CONVERTED_FRAMES)
+            self._update_last_meta(frame, decoded_time, capture_time)
+            return True
+
+        extra_outputs = [self.converter.convert(frame, i + 1) for i in range(len(self.extra_specs))]
+        buffer, extra_buffers = self._acquire_buffers((width, height), [(w, h) for _, w, h in extra_outputs])
+        copy_planes(planes, buffer)
+        for (extra_planes, _, _), extra_buffer in zip(extra_outputs, extra_buffers):
+            copy_planes(extra_planes, extra_buffer)
+        self.stats.observe(STATS_CONVERT_SECONDS, time.perf_counter() - convert_begin)
+        self.stats.count(STATS_CONVERTED_FRAMES)
+        self._retire_last_frame()
+        self.last_frame = buffer
+        self.last_extras = extra_buffers
+        self._update_last_meta(frame, decoded_time, capture_time)
+        self.last_encoded = self._encode(buffer)
+        if self.batch_size > 1:
+            self._add_to_batch()
+        return True
+
+    def _update_last_meta(self, frame, decoded_time: float, capture_time: float):
         self.last_index = frame.index
         self.last_pts = frame.pts
+        self.last_seq += 1
+        self.last_time = decoded_time
+        self.last_capture_time = capture_time
+
+    def _encode(self, image: np.ndarray):
+        if self.encoder is None:
+            return None
+        try:
+            begin = time.perf_counter()
+            encoded = self.encoder.encode(image, self.frame_format)
+            self.stats.observe(STATS_ENCODE_SECONDS, time.perf_counter() - begin)
+            return encoded
+        except Exception as e:
+            print_error(f'StreamVideoServer._encode() Exception: {e}')
+            return None
+
+    def _observe_pts_delay(self, frame, decoded_time: float):
+        if frame.time is None:
+            return
+        # The capture clock is unknown, so the delay is relative to the fastest frame since the open.
+        anchor = decoded_time - frame.time
+        if self.pts_anchor is None or anchor < self.pts_anchor:
+            self.pts_anchor = anchor
+        self.stats.observe(STATS_PTS_DELAY_SECONDS, anchor - self.pts_anchor)
+
+    def _acquire_buffer(self, width: int, height: int):
+        if self.batch_size > 1:
+            return self._acquire_batch_row(width, height)
+        if self.ring is not None:
+            try:
+                buffer = self.ring.begin_write(frame_shape(width, height, self.frame_format))
+                self.ring_pending = True
+                return buffer
+            except RingFullException:
+                pass
+        self.ring_pending = False
+        buffer = self.pool.acquire(width, height, self.frame_format)
+        self._update_pool_counters()
+        return buffer
+
+    def _acquire_buffers(self, size: tuple, extra_sizes: list):
+        """
+        Returns the buffers of the frame and the extra images, all in the same ring slot if they fit.
+        """
+
+        width, height = size
+        if not extra_sizes:
+            return self._acquire_buffer(width, height), []
+        shape = frame_shape(width, height, self.frame_format)
+        extra_shapes = [frame_shape(extra_width, extra_height, extra_format)
+                        for (extra_width, extra_height), extra_format in zip(extra_sizes, self.extra_formats)]
+        if self.ring is not None:
+            try:
+                buffer, extra_buffers = self.ring.begin_write_extras(shape, extra_shapes)
+                self.ring_pending = True
+                return buffer, extra_buffers
+            except RingFullException:
+                pass
+        self.ring_pending = False
+        buffer = self.pool.acquire(width, height, self.frame_format)
+        extra_buffers = [self.pool.acquire(extra_width, extra_height, extra_format)
+                         for (extra_width, extra_height), extra_format in zip(extra_sizes, self.extra_formats)]
+        self._update_pool_counters()
+        return buffer, extra_buffers
+
+    def _retire_last_frame(self):
+        if self.batch_size > 1:
+            return  # The rows are released with their batch.
+        if self.last_frame is not EMPTY_IMAGE:
+            self.pool_release.retire(self.last_frame)
+        for extra in self.last_extras:
+            self.pool_release.retire(extra)
+
+    def apply_scheduling(self):
+        """
+        Applies ``cpu_affinity`` and ``nice`` to the calling thread, before the decoder starts its threads,
+        which inherit both. Only the server is affected, also in the thread worker mode and in the hub.
+        """
+
+        cpus = None
+        try:
+            if self.cpu_affinity == CPU_AFFINITY_AUTO:
+                self.scheduler = HostScheduler()
+                node, cpus, self.thread_count = self.scheduler.acquire(self.decoder_threads)
+                print_out(f'StreamVideoServer.apply_scheduling() node={node},threads={self.thread_count}')
+            elif self.cpu_affinity:
+                cpus = parse_cpu_list(self.cpu_affinity)
+            if cpus:
+                set_thread_affinity(cpus)
+                print_out(f'StreamVideoServer.apply_scheduling() cpus={format_cpu_list(cpus)}')
+        except (OSError, ValueError, AttributeError) as e:
+            print_error(f'StreamVideoServer.apply_scheduling() Cannot set the CPU affinity: {e}')
+        if self.nice != NICE_INHERIT:
+            try:
+                set_thread_nice(self.nice)
+            except (OSError, AttributeError) as e:
+                print_error(f'StreamVideoServer.apply_scheduling() Cannot set nice {self.nice}: {e}')
+
+    def release_scheduling(self):
+        if self.scheduler is not None:
+            try:
+                self.scheduler.release()
+            except OSError as e:
+                print_error(f'StreamVideoServer.release_scheduling() Cannot release the CPUs: {e}')
+            self.scheduler = None
 
     def run(self):
         print_out('StreamVideoServer.run() BEGIN.')
+        self.apply_scheduling()
         if not self.is_opened_video():
             self.open_video()
 
@@ -224,33 +1207,138 @@ class StreamVideoServer:
                     print_error(f'StreamVideoServer.run() [REFRESH] -> reconnect failure.')
                 self._set_refresh_flag(False)
 
+            self.process_commands()
+            self._poll_source_opener()
+
+            if self.ended or (self.playback_pacing == PLAYBACK_PACING_FAST and not self.has_room()):
+                # The file has ended, or the consumer has not taken the last frame yet.
+                # Either way the server is alive, so keep the watchdog quiet.
+                self._set_heartbeat()
+                self.stats.publish()
+                if self.ended or self.wake_on_consume:
+                    self._wait(IDLE_WAIT_SECONDS)  # Until an exit, a refresh, a command or a consumed frame.
+                else:
+                    time.sleep(max(self.iteration_sleep, ITERATION_SLEEP))
+                continue
+
             # Read current frame.
             try:
-                self.read_next_frame()
+                converted = self.read_next_frame()
+                self.backoff.reset()
+            except EndOfFileException:
+                converted = False
+                self.ended = True
+                self.push_batch(force=True)
+                print_out(f'StreamVideoServer.run() End of file.')
             except Exception as e:
-                print_error(e)
+                self.stats.count(STATS_READ_ERRORS)
+                print_error(f'StreamVideoServer.run() Read exception: {e!r}')
+                reconnect_sleep = self.backoff.next_delay()
                 if self.verbose:
-                    print_out(f'StreamVideoServer.run() reconnect sleep: {self.reconnect_sleep}s ...')
-                if self.reconnect_sleep > 0:
-                    time.sleep(self.reconnect_sleep)
+                    print_out(f'StreamVideoServer.run() reconnect sleep: {reconnect_sleep:.3f}s ...')
+                if reconnect_sleep > 0:
+                    self._sleep(reconnect_sleep)
 
                 reconnect_result = self.reopen_video()
                 if reconnect_result:
                     print_out(f'StreamVideoServer.run() reconnect success.')
                 else:
                     print_error(f'StreamVideoServer.run() reconnect failure.')
+                # The reopen has pushed the first frame of the new source. Otherwise push the last frame again.
+                converted = not reconnect_result
 
-            if self.verbose:
-                args_text = f'index={self.last_index},pts={self.last_pts},frame={self.last_frame.shape}'
-                print_out(f'StreamVideoServer.run() Push({args_text})')
+            if converted or self.batch_size > 1:  # A batch can time out without new frames.
+                if self.verbose and converted:
+                    args_text = f'index={self.last_index},pts={self.last_pts},frame={self.last_frame.shape}'
+                    print_out(f'StreamVideoServer.run() Push({args_text})')
+                self.push_last_frame()
 
-            self.push_last_frame()
-            if self.iteration_sleep > 0:
+            self.stats.publish()
+            if self.iteration_sleep > 0 and self.playback_pacing == PLAYBACK_PACING_NONE and self.file_source:
+                # Throttles a file. The demux of a live source blocks until its next packet anyway.
                 time.sleep(self.iteration_sleep)
 
+        self.stats.publish(force=True)
+        if self.source_opener is not None:
+            self.source_opener.cancel()
         self.close_video()
+        self.close_ring()
+        self.close_mosaic()
+        self.release_scheduling()
+        self._notify()  # A waiting consumer finds the server gone.
+        print_out(f'StreamVideoServer.run() Pool(hits={self.pool.hits},misses={self.pool.misses})')
+        print_out(f'StreamVideoServer.run() Frames(decoded={self.decoded_count},dropped={self.dropped_count})')
         print_out('StreamVideoServer.run() END.')
 
+    def close_ring(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def close_mosaic(self):
+        if self.mosaic is not None:
+            self.mosaic_planes = None
+            self.mosaic.close()
+            self.mosaic = None
+
+
+class SourceOpener:
+    """
+    Opens a source and decodes its first frame on its own thread.
+    PyAV releases the GIL while it connects and decodes, so the current source keeps playing meanwhile.
+    """
+
+    def __init__(self, server: StreamVideoServer, video_src: str):
+        self.server = server
+        self.video_src = video_src
+        self.container = None
+        self.frames = list()  # The frames decoded so far, the first one included.
+        self.connect_seconds = 0.0
+        self.error: Exception = None  # noqa
+        self.cancelled = False
+        self.thread = threading.Thread(target=self._run, name=f'open-{video_src}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def cancel(self):
+        """
+        Closes the new source once it is open. The thread is not waited for.
+        """
+
+        self.cancelled = True
+        if not self.thread.is_alive():
+            self._close()
+
+    def _close(self):
+        if self.container is not None:
+            try:
+                self.container.close()
+            except Exception as e:
+                print_error(f'SourceOpener._close() Exception: {e}')
+            self.container = None
+
+    def _run(self):
+        try:
+            begin = time.perf_counter()
+            self.container = self.server._open_container(self.video_src)  # noqa
+            self.connect_seconds = time.perf_counter() - begin
+            stream = self.container.streams.video[self.server.video_index]
+            for packet in self.container.demux(stream):
+                self.frames = packet.decode()
+                if self.frames or self.cancelled:
+                    break
+            if not self.frames and not self.cancelled:
+                raise EndOfFileException(f'No frames in {self.video_src}')
+        except Exception as e:
+            self.error = e
+            self._close()
+        if self.cancelled:
+            self._close()
+
 
 def start_app(*args, **kwargs):
     print_out(f'start_app() BEGIN')
@@ -267,5 +1355,27 @@ def start_app(*args, **kwargs):
         print_out(f'start_app() END')
 
 
+def start_standby(conn, *args, **kwargs):
+    """
+    Imports the decoder and waits for the stream configuration on ``conn``,
+    so a reopen does not pay for the start-up of a new process.
+    """
+
+    import av  # noqa
+    print_out(f'start_standby() Ready.')
+    try:
+        config = conn.recv()
+    except EOFError:
+        config = None
+    finally:
+        conn.close()
+
+    if config is None:
+        print_out(f'start_standby() Cancelled.')
+        return
+    kwargs.update(config)
+    start_app(*args, **kwargs)
+
+
 if __name__ == '__main__':
     pass
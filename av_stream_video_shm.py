@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+
+from contextlib import nullcontext
+
+from multiprocessing import shared_memory, resource_tracker
+
+RING_MAGIC = 0x46535641  # 'AVSF'
+RING_VERSION = 9
+RING_ALIGNMENT = 64
+DEFAULT_RING_SLOTS = 4
+MIN_RING_SLOTS = 2
+RING_CURSORS = 16
+MAX_SLOT_EXTRAS = 4
+
+FRAME_FORMAT_UNKNOWN = 0
+FRAME_FORMAT_CODES = {
+    'bgr24': 1,
+    'rgb24': 2,
+    'gray': 3,
+    'yuv420p': 4,
+    'nv12': 5,
+}
+FRAME_FORMAT_NAMES = {v: k for k, v in FRAME_FORMAT_CODES.items()}
+
+RING_HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('slot_count', '<u4'),
+    ('server_state', '<u4'),
+    ('slot_bytes', '<u8'),
+    ('write_seq', '<u8'),
+    ('refresh_flag', '<u4'),
+    ('batch_size', '<u4'),  # The capacity of a slot in frames. (1 means a single frame)
+    ('encoded_bytes', '<u8'),  # The capacity of the encoded image of a slot. (0 means disabled)
+    ('heartbeat', '<f8'),  # The monotonic time of the last decoded frame.
+    ('decimate_every_n', '<u4'),  # The writer outputs every n-th decoded frame. (set by the hub)
+    ('reserved0', '<u4'),
+])
+
+CURSOR_DTYPE = np.dtype([
+    ('active', '<u4'),
+    ('reserved0', '<u4'),
+    ('read_seq', '<u8'),  # The last sequence number taken by the subscriber. Its slot is not overwritten.
+])
+
+SLOT_HEADER_DTYPE = np.dtype([
+    ('seq', '<u8'),  # 0 means 'empty or being written'.
+    ('pts', '<i8'),
+    ('index', '<i8'),
+    ('timestamp', '<f8'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),  # 0 means a 2-dimensional image.
+    ('format', '<u4'),
+    ('encoded_size', '<u8'),  # 0 means no encoded image.
+    ('frame_seq', '<u8'),  # The decoded frame. A frame published again keeps its number.
+    ('count', '<u4'),  # The number of frames of a batch. (0 means a single frame)
+    ('extra_count', '<u4'),  # The number of extra images stored after the image.
+    ('capture_time', '<f8'),  # The estimated wall-clock time of the capture.
+])
+
+SLOT_EXTRA_DTYPE = np.dtype([
+    ('offset', '<u8'),  # From the start of the slot data.
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('format', '<u4'),
+])
+
+BATCH_META_DTYPE = np.dtype([
+    ('frame_seq', '<u8'),
+    ('pts', '<i8'),
+    ('index', '<i8'),
+    ('timestamp', '<f8'),
+    ('capture_time', '<f8'),
+])
+
+
+def shared_view(shape, dtype, buffer, offset=0):
+    """
+    Same as ``np.ndarray(shape, dtype, buffer=buffer, offset=offset)``,
+    but the view keeps the buffer exported, so closing the shared memory can not unmap it under the view.
+    """
+
+    count = int(np.prod(shape))
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+
+def align_size(size: int, alignment=RING_ALIGNMENT):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def calc_header_size():
+    return align_size(RING_HEADER_DTYPE.itemsize) + align_size(CURSOR_DTYPE.itemsize * RING_CURSORS)
+
+
+def calc_batch_meta_size(batch_size: int):
+    return align_size(BATCH_META_DTYPE.itemsize * batch_size) if batch_size > 1 else 0
+
+
+def calc_slot_bytes(image_bytes: int, extra_bytes=()):
+    """
+    The slot size for an image and the extra images stored after it.
+    """
+
+    if not extra_bytes:
+        return image_bytes
+    return align_size(image_bytes) + sum(align_size(size) for size in extra_bytes)
+
+
+def calc_ring_size(slot_count: int, slot_bytes: int, encoded_bytes=0, batch_size=1):
+    slot_header_size = align_size(SLOT_HEADER_DTYPE.itemsize + SLOT_EXTRA_DTYPE.itemsize * MAX_SLOT_EXTRAS)
+    slot_data_size = align_size(slot_bytes) + align_size(encoded_bytes) + calc_batch_meta_size(batch_size)
+    return calc_header_size() + (slot_header_size + slot_data_size) * slot_count
+
+
+class RingFullException(ValueError):
+    pass
+
+
+class RingHeaderValue:
+    """
+    Exposes a field of the ring header through the ``Synchronized`` interface,
+    so processes that do not share a parent can still exchange the server flags.
+    An aligned header word is read and written as a whole, so no lock is needed.
+    """
+
+    def __init__(self, ring, field: str, value_type=int):
+        self.ring = ring
+        self.field = field
+        self.value_type = value_type
+
+    def get_lock(self):
+        return nullcontext()
+
+    @property
+    def value(self):
+        return self.value_type(self.ring.header[self.field])
+
+    @value.setter
+    def value(self, value):
+        self.ring.header[self.field] = value
+
+
+class SharedFrameRing:
+    """
+    A fixed ring of preallocated frame slots in shared memory.
+
+    There is exactly one writer (the server process) and any number of readers.
+    The writer publishes a slot by storing its sequence number last,
+    so a reader can detect a slot that was overwritten while it was being copied.
+
+    Each subscriber holds the frame of its cursor: the writer reuses the slot of the oldest frame
+    that no active cursor has taken last, so the view of the last taken frame stays unchanged
+    until the subscriber takes the next one. Only when every slot is held, e.g. by more subscribers
+    than slots, is the oldest frame overwritten anyway. A frame therefore does not stay in a fixed slot,
+    and readers look its slot up by the sequence number.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner=False):
+        self.shm = shm
+        self.owner = owner
+
+        header_size = calc_header_size()
+        self.header = shared_view((), dtype=RING_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        if int(self.header['magic']) != RING_MAGIC:
+            raise ValueError(f'Invalid shared frame ring: {shm.name}')
+        if int(self.header['version']) != RING_VERSION:
+            # Created by a server of another release, with another layout. (e.g. a hub still running)
+            raise ValueError(f'Unsupported shared frame ring version {int(self.header["version"])}: {shm.name}')
+        self.cursors = shared_view((RING_CURSORS,), dtype=CURSOR_DTYPE, buffer=shm.buf,
+                                  offset=align_size(RING_HEADER_DTYPE.itemsize))
+
+        self.slot_count = int(self.header['slot_count'])
+        self.slot_bytes = int(self.header['slot_bytes'])
+        self.encoded_bytes = int(self.header['encoded_bytes'])
+        self.batch_size = max(int(self.header['batch_size']), 1)
+
+        slot_header_size = align_size(SLOT_HEADER_DTYPE.itemsize + SLOT_EXTRA_DTYPE.itemsize * MAX_SLOT_EXTRAS)
+        self.slot_headers = [shared_view((), dtype=SLOT_HEADER_DTYPE, buffer=shm.buf,
+                                        offset=header_size + i * slot_header_size)
+                             for i in range(self.slot_count)]
+        # The 'seq' of every slot header, as one strided array. (the first field of the header)
+        self.slot_seqs = shared_view((self.slot_count * slot_header_size // 8,), dtype='<u8', buffer=shm.buf,
+                                     offset=header_size)[::slot_header_size // 8]
+        self.pending_slot = None  # The slot of begin_write().
+        self.slot_extras = [shared_view((MAX_SLOT_EXTRAS,), dtype=SLOT_EXTRA_DTYPE, buffer=shm.buf,
+                                       offset=header_size + i * slot_header_size + SLOT_HEADER_DTYPE.itemsize)
+                            for i in range(self.slot_count)]
+        self.pending_extras = list()  # (offset, shape) of the extra images of begin_write().
+
+        data_offset = header_size + slot_header_size * self.slot_count
+        batch_meta_size = calc_batch_meta_size(self.batch_size)
+        data_stride = align_size(self.slot_bytes) + align_size(self.encoded_bytes) + batch_meta_size
+        self.slot_data = [shared_view((self.slot_bytes,), dtype=np.uint8, buffer=shm.buf,
+                                     offset=data_offset + i * data_stride)
+                          for i in range(self.slot_count)]
+        encoded_offset = data_offset + align_size(self.slot_bytes)
+        self.slot_encoded = [shared_view((self.encoded_bytes,), dtype=np.uint8, buffer=shm.buf,
+                                        offset=encoded_offset + i * data_stride)
+                             for i in range(self.slot_count)]
+        batch_meta_offset = encoded_offset + align_size(self.encoded_bytes)
+        self.slot_batch_meta = [shared_view((self.batch_size if batch_meta_size else 0,), dtype=BATCH_META_DTYPE,
+                                           buffer=shm.buf, offset=batch_meta_offset + i * data_stride)
+                                for i in range(self.slot_count)]
+
+    @classmethod
+    def create(cls, slot_count: int, slot_bytes: int, name=None, encoded_bytes=0, batch_size=1):
+        """
+        With a ``batch_size`` above 1, ``slot_bytes`` must hold the whole batch.
+        """
+
+        assert slot_count >= MIN_RING_SLOTS
+        assert slot_bytes >= 1
+        assert encoded_bytes >= 0
+        assert batch_size >= 1
+        size = calc_ring_size(slot_count, slot_bytes, encoded_bytes, batch_size)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = shared_view((), dtype=RING_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        header['version'] = RING_VERSION
+        header['slot_count'] = slot_count
+        header['slot_bytes'] = slot_bytes
+        header['encoded_bytes'] = encoded_bytes
+        header['batch_size'] = batch_size
+        header['write_seq'] = 0
+        header['server_state'] = 0
+        header['refresh_flag'] = 0
+        header['heartbeat'] = 0.0
+        header['decimate_every_n'] = 1
+        header['magic'] = RING_MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, track=True):
+        """
+        Set ``track`` to False when the creator is not our parent process.
+        Otherwise our resource tracker unlinks the ring when this process exits.
+        """
+
+        if track:
+            return cls(shared_memory.SharedMemory(name=name), owner=False)
+        try:
+            return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)  # Python 3.13+
+        except TypeError:
+            segment = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(segment._name, 'shared_memory')  # noqa
+            return cls(segment, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self.header['write_seq'])
+
+    def open_cursor(self, cursor: int):
+        self.cursors['read_seq'][cursor] = 0
+        self.cursors['active'][cursor] = 1
+
+    def close_cursor(self, cursor: int):
+        self.cursors['active'][cursor] = 0
+
+    def mark_consumed(self, seq: int, cursor=0):
+        """
+        Records the frame taken by the subscriber of ``cursor``, which the writer then keeps in its slot.
+        """
+
+        self.cursors['read_seq'][cursor] = seq
+
+    def is_consumed(self):
+        """
+        Whether any active subscriber has taken the last published frame.
+        A ring without subscribers counts as consumed.
+        """
+
+        active = self.cursors['active'] != 0
+        if not active.any():
+            return True
+        return int(self.cursors['read_seq'][active].max()) >= self.write_seq
+
+    def get_lag(self):
+        """
+        The number of published frames that the most advanced subscriber has not taken yet.
+        """
+
+        active = self.cursors['active'] != 0
+        if not active.any():
+            return 0
+        return max(self.write_seq - int(self.cursors['read_seq'][active].max()), 0)
+
+    def _slot_index(self, seq: int):
+        # Usually the slot of the plain ring order, unless the writer skipped a held slot.
+        slot_index = (seq - 1) % self.slot_count
+        if int(self.slot_seqs[slot_index]) != seq:
+            found = np.flatnonzero(self.slot_seqs == seq)
+            if len(found):
+                slot_index = int(found[0])
+        return slot_index
+
+    def _held_seqs(self):
+        active = self.cursors['active'] != 0
+        held = self.cursors['read_seq'][active]
+        return held[held > 0]
+
+    def _claim_slot(self):
+        """
+        Takes the slot of the oldest frame that no subscriber holds, and marks it as being written.
+        """
+
+        seqs = self.slot_seqs.copy()
+        for slot_index in np.argsort(seqs, kind='stable'):  # Empty slots (0) first.
+            seq = int(seqs[slot_index])
+            if seq in self._held_seqs():
+                continue
+            self.slot_seqs[slot_index] = 0
+            # A subscriber may have taken the frame just before. It marks its cursor before it checks the slot.
+            if seq == 0 or seq not in self._held_seqs():
+                return int(slot_index)
+            self.slot_seqs[slot_index] = seq
+        slot_index = int(np.argmin(seqs))  # Every slot is held.
+        self.slot_seqs[slot_index] = 0
+        return slot_index
+
+    def _slot_view(self, slot_index: int, shape):
+        size = int(np.prod(shape))
+        return self.slot_data[slot_index][:size].reshape(shape)
+
+    def begin_write(self, shape):
+        """
+        Returns a writable view of the next slot.
+        The caller fills it in place and then calls :meth:`commit_write`.
+        """
+
+        return self.begin_write_extras(shape, ())[0]
+
+    def begin_write_extras(self, shape, extra_shapes):
+        """
+        Like :meth:`begin_write`, but also returns writable views of the extra images,
+        which are stored after the image in the same slot.
+        """
+
+        shape = tuple(shape)
+        assert len(extra_shapes) <= MAX_SLOT_EXTRAS
+        extra_sizes = [int(np.prod(extra_shape)) for extra_shape in extra_shapes]
+        required = calc_slot_bytes(int(np.prod(shape)), extra_sizes)
+        if required > self.slot_bytes:
+            raise RingFullException(f'Frame {shape} (+{len(extra_shapes)} extras) '
+                                    f'does not fit in a {self.slot_bytes} bytes slot')
+        if self.pending_slot is None:
+            self.pending_slot = self._claim_slot()
+        slot_index = self.pending_slot
+
+        self.pending_extras = list()
+        extra_views = list()
+        offset = align_size(int(np.prod(shape)))
+        for extra_shape, size in zip(extra_shapes, extra_sizes):
+            self.pending_extras.append((offset, tuple(extra_shape)))
+            extra_views.append(self.slot_data[slot_index][offset:offset + size].reshape(extra_shape))
+            offset += align_size(size)
+        return self._slot_view(slot_index, shape), extra_views
+
+    def commit_write(self, shape, pts=0, index=0, frame_format=None, timestamp=None, encoded=None, frame_seq=0,
+                     batch_meta=None, extra_formats=None, capture_time=None):
+        """
+        Publishes the slot filled after :meth:`begin_write`.
+        ``encoded`` is stored next to the image if it fits in the slot, and dropped otherwise.
+
+        A batch has the shape ``(count, height, width[, channels])``
+        and ``batch_meta`` holds a ``(frame_seq, pts, index, timestamp, capture_time)`` tuple for each frame.
+        The slot header describes the last frame of the batch.
+
+        ``extra_formats`` names the format of each extra image of :meth:`begin_write_extras`.
+        """
+
+        assert self.pending_slot is not None
+        seq = self.write_seq + 1
+        slot_index = self.pending_slot
+        slot_header = self.slot_headers[slot_index]
+        encoded_size = len(encoded) if encoded else 0
+        if encoded_size > self.encoded_bytes:
+            encoded_size = 0
+        if encoded_size:
+            self.slot_encoded[slot_index][:encoded_size] = np.frombuffer(encoded, dtype=np.uint8)
+        slot_header['encoded_size'] = encoded_size
+        if batch_meta is not None:
+            assert len(batch_meta) == shape[0] <= len(self.slot_batch_meta[slot_index])
+            self.slot_batch_meta[slot_index][:len(batch_meta)] = batch_meta
+            slot_header['count'] = len(batch_meta)
+            shape = shape[1:]
+        else:
+            slot_header['count'] = 0
+        extras = self.slot_extras[slot_index]
+        for i, (offset, extra_shape) in enumerate(self.pending_extras):
+            extras[i]['offset'] = offset
+            extras[i]['height'] = extra_shape[0]
+            extras[i]['width'] = extra_shape[1]
+            extras[i]['channels'] = extra_shape[2] if len(extra_shape) >= 3 else 0
+            extra_format = extra_formats[i] if extra_formats else frame_format
+            extras[i]['format'] = FRAME_FORMAT_CODES.get(extra_format, FRAME_FORMAT_UNKNOWN)
+        slot_header['extra_count'] = len(self.pending_extras)
+        self.pending_extras = list()
+        slot_header['frame_seq'] = frame_seq
+        slot_header['pts'] = pts if pts is not None else 0
+        slot_header['index'] = index if index is not None else 0
+        slot_header['timestamp'] = timestamp if timestamp is not None else time.time()
+        slot_header['capture_time'] = capture_time if capture_time is not None else slot_header['timestamp']
+        slot_header['height'] = shape[0]
+        slot_header['width'] = shape[1]
+        slot_header['channels'] = shape[2] if len(shape) >= 3 else 0
+        slot_header['format'] = FRAME_FORMAT_CODES.get(frame_format, FRAME_FORMAT_UNKNOWN)
+        slot_header['seq'] = seq  # Publish the slot.
+        self.header['write_seq'] = seq  # Publish the ring.
+        self.pending_slot = None
+        return seq
+
+    def write(self, image: np.ndarray, pts=0, index=0, frame_format=None, timestamp=None, encoded=None,
+              frame_seq=0, batch_meta=None, extras=None, extra_formats=None, capture_time=None):
+        """
+        Copies the image and the ``extras`` images into the next slot.
+        Returns the published sequence number, or ``0`` if the images do not fit.
+        """
+
+        assert image.dtype == np.uint8
+        extras = extras or []
+        try:
+            view, extra_views = self.begin_write_extras(image.shape, [extra.shape for extra in extras])
+        except RingFullException:
+            return 0
+        np.copyto(view, image)
+        for extra_view, extra in zip(extra_views, extras):
+            np.copyto(extra_view, extra)
+        return self.commit_write(image.shape, pts, index, frame_format, timestamp, encoded, frame_seq, batch_meta,
+                                 extra_formats, capture_time)
+
+    def _slot_shape(self, slot_header):
+        height = int(slot_header['height'])
+        width = int(slot_header['width'])
+        channels = int(slot_header['channels'])
+        shape = (height, width, channels) if channels else (height, width)
+        count = int(slot_header['count'])
+        if count:
+            return (count,) + shape
+        return shape
+
+    def read_meta(self, seq: int):
+        slot_header = self.slot_headers[self._slot_index(seq)]
+        return {
+            'seq': seq,
+            'frame_seq': int(slot_header['frame_seq']),
+            'pts': int(slot_header['pts']),
+            'index': int(slot_header['index']),
+            'timestamp': float(slot_header['timestamp']),
+            'capture_time': float(slot_header['capture_time']),
+            'format': FRAME_FORMAT_NAMES.get(int(slot_header['format']), ''),
+        }
+
+    def read_batch_meta(self, seq: int):
+        """
+        Returns the metadata of each frame of the batch of ``seq``,
+        or ``None`` if the slot holds a single frame or has been overwritten.
+        """
+
+        if not self.is_valid(seq):
+            return None
+        slot_index = self._slot_index(seq)
+        count = int(self.slot_headers[slot_index]['count'])
+        if count == 0:
+            return None
+        rows = self.slot_batch_meta[slot_index][:count].copy()
+        if not self.is_valid(seq):
+            return None  # Torn copy.
+        return [{
+            'seq': int(row['frame_seq']),
+            'pts': int(row['pts']),
+            'index': int(row['index']),
+            'timestamp': float(row['timestamp']),
+            'capture_time': float(row['capture_time']),
+        } for row in rows]
+
+    def is_valid(self, seq: int):
+        """
+        Whether the slot of ``seq`` has not been overwritten yet.
+        """
+
+        if seq <= 0:
+            return False
+        return int(self.slot_headers[self._slot_index(seq)]['seq']) == seq
+
+    def read(self, seq: int, copy=False):
+        """
+        Returns the image of ``seq`` or ``None`` if the slot has been overwritten.
+
+        Without ``copy`` the result is a read-only view of the slot.
+        It stays valid while a cursor holds ``seq`` (see :meth:`mark_consumed`),
+        and otherwise until the writer needs the slot again, at least ``slot_count - 1`` frames later.
+        """
+
+        if not self.is_valid(seq):
+            return None
+        slot_index = self._slot_index(seq)
+        view = self._slot_view(slot_index, self._slot_shape(self.slot_headers[slot_index]))
+        if copy:
+            image = view.copy()
+            if not self.is_valid(seq):
+                return None  # Torn copy.
+            return image
+        view.flags.writeable = False
+        return view
+
+    def read_extras(self, seq: int, copy=False):
+        """
+        Returns the extra images of ``seq``, or ``None`` if the slot has been overwritten.
+        The views follow the same rules as :meth:`read`.
+        """
+
+        if not self.is_valid(seq):
+            return None
+        slot_index = self._slot_index(seq)
+        extra_count = int(self.slot_headers[slot_index]['extra_count'])
+        images = list()
+        for extra in self.slot_extras[slot_index][:extra_count].copy():
+            shape = (int(extra['height']), int(extra['width']))
+            if int(extra['channels']):
+                shape += (int(extra['channels']),)
+            offset = int(extra['offset'])
+            view = self.slot_data[slot_index][offset:offset + int(np.prod(shape))].reshape(shape)
+            if copy:
+                images.append(view.copy())
+            else:
+                view.flags.writeable = False
+                images.append(view)
+        if not self.is_valid(seq):
+            return None  # Torn copy.
+        return images
+
+    def read_encoded(self, seq: int):
+        """
+        Returns a copy of the encoded image of ``seq``,
+        or ``None`` if the slot has no encoded image or has been overwritten.
+        """
+
+        if not self.is_valid(seq):
+            return None
+        slot_index = self._slot_index(seq)
+        encoded_size = int(self.slot_headers[slot_index]['encoded_size'])
+        if encoded_size == 0:
+            return None
+        encoded = self.slot_encoded[slot_index][:encoded_size].tobytes()
+        if not self.is_valid(seq):
+            return None  # Torn copy.
+        return encoded
+
+    def read_latest(self, last_seq=0, copy=False, cursor=None):
+        """
+        Returns ``(seq, image)`` of the most recently published frame,
+        or ``(last_seq, None)`` if nothing newer than ``last_seq`` exists.
+        With a ``cursor``, the frame is marked as consumed before its slot is checked,
+        so the writer can not take the slot between the check and the mark.
+        """
+
+        while True:
+            seq = self.write_seq
+            if seq == 0 or seq == last_seq:
+                return last_seq, None
+            if cursor is not None:
+                self.mark_consumed(seq, cursor)
+            image = self.read(seq, copy=copy)
+            if image is not None:
+                return seq, image
+            # The writer lapped us while reading; try again with the newer frame.
+
+    def close(self):
+        self.header = None
+        self.cursors = None
+        self.slot_headers = []
+        self.slot_seqs = None
+        self.slot_extras = []
+        self.slot_data = []
+        self.slot_encoded = []
+        self.slot_batch_meta = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views are still exported to the consumer.
+            # The mapping is released when the last view is garbage collected,
+            # so don't let SharedMemory.__del__() try to close it again.
+            self.shm._buf = None  # noqa
+            self.shm._mmap = None  # noqa
+
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import threading
+import numpy as np
+
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LOGGING_PREFIX = '[av.stream_video.stats] '
+LOGGING_SUFFIX = '\n'
+
+STATS_PUBLISH_INTERVAL = 0.5
+STATS_HTTP_HOST = '127.0.0.1'
+STATS_HTTP_PATH = '/metrics'
+PROMETHEUS_PREFIX = 'av_stream_video_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STATS_DECODED_FRAMES = 'decoded_frames'
+STATS_CONVERTED_FRAMES = 'converted_frames'
+STATS_DROPPED_FRAMES = 'dropped_frames'
+STATS_PUSHED_FRAMES = 'pushed_frames'
+STATS_OVERWRITTEN_FRAMES = 'overwritten_frames'  # Pushed before the consumer took the previous one.
+STATS_STATIC_FRAMES = 'static_frames'  # Held back by the motion gate.
+STATS_OPENS = 'opens'
+STATS_OPEN_FAILURES = 'open_failures'
+STATS_READ_ERRORS = 'read_errors'
+STATS_COUNTERS = [
+    STATS_DECODED_FRAMES,
+    STATS_CONVERTED_FRAMES,
+    STATS_DROPPED_FRAMES,
+    STATS_PUSHED_FRAMES,
+    STATS_OVERWRITTEN_FRAMES,
+    STATS_STATIC_FRAMES,
+    STATS_OPENS,
+    STATS_OPEN_FAILURES,
+    STATS_READ_ERRORS,
+]
+
+STATS_CONNECT_SECONDS = 'connect_seconds'
+STATS_FIRST_FRAME_SECONDS = 'first_frame_seconds'
+STATS_QUEUE_OCCUPANCY = 'queue_occupancy'
+STATS_GAUGES = [
+    STATS_CONNECT_SECONDS,
+    STATS_FIRST_FRAME_SECONDS,
+    STATS_QUEUE_OCCUPANCY,
+]
+
+STATS_DEMUX_SECONDS = 'demux_seconds'
+STATS_DECODE_SECONDS = 'decode_seconds'
+STATS_CONVERT_SECONDS = 'convert_seconds'
+STATS_ENCODE_SECONDS = 'encode_seconds'
+STATS_PUSH_SECONDS = 'push_seconds'
+STATS_PTS_DELAY_SECONDS = 'pts_delay_seconds'  # Relative to the fastest frame since the last open.
+STATS_DELIVERY_SECONDS = 'delivery_seconds'  # From the decoding to the consumer. (measured by the lambda)
+STATS_HISTOGRAMS = [
+    STATS_DEMUX_SECONDS,
+    STATS_DECODE_SECONDS,
+    STATS_CONVERT_SECONDS,
+    STATS_ENCODE_SECONDS,
+    STATS_PUSH_SECONDS,
+    STATS_PTS_DELAY_SECONDS,
+    STATS_DELIVERY_SECONDS,
+]
+
+HISTOGRAM_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+HISTOGRAM_SIZE = 2 + len(HISTOGRAM_BUCKETS) + 1  # count, sum, buckets and +Inf
+
+
+def _build_offsets():
+    offsets = dict()
+    offset = 0
+    for name in STATS_COUNTERS + STATS_GAUGES:
+        offsets[name] = offset
+        offset += 1
+    for name in STATS_HISTOGRAMS:
+        offsets[name] = offset
+        offset += HISTOGRAM_SIZE
+    return offsets, offset
+
+
+STATS_OFFSETS, STATS_SIZE = _build_offsets()
+
+
+def print_out(message):
+    sys.stdout.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stdout.flush()
+
+
+def print_error(message):
+    sys.stderr.write(LOGGING_PREFIX + message + LOGGING_SUFFIX)
+    sys.stderr.flush()
+
+
+def read_stats(shared):
+    """
+    Copies a shared ``Array(c_double, STATS_SIZE)``.
+    """
+
+    with shared.get_lock():
+        return np.array(shared[:], dtype=np.float64)
+
+
+class PipelineStats:
+    """
+    Counters, gauges and histograms of the decode pipeline.
+
+    The hot loop only updates a local array.
+    :meth:`publish` copies it to the shared array at most every ``STATS_PUBLISH_INTERVAL`` seconds.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        if shared is not None:
+            # Continue the counters of the previous server process.
+            self.values = read_stats(shared)
+        else:
+            self.values = np.zeros(STATS_SIZE, dtype=np.float64)
+        self.publish_time = 0.0
+
+    def count(self, name: str, n=1):
+        self.values[STATS_OFFSETS[name]] += n
+
+    def set(self, name: str, value: float):
+        self.values[STATS_OFFSETS[name]] = value
+
+    def observe(self, name: str, seconds: float):
+        offset = STATS_OFFSETS[name]
+        self.values[offset] += 1
+        self.values[offset + 1] += seconds
+        self.values[offset + 2 + bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+
+    def publish(self, force=False):
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.publish_time < STATS_PUBLISH_INTERVAL:
+            return
+        self.publish_time = now
+        with self.shared.get_lock():
+            self.shared[:] = self.values.tolist()
+
+
+def stats_to_dict(values: np.ndarray):
+    result = dict()
+    for name in STATS_COUNTERS + STATS_GAUGES:
+        result[name] = float(values[STATS_OFFSETS[name]])
+    for name in STATS_HISTOGRAMS:
+        offset = STATS_OFFSETS[name]
+        count = int(values[offset])
+        total = float(values[offset + 1])
+        result[name] = {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else 0.0,
+            'buckets': {str(le): int(n) for le, n in zip(HISTOGRAM_BUCKETS + ('+Inf',), values[offset + 2:])},
+        }
+    return result
+
+
+def stats_to_prometheus(values: np.ndarray, labels: dict):
+    label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    lines = list()
+    for name in STATS_COUNTERS:
+        metric = f'{PROMETHEUS_PREFIX}{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric}{{{label_text}}} {values[STATS_OFFSETS[name]]:g}')
+    for name in STATS_GAUGES:
+        metric = f'{PROMETHEUS_PREFIX}{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric}{{{label_text}}} {values[STATS_OFFSETS[name]]:g}')
+    for name in STATS_HISTOGRAMS:
+        metric = f'{PROMETHEUS_PREFIX}{name}'
+        offset = STATS_OFFSETS[name]
+        lines.append(f'# TYPE {metric} histogram')
+        cumulative = 0
+        for le, n in zip(HISTOGRAM_BUCKETS + ('+Inf',), values[offset + 2:]):
+            cumulative += int(n)
+            separator = ',' if label_text else ''
+            lines.append(f'{metric}_bucket{{{label_text}{separator}le="{le}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{label_text}}} {values[offset + 1]:g}')
+        lines.append(f'{metric}_count{{{label_text}}} {int(values[offset])}')
+    return '\n'.join(lines) + '\n'
+
+
+class StatsHttpServer:
+    """
+    Serves ``get_text()`` at ``STATS_HTTP_PATH`` on a local port, in the Prometheus text format.
+    """
+
+    def __init__(self, port: int, get_text, host=STATS_HTTP_HOST):
+        self.port = port
+        self.host = host
+        self.get_text = get_text
+        self.server: ThreadingHTTPServer = None  # noqa
+        self.thread: threading.Thread = None  # noqa
+
+    def _create_handler(self):
+        get_text = self.get_text
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa
+                if self.path.split('?')[0] != STATS_HTTP_PATH:
+                    self.send_error(404)
+                    return
+                try:
+                    body = get_text().encode('utf-8')
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes are too frequent to log.
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), self._create_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stats-http', daemon=True)
+        self.thread.start()
+        print_out(f'StatsHttpServer.start() http://{self.host}:{self.server.server_port}{STATS_HTTP_PATH}')
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.thread = None
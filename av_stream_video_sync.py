@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from bisect import bisect_left
+from collections import deque
+
+from av_stream_video_stats import HISTOGRAM_BUCKETS
+
+CAPTURE_CLOCK_AUTO = 'auto'  # The RTCP sender reports of the source, and the pts until they arrive.
+CAPTURE_CLOCK_PTS = 'pts'  # The pts, anchored to the wall clock by the fastest frame since the open.
+CAPTURE_CLOCK_ARRIVAL = 'arrival'  # The wall-clock time of the decoding.
+CAPTURE_CLOCK_LIST = [CAPTURE_CLOCK_AUTO, CAPTURE_CLOCK_PTS, CAPTURE_CLOCK_ARRIVAL]
+
+# A frame anchored this much later than the fastest one is a jump of the pts (a loop or a seek), not a delay.
+CAPTURE_RESYNC_SECONDS = 2.0
+
+DEFAULT_SYNC_TOLERANCE = 0.02  # Seconds between the first and the last frame of a set.
+DEFAULT_SYNC_WINDOW = 1.0  # Seconds of frames kept for each stream.
+DEFAULT_SYNC_MAX_WAIT = 0.1
+SKEW_HISTORY_SIZE = 256  # The recent sets the skew percentiles are computed from.
+
+
+class CaptureClock:
+    """
+    Estimates the wall-clock time at which each frame was captured, so that frames of different sources compare.
+
+    - ``auto``: ``start_time_realtime`` of the container, which FFmpeg sets from the NTP time of the first
+      RTCP sender report of an RTSP source, plus the pts. Sources without sender reports fall back to ``pts``.
+    - ``pts``: The pts, anchored to the wall clock by the frame that arrived the fastest since the open.
+      The transport delay of that frame is unknown, so sources differ by their smallest delay.
+    - ``arrival``: The decode time, for sources without usable pts.
+    """
+
+    def __init__(self, mode=CAPTURE_CLOCK_AUTO):
+        assert mode in CAPTURE_CLOCK_LIST
+        self.mode = mode
+        self.container = None
+        self.ntp_origin = None  # The wall-clock time of pts 0, from the RTCP sender reports.
+        self.pts_anchor = None  # The smallest (wall-clock - pts).
+
+    def reset(self, container=None):
+        self.container = container
+        self.ntp_origin = None
+        self.pts_anchor = None
+
+    def _read_ntp_origin(self):
+        # Unknown until the first sender report has arrived, which is usually after the first frames.
+        realtime = getattr(self.container, 'start_time_realtime', None)
+        if not realtime or realtime < 0:
+            return None
+        return realtime / 1000000.0
+
+    def capture_time(self, frame, decoded_time: float):
+        if self.mode == CAPTURE_CLOCK_ARRIVAL or frame.time is None:
+            return decoded_time
+        if self.mode == CAPTURE_CLOCK_AUTO and self.container is not None:
+            if self.ntp_origin is None:
+                self.ntp_origin = self._read_ntp_origin()
+            if self.ntp_origin is not None:
+                return self.ntp_origin + frame.time
+        anchor = decoded_time - frame.time
+        if self.pts_anchor is None \
+                or anchor < self.pts_anchor \
+                or anchor - self.pts_anchor > CAPTURE_RESYNC_SECONDS:
+            self.pts_anchor = anchor
+        return self.pts_anchor + frame.time
+
+
+class SyncEntry:
+    __slots__ = ('capture_time', 'image', 'meta', 'token')
+
+    def __init__(self, capture_time: float, image, meta: dict, token):
+        self.capture_time = capture_time
+        self.image = image
+        self.meta = meta
+        self.token = token  # Tells is_valid() where the image lives.
+
+
+class SkewStats:
+    """
+    The skew of the emitted sets, i.e. the capture time between their first and last frame,
+    and the offset of each stream from the mean capture time of its sets.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.sets = 0
+        self.incomplete = 0  # Waits that ended without a set.
+        self.skew_sum = 0.0
+        self.skew_max = 0.0
+        self.skew_buckets = np.zeros(len(HISTOGRAM_BUCKETS) + 1, dtype=np.int64)
+        self.recent_skews = deque(maxlen=SKEW_HISTORY_SIZE)
+        self.matched = [0] * count
+        self.unmatched = [0] * count  # Passed over, or fell out of the window, without a match.
+        self.overrun = [0] * count  # Overwritten in the ring before a match.
+        self.offset_sum = [0.0] * count
+        self.offset_max = [0.0] * count  # The largest absolute offset.
+
+    def observe(self, times: list):
+        skew = max(times) - min(times)
+        mean = sum(times) / len(times)
+        self.sets += 1
+        self.skew_sum += skew
+        self.skew_max = max(self.skew_max, skew)
+        self.skew_buckets[bisect_left(HISTOGRAM_BUCKETS, skew)] += 1
+        self.recent_skews.append(skew)
+        for i, t in enumerate(times):
+            self.matched[i] += 1
+            self.offset_sum[i] += t - mean
+            self.offset_max[i] = max(self.offset_max[i], abs(t - mean))
+        return skew
+
+    def to_dict(self):
+        recent = np.array(self.recent_skews) if self.recent_skews else np.zeros(1)
+        return {
+            'sets': self.sets,
+            'incomplete': self.incomplete,
+            'skew_seconds': {
+                'count': self.sets,
+                'sum': self.skew_sum,
+                'mean': self.skew_sum / self.sets if self.sets else 0.0,
+                'max': self.skew_max,
+                'p50': float(np.percentile(recent, 50)),
+                'p95': float(np.percentile(recent, 95)),
+                'buckets': {str(le): int(n) for le, n in zip(HISTOGRAM_BUCKETS + ('+Inf',), self.skew_buckets)},
+            },
+            'streams': [{
+                'matched': self.matched[i],
+                'unmatched': self.unmatched[i],
+                'overrun': self.overrun[i],
+                'mean_offset_seconds': self.offset_sum[i] / self.matched[i] if self.matched[i] else 0.0,
+                'max_offset_seconds': self.offset_max[i],
+            } for i in range(self.count)],
+        }
+
+
+class FrameSynchronizer:
+    """
+    Matches the frames of several streams by their capture time.
+
+    Each stream has a window of its recent frames, oldest first. The entries refer to the images where they are,
+    e.g. in a slot of the shared memory ring, so nothing is copied.
+    ``is_valid(stream, token)`` tells whether an image is still there. Overwritten entries are dropped.
+
+    The frame of the stream whose oldest frame is the newest is the pivot of the next set.
+    Older frames of the other streams can never be within ``tolerance`` of it, and are passed over.
+    Each stream then contributes its frame nearest to the pivot. A set is emitted once no stream can have a nearer
+    frame anymore, i.e. each one has a frame at or after the pivot, or when the caller gives up waiting.
+    The frames of an emitted set, and all frames before them, leave the windows.
+    """
+
+    def __init__(self, count: int, tolerance=DEFAULT_SYNC_TOLERANCE, window=DEFAULT_SYNC_WINDOW, is_valid=None):
+        assert count > 0
+        assert tolerance >= 0
+        assert window > 0
+        self.count = count
+        self.tolerance = tolerance
+        self.window = window
+        self.is_valid = is_valid
+        self.windows = [deque() for _ in range(count)]
+        self.stats = SkewStats(count)
+
+    def add(self, stream: int, capture_time: float, image, meta: dict, token=None):
+        entries = self.windows[stream]
+        if entries and capture_time == entries[-1].capture_time:
+            return  # The same frame pushed again.
+        if entries and capture_time < entries[-1].capture_time:
+            # The source has restarted, e.g. after a reconnect or a loop. The old frames can not match anymore.
+            self._pass_over(stream, len(entries))
+        entries.append(SyncEntry(capture_time, image, meta, token))
+        while capture_time - entries[0].capture_time > self.window:
+            self._pass_over(stream, 1)
+
+    def clear(self, stream: int):
+        self.windows[stream].clear()
+
+    def _pass_over(self, stream: int, n: int):
+        for _ in range(n):
+            self.windows[stream].popleft()
+            self.stats.unmatched[stream] += 1
+
+    def _drop_overwritten(self):
+        if self.is_valid is None:
+            return
+        for stream, entries in enumerate(self.windows):
+            # The ring is overwritten in order, so only the oldest entries can be gone.
+            while entries and not self.is_valid(stream, entries[0].token):
+                entries.popleft()
+                self.stats.overrun[stream] += 1
+
+    def _nearest(self, entries: deque, pivot: float):
+        best = 0
+        for i in range(1, len(entries)):
+            if abs(entries[i].capture_time - pivot) >= abs(entries[best].capture_time - pivot):
+                break  # The capture times only increase.
+            best = i
+        return best
+
+    @staticmethod
+    def _latest_until(entries: deque, pivot: float):
+        best = 0
+        for i in range(1, len(entries)):
+            if entries[i].capture_time > pivot:
+                break
+            best = i
+        return best
+
+    def match(self, final=False):
+        """
+        Returns the entries of the next set, one per stream, or ``None`` if there is none yet.
+        With ``final``, a set is emitted without waiting for nearer frames.
+        """
+
+        self._drop_overwritten()
+        while True:
+            if not all(self.windows):
+                return None
+            pivot = max(entries[0].capture_time for entries in self.windows)
+            for stream, entries in enumerate(self.windows):
+                while entries and entries[0].capture_time < pivot - self.tolerance:
+                    self._pass_over(stream, 1)
+            if all(self.windows):
+                break
+        # Every oldest frame is now within the tolerance before the pivot.
+
+        if not final and any(entries[-1].capture_time < pivot for entries in self.windows):
+            return None  # A nearer frame may still arrive.
+        chosen = [self._nearest(entries, pivot) for entries in self.windows]
+        times = [entries[i].capture_time for entries, i in zip(self.windows, chosen)]
+        if max(times) - min(times) > self.tolerance:
+            # The nearest frames are on both sides of the pivot. The latest ones before it are all within the tolerance.
+            chosen = [self._latest_until(entries, pivot) for entries in self.windows]
+
+        result = list()
+        for stream, (entries, i) in enumerate(zip(self.windows, chosen)):
+            self._pass_over(stream, i)
+            result.append(entries.popleft())
+        self.stats.observe([entry.capture_time for entry in result])
+        return result
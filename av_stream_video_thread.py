@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+from collections import deque
+from contextlib import nullcontext
+from queue import Empty, Full, SimpleQueue
+
+NULL_LOCK = nullcontext()
+
+
+class ThreadValue:
+    """
+    Stands in for a ``multiprocessing.Value`` shared between threads.
+    Reading or assigning an attribute is atomic under the GIL, so no lock is taken.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    @staticmethod
+    def get_lock():
+        return NULL_LOCK
+
+
+class FrameSlot:
+    """
+    Hands the newest frames from the server thread to the consumer without pickling or copying.
+
+    It has the subset of the ``multiprocessing.Queue`` interface the server and the lambda use.
+    ``deque.append()`` and ``deque.popleft()`` are atomic, so the items are not locked.
+    The event only wakes up a consumer waiting in ``get()``.
+    """
+
+    def __init__(self, maxsize=1):
+        assert maxsize >= 1
+        self.maxsize = maxsize
+        self.items = deque()
+        self.ready = threading.Event()
+
+    def put_nowait(self, item):
+        if len(self.items) >= self.maxsize:
+            raise Full
+        self.items.append(item)
+        self.ready.set()
+
+    def get_nowait(self):
+        try:
+            item = self.items.popleft()
+        except IndexError:
+            raise Empty
+        if not self.items:
+            self.ready.clear()
+            if self.items:
+                self.ready.set()  # Appended between popleft() and clear().
+        return item
+
+    def get(self, timeout=None):
+        if not self.ready.wait(timeout):
+            raise Empty
+        return self.get_nowait()
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+    def close(self):
+        self.items.clear()
+
+    def cancel_join_thread(self):
+        pass
+
+
+def new_command_queue():
+    return SimpleQueue()
+
+
+class ServerThread:
+    """
+    Runs a server on a daemon thread, with the part of the ``multiprocessing.Process`` interface the lambda uses.
+    A thread cannot be killed, so one stuck in a blocking call is left behind when it does not exit in time.
+    """
+
+    def __init__(self, target, args=(), kwargs=None):
+        self.thread = threading.Thread(target=target, args=args, kwargs=kwargs or {}, name='stream-video', daemon=True)
+        self.pid = os.getpid()
+        self.exitcode = None
+
+    def start(self):
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.exitcode = 0
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+DEFAULT_STALL_SECONDS = 5.0
+DEFAULT_RECONNECT_SECONDS = 10.0
+DEFAULT_RESPAWN_SECONDS = 30.0
+DEFAULT_RECONNECT_MAX_SLEEP = 30.0
+BACKOFF_JITTER_RATIO = 0.5
+
+WATCHDOG_OK = 0
+WATCHDOG_STALLED = 1
+WATCHDOG_RECONNECT = 2
+WATCHDOG_RESPAWN = 3
+WATCHDOG_NAMES = {
+    WATCHDOG_OK: 'ok',
+    WATCHDOG_STALLED: 'stalled',
+    WATCHDOG_RECONNECT: 'reconnect',
+    WATCHDOG_RESPAWN: 'respawn',
+}
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter.
+
+    The delay doubles with every attempt up to ``max_delay``,
+    and a random part of it is dropped, so cameras that failed together do not retry together.
+    """
+
+    def __init__(self, base_delay: float, max_delay=DEFAULT_RECONNECT_MAX_SLEEP, jitter=BACKOFF_JITTER_RATIO):
+        self.base_delay = base_delay
+        self.max_delay = max(max_delay, base_delay)
+        self.jitter = jitter
+        self.attempts = 0
+
+    def reset(self):
+        self.attempts = 0
+
+    def next_delay(self):
+        if self.base_delay <= 0:
+            return 0.0
+        delay = min(self.base_delay * (2 ** min(self.attempts, 32)), self.max_delay)
+        self.attempts += 1
+        return delay * (1.0 - self.jitter * random.random())
+
+
+class StallWatchdog:
+    """
+    Escalates on the time since the server last decoded a frame,
+    regardless of how often the consumer polls.
+
+    Each level is reported once when it is reached. ``reset()`` starts over. (e.g. after a respawn)
+    """
+
+    def __init__(self,
+                 stall_seconds=DEFAULT_STALL_SECONDS,
+                 reconnect_seconds=DEFAULT_RECONNECT_SECONDS,
+                 respawn_seconds=DEFAULT_RESPAWN_SECONDS):
+        self.thresholds = [
+            (WATCHDOG_RESPAWN, respawn_seconds),
+            (WATCHDOG_RECONNECT, reconnect_seconds),
+            (WATCHDOG_STALLED, stall_seconds),
+        ]
+        self.origin = 0.0
+        self.level = WATCHDOG_OK
+        self.idle_seconds = 0.0
+
+    @property
+    def stalled(self):
+        return self.level != WATCHDOG_OK
+
+    def reset(self, now: float):
+        self.origin = now
+        self.level = WATCHDOG_OK
+        self.idle_seconds = 0.0
+
+    def check(self, heartbeat: float, now: float):
+        """
+        Returns the level reached since the last call, or ``WATCHDOG_OK``.
+        """
+
+        self.idle_seconds = now - max(heartbeat, self.origin)
+        level = WATCHDOG_OK
+        for candidate, seconds in self.thresholds:
+            if seconds > 0 and self.idle_seconds >= seconds:
+                level = candidate
+                break
+
+        if level <= self.level:
+            if level == WATCHDOG_OK:
+                self.level = WATCHDOG_OK  # Recovered.
+            return WATCHDOG_OK
+        self.level = level
+        return level
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+# The modules live in the root of the repository, next to the lambda.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def video_file(tmp_path_factory):
+    """
+    A 2 second clip of 64x48 at 30 fps, with a keyframe every 10 frames.
+    """
+
+    av = pytest.importorskip('av')
+    import numpy as np
+    path = str(tmp_path_factory.mktemp('video') / 'clip.mp4')
+    with av.open(path, 'w') as container:
+        stream = container.add_stream('mpeg4', rate=30)
+        stream.width = 64
+        stream.height = 48
+        stream.pix_fmt = 'yuv420p'
+        stream.codec_context.gop_size = 10
+        for i in range(60):
+            image = np.full((48, 64, 3), i * 4, dtype=np.uint8)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(image, format='rgb24')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
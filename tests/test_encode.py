@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import numpy as np
+import pytest
+
+import av_stream_video_encode as enc
+
+av = pytest.importorskip('av')
+
+JPEG_MAGIC = b'\xff\xd8'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+
+@pytest.mark.parametrize('quality, expected', [
+    (100, enc.MIN_JPEG_QSCALE),
+    (1, enc.MAX_JPEG_QSCALE),
+    (0, enc.MAX_JPEG_QSCALE),
+    (200, enc.MIN_JPEG_QSCALE),
+])
+def test_quality_to_qscale(quality, expected):
+    assert enc.quality_to_qscale(quality) == expected
+
+
+def test_calc_encoded_bytes():
+    assert enc.calc_encoded_bytes(1000, enc.FRAME_ENCODING_NONE) == 0
+    assert enc.calc_encoded_bytes(1000, enc.FRAME_ENCODING_JPEG) == 500
+    assert enc.calc_encoded_bytes(64000, enc.FRAME_ENCODING_PNG) > 64000
+
+
+@pytest.mark.parametrize('encoding, frame_format, magic', [
+    (enc.FRAME_ENCODING_JPEG, 'bgr24', JPEG_MAGIC),
+    (enc.FRAME_ENCODING_PNG, 'bgr24', PNG_MAGIC),
+    (enc.FRAME_ENCODING_PNG, 'gray', PNG_MAGIC),
+])
+def test_encode(encoding, frame_format, magic):
+    encoder = enc.FrameEncoder(encoding)
+    shape = (16, 32, 3) if frame_format == 'bgr24' else (16, 32)
+    data = encoder.encode(np.full(shape, 100, dtype=np.uint8), frame_format)
+    assert data.startswith(magic)
+    assert encoder.mime == enc.FRAME_ENCODING_MIMES[encoding]
+
+
+def test_encode_reopens_for_new_size():
+    encoder = enc.FrameEncoder(enc.FRAME_ENCODING_JPEG)
+    encoder.encode(np.zeros((16, 32, 3), dtype=np.uint8), 'bgr24')
+    context = encoder.context
+    encoder.encode(np.zeros((16, 32, 3), dtype=np.uint8), 'bgr24')
+    assert encoder.context is context
+    assert encoder.encode(np.zeros((32, 16, 3), dtype=np.uint8), 'bgr24').startswith(JPEG_MAGIC)
+    assert encoder.size == (16, 32)
+    assert encoder.encoded_count == 3
+
+
+def test_png_is_lossless():
+    image = np.random.default_rng(0).integers(0, 256, (8, 16, 3), dtype=np.uint8)
+    data = enc.FrameEncoder(enc.FRAME_ENCODING_PNG).encode(image, 'rgb24')
+    with av.open(io.BytesIO(data)) as container:
+        frame = next(container.decode(video=0))
+    assert (frame.to_ndarray(format='rgb24') == image).all()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+import av_stream_video_hub as hub
+
+
+# A source that never opens. The hub keeps reconnecting it, without decoding a frame.
+STREAM_KWARGS = {
+    'video_src': '/nonexistent/stream.mp4',
+    'frame_width': 32,
+    'frame_height': 24,
+    'frame_format': 'bgr24',
+    'reconnect_sleep': 0.05,
+}
+
+
+@pytest.fixture
+def address(tmp_path):
+    return str(tmp_path / 'hub' / 'hub.sock')
+
+
+@pytest.fixture
+def running_hub(address):
+    server = hub.StreamVideoHub(address, idle_timeout=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = hub.StreamVideoHubClient(address)
+    assert client.connect(spawn=False, timeout=5.0)
+    yield server, client
+    client.close()
+    server.done = True
+    server._wake_up()
+    thread.join(timeout=5.0)
+
+
+def test_default_address_is_per_user():
+    assert os.path.dirname(hub.DEFAULT_HUB_ADDRESS) == hub.DEFAULT_HUB_DIR
+    if not os.environ.get('XDG_RUNTIME_DIR'):
+        assert str(os.getuid()) in hub.DEFAULT_HUB_DIR
+
+
+def test_load_authkey(address):
+    key = hub.load_authkey(address)
+    assert len(key) == hub.AUTHKEY_BYTES
+    assert hub.load_authkey(address) == key  # Shared by every lambda of the user.
+    assert os.stat(os.path.dirname(address)).st_mode & 0o777 == 0o700
+    assert os.stat(address + hub.AUTHKEY_SUFFIX).st_mode & 0o777 == 0o600
+    assert os.listdir(os.path.dirname(address)) == [os.path.basename(address) + hub.AUTHKEY_SUFFIX]
+
+
+def test_authkey_readable_by_others(address):
+    hub.load_authkey(address)
+    os.chmod(address + hub.AUTHKEY_SUFFIX, 0o644)
+    with pytest.raises(PermissionError):
+        hub.load_authkey(address)
+
+
+def test_address_writable_by_others(address):
+    os.makedirs(os.path.dirname(address))
+    os.chmod(os.path.dirname(address), 0o777)
+    with pytest.raises(PermissionError):
+        hub.load_authkey(address)
+
+
+def test_check_owner(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    hub.check_owner(path, 0)
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        hub.check_owner(path, 0)
+
+
+def test_hub_requires_authkey(running_hub, address):
+    server, client = running_hub
+    with pytest.raises(AuthenticationError):
+        Client(address, family='AF_UNIX', authkey=b'wrong')
+    assert server.listener is not None and not server.done
+
+    with pytest.raises(hub.HubAttachError):
+        client.get_stats()  # Authenticated, but not subscribed to a stream.
+
+
+def test_address_in_sticky_directory(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    os.chmod(directory, 0o1777)
+    assert len(hub.load_authkey(str(directory / 'hub.sock'))) == hub.AUTHKEY_BYTES
+
+
+def test_fingerprint_follows_stream_keys():
+    key = hub.stream_fingerprint(STREAM_KWARGS)
+    # The merged props and the props of the lambda do not split a stream.
+    assert hub.stream_fingerprint(dict(STREAM_KWARGS, target_fps=5.0, motion_gate='diff', verbose=True)) == key
+    assert hub.stream_fingerprint(dict(STREAM_KWARGS, frame_width=64)) != key
+    assert hub.stream_fingerprint(dict(STREAM_KWARGS, frame_crop='0,0,16,16')) != key
+    assert hub.stream_fingerprint(dict(STREAM_KWARGS, batch_size=4)) != key
+
+
+@pytest.mark.parametrize('configs, expected', [
+    ([{'target_fps': 5.0}, {'target_fps': 10.0}], {'target_fps': 10.0}),
+    ([{'target_fps': 5.0}, {}], {'target_fps': 0.0}),  # One subscriber wants every frame.
+    ([{'decimate_every_n': 4}, {'decimate_every_n': 6}], {'decimate_every_n': 2}),
+    ([{'record_buffer_seconds': 5.0}, {'record_buffer_seconds': 20.0}], {'record_buffer_seconds': 20.0}),
+    ([{'motion_gate': 'diff', 'motion_threshold': 3.0}, {'motion_gate': 'diff', 'motion_threshold': 2.0}],
+     {'motion_gate': 'diff', 'motion_threshold': 2.0}),
+    ([{'motion_gate': 'diff'}, {'motion_gate': 'block'}], {'motion_gate': 'none'}),
+])
+def test_merge_subscriber_kwargs(configs, expected):
+    merged = hub.merge_subscriber_kwargs(configs)
+    assert set(merged) == set(hub.HUB_MERGED_KEYS)
+    assert {key: merged[key] for key in expected} == expected
+
+
+def test_pacer_decimates_by_frame_seq():
+    pacer = hub.SubscriberPacer(decimate_every_n=4)
+    # The stream already drops every other frame, so every 2nd frame of the ring is taken.
+    assert [pacer.accept(seq, 0.0, 2) for seq in range(1, 7)] == [True, False, True, False, True, False]
+
+
+def test_pacer_follows_capture_time():
+    pacer = hub.SubscriberPacer(target_fps=10.0)
+    times = [i / 30.0 for i in range(9)]
+    assert [seq for seq, t in enumerate(times, 1) if pacer.accept(seq, t, 1)] == [1, 4, 7]
+
+
+def test_pacer_restart():
+    pacer = hub.SubscriberPacer(decimate_every_n=3)
+    assert pacer.accept(10, 0.0, 1)
+    assert pacer.accept(1, 0.0, 1)  # The server restarted, its frames count from 1 again.
+    assert not pacer.accept(2, 0.0, 1)
+
+
+def test_attach_shares_stream(address):
+    server = hub.StreamVideoHub(address)
+    try:
+        ring_name, cursor, encoding = server.attach(1, 'stream', STREAM_KWARGS, 4)
+        other = server.attach(2, 'stream', dict(STREAM_KWARGS, target_fps=5.0, decimate_every_n=2), 4)
+        assert other[0] == ring_name and other[1] != cursor
+        assert encoding == ('none', 90)
+        stream = server.streams['stream']
+        assert set(stream.subscribers) == {1, 2}
+        assert stream.merged['target_fps'] == 0.0  # The first subscriber takes every frame.
+
+        with pytest.raises(hub.HubAttachError):
+            server.attach(3, 'stream', dict(STREAM_KWARGS, frame_width=64), 4)  # Another output on the same key.
+
+        assert server.detach(1, 'stream', 2.0)
+        assert stream.thread.is_alive()
+        assert stream.merged['target_fps'] == 5.0 and stream.merged['decimate_every_n'] == 2
+        assert int(stream.ring.header['decimate_every_n']) == 2
+
+        assert server.detach(2, 'stream', 2.0)
+        assert not server.streams
+        assert not stream.thread.is_alive()
+        assert not server.detach(2, 'stream', 2.0)
+    finally:
+        for key in list(server.streams):
+            for owner in list(server.streams[key].subscribers):
+                server.detach(owner, key, 2.0)
+
+
+def test_attach_requires_fixed_size(address):
+    server = hub.StreamVideoHub(address)
+    with pytest.raises(hub.HubAttachError):
+        server.attach(1, 'stream', dict(STREAM_KWARGS, frame_width=0), 4)
+    assert not server.streams
+
+
+def test_client_attach(running_hub):
+    server, client = running_hub
+    ring = client.attach('stream', STREAM_KWARGS, 4)
+    assert ring.name == server.streams['stream'].ring.name
+    assert client.hub_pid == os.getpid()
+    assert len(client.get_stats()) > 0
+    client.detach(2.0)
+    assert not server.streams
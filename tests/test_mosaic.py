@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import av_stream_video_mosaic as ms
+
+
+@pytest.fixture
+def mosaic():
+    mosaic = ms.SharedMosaic.create(2, 2, 4, 2, 'bgr24')
+    yield mosaic
+    mosaic.close()
+    mosaic.unlink()
+
+
+@pytest.fixture
+def batch():
+    # A single column, like the shared batch of StreamVideoBatch.
+    batch = ms.SharedMosaic.create(1, 3, 4, 2, 'bgr24', buffers=2)
+    yield batch
+    batch.close()
+    batch.unlink()
+
+
+def tile_image(value: int, width=4, height=2):
+    return np.full((height, width * 3), value, dtype=np.uint8)
+
+
+def test_tile_rect(mosaic):
+    assert [mosaic.tile_rect(i) for i in range(4)] == [(0, 0, 4, 2), (4, 0, 4, 2), (0, 2, 4, 2), (4, 2, 4, 2)]
+
+
+def test_write_and_read(mosaic):
+    mosaic.write_tile(1, [tile_image(7)], frame_seq=3, pts=300, index=3, timestamp=1.5, capture_time=1.25)
+    out = np.empty(mosaic.shape, dtype=np.uint8)
+    metas = mosaic.read(out)
+    assert (out[0:2, 4:8] == 7).all()
+    assert (out[0:2, 0:4] == 0).all() and (out[2:4] == 0).all()
+    assert metas[1] == {'seq': 3, 'pts': 300, 'index': 3, 'timestamp': 1.5, 'capture_time': 1.25}
+    assert metas[0]['timestamp'] == 0.0  # Never written.
+
+
+def test_attach_shares_tiles(mosaic):
+    reader = ms.SharedMosaic.attach(mosaic.name)
+    try:
+        mosaic.write_tile(2, [tile_image(9)], frame_seq=1)
+        out = np.empty(reader.shape, dtype=np.uint8)
+        assert reader.read(out)[2]['seq'] == 1
+        assert (out[2:4, 0:4] == 9).all()
+    finally:
+        reader.close()
+
+
+def test_attach_other_version(mosaic):
+    mosaic.header['version'] = ms.MOSAIC_VERSION - 1
+    with pytest.raises(ValueError):
+        ms.SharedMosaic.attach(mosaic.name)
+    mosaic.header['version'] = ms.MOSAIC_VERSION
+
+
+def test_yuv420p_tiles():
+    mosaic = ms.SharedMosaic.create(2, 1, 4, 2, 'yuv420p')
+    try:
+        y = np.full((2, 4), 50, dtype=np.uint8)
+        u = np.full((1, 2), 60, dtype=np.uint8)
+        v = np.full((1, 2), 70, dtype=np.uint8)
+        mosaic.write_tile(1, [y, u, v])
+        out = np.empty(mosaic.shape, dtype=np.uint8)
+        mosaic.read(out)
+        out_y, out_u, out_v = ms.canvas_planes(out, 'yuv420p')
+        assert (out_y[:, 4:] == 50).all() and (out_y[:, :4] == 0).all()
+        assert (out_u[:, 2:] == 60).all() and (out_u[:, :2] == ms.BLACK_CHROMA).all()
+        assert (out_v[:, 2:] == 70).all()
+    finally:
+        mosaic.close()
+        mosaic.unlink()
+
+
+def test_odd_yuv_tile_size():
+    with pytest.raises(ValueError):
+        ms.SharedMosaic.create(1, 1, 3, 2, 'nv12')
+
+
+def test_batch_shape():
+    assert ms.batch_shape(3, 4, 2, 'bgr24') == (3, 2, 4, 3)
+    assert ms.batch_shape(3, 4, 2, 'gray') == (3, 2, 4)
+    with pytest.raises(ValueError):
+        ms.batch_shape(3, 4, 2, 'yuv420p')
+
+
+def test_swap_publishes_batch(batch):
+    for tile in range(3):
+        batch.write_tile(tile, [tile_image(tile + 1)], frame_seq=tile + 10)
+    assert list(batch.latest_versions()) == [1, 1, 1]
+
+    index, canvas, metas = batch.swap()
+    frames = canvas.reshape(ms.batch_shape(3, 4, 2, 'bgr24'))
+    assert [int(frame[0, 0, 0]) for frame in frames] == [1, 2, 3]
+    assert [meta['seq'] for meta in metas] == [10, 11, 12]
+    assert not canvas.flags.writeable
+    assert np.shares_memory(canvas, batch.canvases[index])  # A view, not a copy.
+
+
+def test_swap_keeps_view_until_next_swap(batch):
+    for tile in range(3):
+        batch.write_tile(tile, [tile_image(1)])
+    _, canvas, _ = batch.swap()
+
+    batch.write_tile(0, [tile_image(2)], frame_seq=2)  # Into the other canvas.
+    assert (canvas == 1).all()
+
+    _, canvas, metas = batch.swap()
+    frames = canvas.reshape(3, 2, 4, 3)
+    assert (frames[0] == 2).all() and metas[0]['seq'] == 2
+    assert (frames[1:] == 1).all()  # Caught up from the canvas of the previous swap.
+
+
+def test_swap_catches_up_stale_tiles(batch):
+    batch.write_tile(0, [tile_image(1)])
+    batch.swap()
+    batch.write_tile(1, [tile_image(2)])
+    batch.swap()
+    batch.write_tile(2, [tile_image(3)])
+    _, canvas, _ = batch.swap()
+    assert [int(frame[0, 0, 0]) for frame in canvas.reshape(3, 2, 4, 3)] == [1, 2, 3]
+    assert list(batch.latest_versions()) == [1, 1, 1]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import av_stream_video_motion as mo
+
+av = pytest.importorskip('av')
+
+WIDTH = 128
+HEIGHT = 64
+
+
+def gray_frame(image: np.ndarray):
+    return av.VideoFrame.from_ndarray(image, format='gray')
+
+
+def yuv_frame(luma: np.ndarray):
+    chroma = np.full((luma.shape[0] // 2, luma.shape[1]), 128, dtype=np.uint8)
+    return av.VideoFrame.from_ndarray(np.concatenate([luma, chroma]), format='yuv420p')
+
+
+def background(value=100):
+    return np.full((HEIGHT, WIDTH), value, dtype=np.uint8)
+
+
+def test_first_frame_passes():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF)
+    assert gate.check(gray_frame(background()), 0.0)
+    assert gate.last_score == 100.0
+
+
+@pytest.mark.parametrize('make_frame', [gray_frame, yuv_frame])
+def test_diff_gate(make_frame):
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF, threshold=1.0)
+    gate.check(make_frame(background()), 0.0)
+    assert not gate.check(make_frame(background(101)), 1.0)  # Below 1% of the luma range.
+    assert gate.check(make_frame(background(110)), 2.0)
+    assert gate.last_score == pytest.approx(10 * 100 / 255, abs=0.1)
+
+
+def test_slow_change_adds_up():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF, threshold=1.0)
+    gate.check(gray_frame(background(100)), 0.0)
+    assert not gate.check(gray_frame(background(102)), 1.0)
+    assert gate.check(gray_frame(background(104)), 2.0)  # Compared with the frame that passed.
+
+
+def test_block_gate_small_object():
+    image = background()
+    image[8:16, 8:16] = 200  # A small object, well below the threshold of the mean difference.
+    diff_gate = mo.MotionGate(mo.MOTION_GATE_DIFF, threshold=1.0)
+    block_gate = mo.MotionGate(mo.MOTION_GATE_BLOCK, threshold=1.0)
+    for gate in [diff_gate, block_gate]:
+        gate.check(gray_frame(background()), 0.0)
+    assert not diff_gate.check(gray_frame(image), 1.0)
+    assert block_gate.check(gray_frame(image), 1.0)
+
+
+def test_block_gate_noise():
+    gate = mo.MotionGate(mo.MOTION_GATE_BLOCK, threshold=1.0)
+    gate.check(gray_frame(background()), 0.0)
+    noise = background()
+    noise[::2, ::2] = 104  # Below MOTION_BLOCK_DELTA.
+    assert not gate.check(gray_frame(noise), 1.0)
+    assert gate.last_score == 0.0
+
+
+def test_keepalive():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF, keepalive=5.0)
+    gate.check(gray_frame(background()), 0.0)
+    assert not gate.check(gray_frame(background()), 4.0)
+    assert gate.check(gray_frame(background()), 5.0)
+    assert not gate.check(gray_frame(background()), 6.0)
+
+
+def test_crop():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF, crop=(0, 0, WIDTH // 2, HEIGHT))
+    gate.check(gray_frame(background()), 0.0)
+    image = background()
+    image[:, WIDTH // 2:] = 250  # Outside of the crop.
+    assert not gate.check(gray_frame(image), 1.0)
+    image[:, :WIDTH // 2] = 250
+    assert gate.check(gray_frame(image), 2.0)
+
+
+def test_bgr_frame():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF)
+    image = np.full((HEIGHT, WIDTH, 3), 100, dtype=np.uint8)
+    gate.check(av.VideoFrame.from_ndarray(image, format='bgr24'), 0.0)
+    assert not gate.check(av.VideoFrame.from_ndarray(image, format='bgr24'), 1.0)
+    assert gate.check(av.VideoFrame.from_ndarray(image + 50, format='bgr24'), 2.0)
+
+
+def test_reset():
+    gate = mo.MotionGate(mo.MOTION_GATE_DIFF)
+    gate.check(gray_frame(background()), 0.0)
+    gate.reset()
+    assert gate.check(gray_frame(background()), 1.0)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from ctypes import c_int
+
+import av_stream_video_notify as nt
+
+
+def test_notify_and_drain():
+    listener, writer = nt.NotifyListener.create()
+    notifier = nt.Notifier([writer])
+    assert not listener.wait(0.0)
+    notifier.notify()
+    notifier.notify()
+    assert listener.wait(0.0)
+    assert listener.drain()
+    assert not listener.wait(0.0)  # Both notifications were consumed at once.
+    listener.close()
+    writer.close()
+
+
+def test_full_pipe_does_not_block():
+    listener, writer = nt.NotifyListener.create()
+    notifier = nt.Notifier([writer])
+    for _ in range(100000):
+        notifier.notify()
+    assert listener.drain()
+    assert not listener.wait(0.0)
+    listener.close()
+    writer.close()
+
+
+def test_closed_writer():
+    listener, writer = nt.NotifyListener.create()
+    writer.close()
+    assert not listener.drain()
+    assert not listener.alive
+    assert not listener.wait(1.0)  # Not waited for anymore.
+    assert not nt.wait_any([listener, None], 0.0)
+
+
+def test_closed_listener():
+    listener, writer = nt.NotifyListener.create()
+    listener.close()
+    nt.Notifier([writer]).notify()  # The broken pipe is ignored.
+    writer.close()
+
+
+def test_remove():
+    listener, writer = nt.NotifyListener.create()
+    notifier = nt.Notifier()
+    notifier.add(writer)
+    conns = notifier.conns
+    notifier.remove(writer)
+    assert conns == [writer] and notifier.conns == []
+    notifier.notify()
+    assert not listener.wait(0.0)
+    listener.close()
+    writer.close()
+
+
+def test_wait_any():
+    first, first_writer = nt.NotifyListener.create()
+    second, second_writer = nt.NotifyListener.create()
+    assert not nt.wait_any([first, second], 0.0)
+    nt.Notifier([second_writer]).notify()
+    assert nt.wait_any([first, second], 0.0)
+    for conn in [first, second, first_writer, second_writer]:
+        conn.close()
+
+
+def test_wait_async():
+    listener, writer = nt.NotifyListener.create()
+    notifier = nt.Notifier([writer])
+
+    async def main():
+        assert not await listener.wait_async(0.01)
+        asyncio.get_running_loop().call_later(0.01, notifier.notify)
+        assert await listener.wait_async(5.0)
+        task = asyncio.ensure_future(listener.wait_async(5.0))
+        listener.drain()
+        await asyncio.sleep(0.01)
+        task.cancel()  # Leaves no reader behind.
+        await asyncio.gather(task, return_exceptions=True)
+        notifier.notify()
+        assert await listener.wait_async(5.0)
+
+    asyncio.run(main())
+    listener.close()
+    writer.close()
+
+
+def test_status_word():
+    word = nt.StatusWord(c_int, 3)
+    with word.get_lock():
+        word.value = 4
+    assert word.value == 4
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import av_stream_video_output as out
+
+av = pytest.importorskip('av')
+
+
+def bgr_frame(width=8, height=6):
+    image = np.arange(width * height * 3, dtype=np.uint8).reshape(height, width, 3)
+    return av.VideoFrame.from_ndarray(image, format='bgr24'), image
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('416x416', '416x416:bgr24:BILINEAR'),
+    ('416x416:rgb24:area', '416x416:rgb24:AREA'),
+    ('x240:gray', '0x240:gray:BILINEAR'),
+    (' 64x48 : nv12 ', '64x48:nv12:BILINEAR'),
+])
+def test_parse_output_spec(text, expected):
+    assert out.OutputSpec.parse(text).to_text() == expected
+
+
+@pytest.mark.parametrize('text', ['416', '416x416:bgra', '15x16:yuv420p'])
+def test_parse_invalid_output_spec(text):
+    with pytest.raises(ValueError):
+        out.OutputSpec.parse(text)
+
+
+def test_parse_output_specs():
+    assert out.parse_output_specs('') == []
+    specs = out.parse_output_specs('1920x1080, 416x416:rgb24:AREA,')
+    assert specs == [out.OutputSpec(1920, 1080), out.OutputSpec(416, 416, 'rgb24', 'AREA')]
+    with pytest.raises(ValueError):
+        out.parse_output_specs(','.join(['8x8'] * (out.MAX_OUTPUT_SPECS + 1)))
+
+
+@pytest.mark.parametrize('spec, src_size, expected', [
+    (out.OutputSpec(8, 6, 'bgr24'), (0, 0), 8 * 6 * 3),
+    (out.OutputSpec(8, 6, 'nv12'), (0, 0), 8 * 6 * 3 // 2),
+    (out.OutputSpec(0, 6, 'gray'), (0, 0), 0),  # Depends on the decoded frame.
+    (out.OutputSpec(0, 0, 'gray'), (10, 4), 40),  # Takes the size of the crop.
+])
+def test_calc_bytes(spec, src_size, expected):
+    assert spec.calc_bytes(*src_size) == expected
+
+
+def test_parse_crop():
+    assert out.parse_crop('') is None
+    assert out.parse_crop('10,20,0,240') == (10, 20, 0, 240)
+    assert out.crop_size(None) == (0, 0)
+    assert out.crop_size((10, 20, 0, 240)) == (0, 240)
+    for text in ['1,2,3', '-1,0,4,4']:
+        with pytest.raises(ValueError):
+            out.parse_crop(text)
+
+
+@pytest.mark.parametrize('crop, expected', [
+    ((3, 5, 11, 7), (2, 4, 10, 6)),  # Rounded down to even numbers.
+    ((10, 10, 0, 0), (10, 10, 30, 20)),  # Extended to the edge.
+    ((30, 20, 100, 100), (30, 20, 10, 10)),  # Clipped.
+])
+def test_fit_crop(crop, expected):
+    assert out.fit_crop(crop, 40, 30) == expected
+
+
+def test_fit_crop_outside():
+    with pytest.raises(ValueError):
+        out.fit_crop((40, 0, 8, 8), 40, 30)
+
+
+def test_convert_without_scaling():
+    frame, image = bgr_frame()
+    converter = out.FrameConverter([out.OutputSpec(0, 0, 'bgr24')])
+    planes, width, height = converter.convert(frame, 0)
+    assert (width, height) == (8, 6)
+    assert (planes[0] == image.reshape(6, -1)).all()
+
+
+def test_convert_crop():
+    frame, image = bgr_frame()
+    converter = out.FrameConverter([out.OutputSpec(0, 0, 'bgr24')], crop=(2, 2, 4, 2))
+    planes, width, height = converter.convert(frame, 0)
+    assert (width, height) == (4, 2)
+    assert (planes[0] == image[2:4, 2:6].reshape(2, -1)).all()
+
+
+def test_convert_several_specs():
+    frame, _ = bgr_frame()
+    converter = out.FrameConverter([out.OutputSpec(8, 6, 'bgr24'), out.OutputSpec(4, 2, 'gray')], crop=(2, 2, 0, 0))
+    assert converter.convert(frame, 0)[1:] == (8, 6)
+    planes, width, height = converter.convert(frame, 1)
+    assert (width, height) == (4, 2)
+    assert planes[0].shape == (2, 4)
+
+
+def test_gray_of_yuv_is_luma():
+    luma = np.arange(48, dtype=np.uint8).reshape(6, 8)
+    image = np.concatenate([luma, np.full((3, 8), 128, dtype=np.uint8)])
+    frame = av.VideoFrame.from_ndarray(image, format='yuv420p')
+    planes, _, _ = out.FrameConverter([out.OutputSpec(0, 0, 'gray')]).convert(frame, 0)
+    assert (planes[0] == luma).all()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import av_stream_video_playback as pb
+
+
+def test_is_file_source(video_file):
+    assert pb.is_file_source(video_file)
+    assert not pb.is_file_source('rtsp://camera-1/stream')
+    assert not pb.is_file_source('')
+
+
+def test_clock_follows_pts():
+    clock = pb.PlaybackClock()
+    assert clock.get_delay(10.0, 100.0) == 0.0  # Anchors the clock.
+    assert clock.get_delay(10.5, 100.2) == pytest.approx(0.3)
+    assert clock.get_delay(10.5, 100.7) == 0.0  # Late frames are not delayed.
+
+
+def test_clock_speed():
+    clock = pb.PlaybackClock(speed=2.0)
+    clock.get_delay(0.0, 100.0)
+    assert clock.get_delay(1.0, 100.0) == pytest.approx(0.5)
+
+
+def test_clock_jump():
+    clock = pb.PlaybackClock()
+    clock.get_delay(0.0, 100.0)
+    assert clock.get_delay(60.0, 100.1) == 0.0  # A discontinuity starts over.
+    assert clock.get_delay(60.5, 100.1) == pytest.approx(0.5)
+    clock.reset()
+    assert clock.get_delay(0.0, 200.0) == 0.0
+
+
+def test_keyframe_index_find():
+    index = pb.KeyframeIndex([0, 3000, 6000], 1, 1000)
+    assert index.find(0.0) == 0
+    assert index.find(2.999) == 0
+    assert index.find(3.0) == 3000
+    assert index.find(100.0) == 6000
+    assert pb.KeyframeIndex([], 1, 1000).find(1.0) is None
+
+
+def test_keyframe_index_load(video_file, tmp_path, monkeypatch):
+    index = pb.KeyframeIndex.load(video_file, index_dir=str(tmp_path))
+    assert index.keyframes[0] == 0 and index.keyframes == sorted(index.keyframes)
+    assert 2 <= len(index.keyframes) < 60
+    assert 0.0 < index.to_seconds(index.find(1.0)) <= 1.0
+    assert os.path.exists(pb.KeyframeIndex.get_cache_path(video_file, 0, str(tmp_path)))
+
+    def build(*args):
+        raise AssertionError('The cache was not used')
+
+    monkeypatch.setattr(pb.KeyframeIndex, 'build', build)
+    assert pb.KeyframeIndex.load(video_file, index_dir=str(tmp_path)).keyframes == index.keyframes
+
+
+def test_keyframe_index_rebuilt_for_changed_file(video_file, tmp_path):
+    path = str(tmp_path / 'clip.mp4')
+    with open(video_file, 'rb') as src, open(path, 'wb') as dst:
+        dst.write(src.read())
+    index_dir = str(tmp_path / 'index')
+    keyframes = pb.KeyframeIndex.load(path, index_dir=index_dir).keyframes
+    os.utime(path, (0, 0))
+    assert pb.KeyframeIndex.load(path, index_dir=index_dir).keyframes == keyframes
+    with open(pb.KeyframeIndex.get_cache_path(path, 0, index_dir)) as f:
+        assert '"mtime": 0' in f.read()
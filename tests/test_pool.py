@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import gc
+
+import numpy as np
+import pytest
+
+import av_stream_video_pool as pool
+
+
+@pytest.mark.parametrize('width, height, frame_format, expected', [
+    (4, 2, 'bgr24', (2, 4, 3)),
+    (4, 2, 'gray', (2, 4)),
+    (4, 2, 'yuv420p', (3, 4)),
+    (4, 2, 'nv12', (3, 4)),
+])
+def test_frame_shape(width, height, frame_format, expected):
+    assert pool.frame_shape(width, height, frame_format) == expected
+
+
+def test_split_planes():
+    image = np.arange(4 * 6, dtype=np.uint8).reshape(6, 4)
+    y, u, v = pool.split_planes(image, 'yuv420p')
+    assert y.shape == (4, 4) and u.shape == (2, 2) and v.shape == (2, 2)
+    assert u[0, 0] == 16 and v[0, 0] == 20
+    y, uv = pool.split_planes(image, 'nv12')
+    assert uv.shape == (2, 2, 2) and uv[0, 0, 1] == 17
+    assert pool.split_planes(image, 'gray')[0] is image
+
+
+def test_release_and_reuse():
+    buffers = pool.FrameBufferPool()
+    first = buffers.acquire(4, 2, 'bgr24')
+    buffers.release(first)
+    assert buffers.acquire(4, 2, 'bgr24') is first
+    assert buffers.acquire(4, 2, 'gray') is not first  # Another key.
+    assert (buffers.hits, buffers.misses) == (1, 2)
+
+
+def test_batch_buffer():
+    buffers = pool.FrameBufferPool()
+    batch = buffers.acquire(4, 2, 'gray', count=3)
+    assert batch.shape == (3, 2, 4)
+    buffers.release(batch)
+    assert buffers.acquire(4, 2, 'gray') is not batch
+    assert buffers.acquire(4, 2, 'gray', count=3) is batch
+
+
+def test_foreign_buffer_is_not_taken():
+    buffers = pool.FrameBufferPool()
+    buffers.release(np.empty((2, 4, 3), dtype=np.uint8))
+    assert not buffers.free
+
+
+def test_dropped_buffer_is_forgotten():
+    buffers = pool.FrameBufferPool()
+    buffer = buffers.acquire(4, 2, 'bgr24')
+    assert buffers.is_owned(buffer)
+    del buffer
+    gc.collect()
+    assert not buffers.owned  # Its id may belong to another array now.
+
+
+def test_full_pool_drops_buffer():
+    buffers = pool.FrameBufferPool(max_free_buffers=1)
+    first = buffers.acquire(4, 2, 'gray')
+    second = buffers.acquire(4, 2, 'gray')
+    buffers.release(first)
+    buffers.release(second)
+    assert not buffers.is_owned(second)
+    buffers.release(second)  # Not taken back after it was dropped.
+    assert buffers.free[(4, 2, 'gray', 0)] == [first]
+
+
+def test_delayed_release():
+    buffers = pool.FrameBufferPool()
+    delayed = pool.DelayedRelease(buffers, 2)
+    acquired = [buffers.acquire(4, 2, 'gray') for _ in range(3)]
+    for buffer in acquired[:2]:
+        delayed.retire(buffer)
+    assert not buffers.free.get((4, 2, 'gray', 0))
+    delayed.retire(acquired[2])
+    assert buffers.acquire(4, 2, 'gray') is acquired[0]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from fractions import Fraction
+from types import SimpleNamespace
+
+import pytest
+
+import av_stream_video_record as rec
+
+TIME_BASE = Fraction(1, 10)
+
+
+def make_packet(pts, is_keyframe=False):
+    return SimpleNamespace(pts=pts, dts=pts, time_base=TIME_BASE, is_keyframe=is_keyframe)
+
+
+def make_gops(count: int, gop: int, begin=0):
+    # 10 packets per second, a keyframe every ``gop`` packets.
+    return [make_packet(pts, pts % gop == 0) for pts in range(begin, begin + count)]
+
+
+def times(packets):
+    return [rec.packet_time(packet) for packet in packets]
+
+
+def test_packet_time():
+    assert rec.packet_time(make_packet(15)) == 1.5
+    assert rec.packet_time(SimpleNamespace(pts=None, dts=5, time_base=TIME_BASE)) == 0.5
+    assert rec.packet_time(SimpleNamespace(pts=None, dts=None, time_base=TIME_BASE)) is None
+
+
+def test_buffer_starts_at_keyframe():
+    buffer = rec.PacketBuffer(seconds=10.0)
+    for packet in make_gops(10, 5, begin=3):
+        buffer.append(packet)
+    assert [timestamp for timestamp, _ in buffer.packets] == [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2]
+    buffer.append(make_packet(None))  # Without a timestamp.
+    assert len(buffer.packets) == 8
+
+
+def test_buffer_drops_whole_gops():
+    buffer = rec.PacketBuffer(seconds=1.0)
+    for packet in make_gops(40, 5):
+        buffer.append(packet)
+    packets = [packet for _, packet in buffer.packets]
+    assert packets[0].is_keyframe
+    # The oldest GOP still covers the last second.
+    assert times(packets)[0] <= rec.packet_time(packets[-1]) - 1.0 < times(packets)[0] + 0.5
+    assert buffer.last_time == 3.9
+
+
+def test_snapshot():
+    buffer = rec.PacketBuffer(seconds=10.0)
+    for packet in make_gops(40, 10):
+        buffer.append(packet)
+    assert times(buffer.snapshot(1.5)) == [pts / 10 for pts in range(20, 40)]  # From the keyframe before 2.4s.
+    assert times(buffer.snapshot(100.0))[0] == 0.0
+    buffer.clear()
+    assert buffer.snapshot(1.0) == []
+
+
+def test_recorder(video_file, tmp_path):
+    av = pytest.importorskip('av')
+    with av.open(video_file) as container:
+        stream = container.streams.video[0]
+        packets = [packet for packet in container.demux(stream) if packet.dts is not None]
+        end_time = rec.packet_time(packets[29])
+        path = str(tmp_path / 'event.mp4')
+        recorder = rec.PacketRecorder(path, stream, end_time)
+        recorder.start(packets[:10])
+        for packet in packets[10:]:
+            if not recorder.write(packet):
+                break
+        assert recorder.done
+        assert not recorder.write(packets[-1])
+        recorder.join()
+
+    with av.open(path) as container:
+        assert len([packet for packet in container.demux(video=0) if packet.size]) == 30
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import av_stream_video_sched as sc
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('0-3,8,10-11', [0, 1, 2, 3, 8, 10, 11]),
+    (' 2, 0 ,1', [0, 1, 2]),
+    ('', []),
+    ('4,4-5', [4, 5]),
+])
+def test_parse_cpu_list(text, expected):
+    assert sc.parse_cpu_list(text) == expected
+
+
+@pytest.mark.parametrize('text', ['3-1', 'a', '-1'])
+def test_parse_invalid_cpu_list(text):
+    with pytest.raises(ValueError):
+        sc.parse_cpu_list(text)
+
+
+@pytest.mark.parametrize('cpus, expected', [
+    ([0, 1, 2, 3, 8, 10, 11], '0-3,8,10-11'),
+    ([5, 1], '1,5'),
+    ([], ''),
+])
+def test_format_cpu_list(cpus, expected):
+    assert sc.format_cpu_list(cpus) == expected
+
+
+def test_read_numa_nodes():
+    nodes = sc.read_numa_nodes([0])
+    assert nodes == [[0]]
+
+
+def test_lease_key():
+    assert sc.is_lease_alive(sc.current_lease_key())
+    assert not sc.is_lease_alive('999999999:1')
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return sc.HostScheduler(str(tmp_path / 'leases.json'), nodes=[[0, 1, 2, 3], [4, 5, 6, 7]])
+
+
+def lease_key(i: int):
+    return f'{i + 1}:{i + 1}'  # Alive, with is_lease_alive() patched.
+
+
+def test_acquire_spreads_over_nodes(scheduler, monkeypatch):
+    monkeypatch.setattr(sc, 'is_lease_alive', lambda key: True)
+    assert scheduler.acquire(2, key=lease_key(0)) == (0, [0, 1], 2)
+    assert scheduler.acquire(2, key=lease_key(1)) == (1, [4, 5], 2)
+    assert scheduler.acquire(1, key=lease_key(2)) == (0, [2], 1)  # The least used CPUs of the node.
+    assert len(scheduler.get_leases()) == 3
+
+
+def test_auto_threads(scheduler, monkeypatch):
+    monkeypatch.setattr(sc, 'is_lease_alive', lambda key: True)
+    assert scheduler.acquire(key=lease_key(0))[2] == sc.AUTO_MAX_DECODER_THREADS
+    assert scheduler.acquire(key=lease_key(1))[2] == sc.AUTO_MAX_DECODER_THREADS  # The other node is idle.
+    assert scheduler.acquire(key=lease_key(2))[2] == 1  # No idle CPU left.
+
+
+def test_release(scheduler, monkeypatch):
+    monkeypatch.setattr(sc, 'is_lease_alive', lambda key: True)
+    scheduler.acquire(2, key=lease_key(0))
+    scheduler.acquire(2, key=lease_key(0))  # Replaces the lease of the same key.
+    assert list(scheduler.get_leases()) == [lease_key(0)]
+    scheduler.release(key=lease_key(0))
+    assert scheduler.get_leases() == {}
+
+
+def test_dead_leases_are_dropped(scheduler):
+    scheduler.acquire(2, key='999999999:1')  # A server that died without releasing it.
+    assert scheduler.acquire(2) == (0, [0, 1], 2)
+    assert list(scheduler.get_leases()) == [sc.current_lease_key()]
+
+
+def test_broken_lease_file(scheduler):
+    with open(scheduler.lease_path, 'w') as f:
+        f.write('{broken')
+    scheduler.acquire(1)
+    assert list(scheduler.get_leases()) == [sc.current_lease_key()]
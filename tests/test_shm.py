@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import av_stream_video_shm as shm
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def ring():
+    ring = shm.SharedFrameRing.create(3, int(np.prod(SHAPE)), encoded_bytes=16)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def make_image(value: int):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_write_read(ring):
+    seq = ring.write(make_image(7), pts=100, index=3, frame_format='rgb24', timestamp=1.5, encoded=b'jpeg',
+                     frame_seq=11, capture_time=1.25)
+    assert seq == 1
+    assert ring.write_seq == 1
+    image = ring.read(seq)
+    assert image.shape == SHAPE
+    assert (image == 7).all()
+    assert not image.flags.writeable
+    meta = ring.read_meta(seq)
+    assert meta['frame_seq'] == 11
+    assert meta['pts'] == 100
+    assert meta['index'] == 3
+    assert meta['timestamp'] == 1.5
+    assert meta['capture_time'] == 1.25
+    assert meta['format'] == 'rgb24'
+    assert ring.read_encoded(seq) == b'jpeg'
+
+
+def test_write_too_large(ring):
+    assert ring.write(np.zeros((8, 8, 3), dtype=np.uint8)) == 0
+    assert ring.write_seq == 0
+
+
+def test_attach_shares_frames(ring):
+    reader = shm.SharedFrameRing.attach(ring.name)
+    try:
+        seq = ring.write(make_image(3))
+        assert reader.write_seq == seq
+        assert (reader.read(seq, copy=True) == 3).all()
+    finally:
+        reader.close()
+
+
+def test_attach_other_version(ring):
+    ring.header['version'] = shm.RING_VERSION - 1
+    with pytest.raises(ValueError):
+        shm.SharedFrameRing.attach(ring.name)
+    ring.header['version'] = shm.RING_VERSION
+
+
+def test_read_latest(ring):
+    assert ring.read_latest() == (0, None)
+    ring.write(make_image(1))
+    seq = ring.write(make_image(2))
+    latest, image = ring.read_latest()
+    assert latest == seq
+    assert (image == 2).all()
+    assert ring.read_latest(seq) == (seq, None)
+
+
+def test_slot_being_written_is_invalid(ring):
+    for value in range(1, 4):
+        ring.write(make_image(value))
+    # The next write takes the slot of the oldest frame, which is invalid until the slot is published again.
+    view = ring.begin_write(SHAPE)
+    assert not ring.is_valid(1)
+    assert ring.read(1) is None
+    assert ring.read_meta(2)['seq'] == 2
+    view.fill(4)
+    seq = ring.commit_write(SHAPE)
+    assert seq == 4
+    assert (ring.read(seq) == 4).all()
+    assert ring.is_valid(2) and ring.is_valid(3)
+
+
+def test_overwritten_frames_are_invalid(ring):
+    seqs = [ring.write(make_image(value)) for value in range(1, 7)]
+    assert [ring.is_valid(seq) for seq in seqs] == [False, False, False, True, True, True]
+    assert ring.read(seqs[0]) is None
+    assert ring.read_encoded(seqs[0]) is None
+    assert not ring.is_valid(0)
+    latest, image = ring.read_latest(seqs[2])
+    assert latest == seqs[-1]
+    assert (image == 6).all()
+
+
+def test_cursor_keeps_taken_frame(ring):
+    ring.open_cursor(0)
+    ring.write(make_image(1))
+    seq, image = ring.read_latest(cursor=0)
+    assert ring.cursors['read_seq'][0] == seq
+    for value in range(2, 10):
+        ring.write(make_image(value))
+        assert ring.is_valid(seq)
+        assert (image == 1).all()
+    # The other slots still turn over.
+    assert ring.is_valid(ring.write_seq)
+    assert not ring.is_valid(ring.write_seq - ring.slot_count + 1)
+
+
+def test_closed_cursor_releases_frame(ring):
+    ring.open_cursor(0)
+    seq = ring.write(make_image(1))
+    ring.mark_consumed(seq, 0)
+    ring.close_cursor(0)
+    for value in range(2, 5):
+        ring.write(make_image(value))
+    assert not ring.is_valid(seq)
+
+
+def test_every_slot_held(ring):
+    for cursor in range(ring.slot_count):
+        ring.open_cursor(cursor)
+        ring.mark_consumed(ring.write(make_image(cursor + 1)), cursor)
+    # The oldest frame is overwritten anyway.
+    seq = ring.write(make_image(9))
+    assert not ring.is_valid(1)
+    assert ring.is_valid(2) and ring.is_valid(3) and ring.is_valid(seq)
+
+
+def test_consumed_and_lag(ring):
+    assert ring.is_consumed()
+    assert ring.get_lag() == 0
+    ring.open_cursor(0)
+    ring.open_cursor(1)
+    for value in range(1, 4):
+        ring.write(make_image(value))
+    assert not ring.is_consumed()
+    assert ring.get_lag() == 3
+    ring.mark_consumed(1, 0)
+    ring.mark_consumed(2, 1)
+    assert ring.get_lag() == 1
+    ring.mark_consumed(3, 0)
+    assert ring.is_consumed()
+    assert ring.get_lag() == 0
+
+
+def test_extras():
+    ring = shm.SharedFrameRing.create(2, shm.calc_slot_bytes(int(np.prod(SHAPE)), [4]))
+    try:
+        seq = ring.write(make_image(1), frame_format='bgr24', extras=[np.full((2, 2), 5, dtype=np.uint8)],
+                         extra_formats=['gray'])
+        extras = ring.read_extras(seq)
+        assert len(extras) == 1
+        assert (extras[0] == 5).all()
+        assert (ring.read(seq) == 1).all()
+        assert ring.write(make_image(2), extras=[np.zeros((16, 16), dtype=np.uint8)]) == 0
+    finally:
+        ring.close()
+        ring.unlink()
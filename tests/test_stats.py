@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import urllib.error
+import urllib.request
+from ctypes import c_double
+from multiprocessing.sharedctypes import Array
+
+import pytest
+
+import av_stream_video_stats as st
+
+
+def test_counters_and_gauges():
+    stats = st.PipelineStats()
+    stats.count(st.STATS_DECODED_FRAMES)
+    stats.count(st.STATS_DECODED_FRAMES, 2)
+    stats.set(st.STATS_QUEUE_OCCUPANCY, 0.5)
+    result = st.stats_to_dict(stats.values)
+    assert result[st.STATS_DECODED_FRAMES] == 3.0
+    assert result[st.STATS_QUEUE_OCCUPANCY] == 0.5
+    assert result[st.STATS_OPENS] == 0.0
+
+
+def test_histogram():
+    stats = st.PipelineStats()
+    for seconds in [0.0001, 0.003, 0.003, 10.0]:
+        stats.observe(st.STATS_DECODE_SECONDS, seconds)
+    histogram = st.stats_to_dict(stats.values)[st.STATS_DECODE_SECONDS]
+    assert histogram['count'] == 4
+    assert histogram['sum'] == pytest.approx(10.0061)
+    assert histogram['buckets']['0.0001'] == 1  # Upper bounds are inclusive.
+    assert histogram['buckets']['0.005'] == 2
+    assert histogram['buckets']['+Inf'] == 1
+    assert sum(histogram['buckets'].values()) == 4
+
+
+def test_publish_is_throttled():
+    shared = Array(c_double, st.STATS_SIZE)
+    stats = st.PipelineStats(shared)
+    stats.count(st.STATS_OPENS)
+    stats.publish()
+    stats.count(st.STATS_OPENS)
+    stats.publish()  # Within STATS_PUBLISH_INTERVAL.
+    assert st.stats_to_dict(st.read_stats(shared))[st.STATS_OPENS] == 1.0
+    stats.publish(force=True)
+    assert st.stats_to_dict(st.read_stats(shared))[st.STATS_OPENS] == 2.0
+
+    # A new server process continues the counters.
+    assert st.PipelineStats(shared).values[st.STATS_OFFSETS[st.STATS_OPENS]] == 2.0
+
+
+def test_prometheus_text():
+    stats = st.PipelineStats()
+    stats.count(st.STATS_PUSHED_FRAMES, 5)
+    stats.observe(st.STATS_PUSH_SECONDS, 0.002)
+    stats.observe(st.STATS_PUSH_SECONDS, 0.2)
+    lines = st.stats_to_prometheus(stats.values, {'stream': 'a'}).splitlines()
+    assert 'av_stream_video_pushed_frames_total{stream="a"} 5' in lines
+    assert 'av_stream_video_push_seconds_bucket{stream="a",le="0.0025"} 1' in lines
+    assert 'av_stream_video_push_seconds_bucket{stream="a",le="+Inf"} 2' in lines  # Cumulative.
+    assert 'av_stream_video_push_seconds_count{stream="a"} 2' in lines
+    assert 'av_stream_video_opens_total{} 0' in st.stats_to_prometheus(stats.values, {}).splitlines()
+
+
+def test_http_server():
+    server = st.StatsHttpServer(0, lambda: 'metric 1\n')
+    server.start()
+    try:
+        url = f'http://{st.STATS_HTTP_HOST}:{server.server.server_port}'
+        with urllib.request.urlopen(url + st.STATS_HTTP_PATH) as response:
+            assert response.read() == b'metric 1\n'
+            assert response.headers['Content-Type'] == st.PROMETHEUS_CONTENT_TYPE
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/other')
+    finally:
+        server.stop()
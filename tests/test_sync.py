@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+
+import pytest
+
+import av_stream_video_sync as sy
+
+
+class FakeFrame:
+    def __init__(self, time):
+        self.time = time
+
+
+class FakeContainer:
+    def __init__(self, start_time_realtime):
+        self.start_time_realtime = start_time_realtime
+
+
+def make_entries(times: list):
+    return deque(sy.SyncEntry(t, None, {}, i) for i, t in enumerate(times))
+
+
+def make_synchronizer(windows: list, tolerance=0.02, invalid=()):
+    """
+    ``windows`` holds the capture times of each stream. The token of an entry is ``(stream, position)``,
+    and the tokens in ``invalid`` are overwritten.
+    """
+
+    synchronizer = sy.FrameSynchronizer(len(windows), tolerance=tolerance,
+                                        is_valid=lambda stream, token: token not in invalid)
+    for stream, times in enumerate(windows):
+        for i, t in enumerate(times):
+            synchronizer.add(stream, t, f'image-{stream}-{i}', {}, token=(stream, i))
+    return synchronizer
+
+
+@pytest.mark.parametrize('times, pivot, expected', [
+    ([0.0, 1.0, 2.0], 1.1, 1),
+    ([0.0, 1.0, 2.0], -1.0, 0),
+    ([0.0, 1.0, 2.0], 5.0, 2),
+    ([0.0, 2.0], 1.0, 0),  # A tie keeps the older frame.
+    ([0.5], 0.0, 0),
+])
+def test_nearest(times, pivot, expected):
+    assert sy.FrameSynchronizer(1)._nearest(make_entries(times), pivot) == expected  # noqa
+
+
+@pytest.mark.parametrize('times, pivot, expected', [
+    ([0.0, 1.0, 2.0], 1.5, 1),
+    ([0.0, 1.0, 2.0], 1.0, 1),
+    ([0.0, 1.0, 2.0], 2.0, 2),
+    ([0.0, 1.0, 2.0], -1.0, 0),  # The oldest frame, even after the pivot.
+])
+def test_latest_until(times, pivot, expected):
+    assert sy.FrameSynchronizer._latest_until(make_entries(times), pivot) == expected  # noqa
+
+
+@pytest.mark.parametrize('name, windows, final, invalid, expected, unmatched, overrun', [
+    ('matched',
+     [[0.000, 0.033], [0.005, 0.038]], False, (), [0.000, 0.005], [0, 0], [0, 0]),
+    ('waits for a nearer frame',
+     [[0.000], [0.005]], False, (), None, [0, 0], [0, 0]),
+    ('final does not wait',
+     [[0.000], [0.005]], True, (), [0.000, 0.005], [0, 0], [0, 0]),
+    ('empty stream',
+     [[0.000, 0.033], []], True, (), None, [0, 0], [0, 0]),
+    ('older frames are passed over',
+     [[0.000, 0.033, 0.066], [0.060, 0.093]], False, (), [0.066, 0.060], [2, 0], [0, 0]),
+    ('unmatched stream without a frame in the tolerance',
+     [[0.000], [0.100]], True, (), None, [1, 0], [0, 0]),
+    ('nearest frames on both sides of the pivot',
+     [[0.100, 0.133], [0.085, 0.130], [0.090, 0.109]], False, (), [0.100, 0.085, 0.090], [0, 0, 0], [0, 0, 0]),
+    ('overrun',
+     [[0.000, 0.033, 0.066], [0.030, 0.063]], False, ((0, 0),), [0.033, 0.030], [0, 0], [1, 0]),
+    ('overrun of a whole window',
+     [[0.000], [0.005, 0.038]], True, ((0, 0),), None, [0, 0], [1, 0]),
+])
+def test_match(name, windows, final, invalid, expected, unmatched, overrun):
+    synchronizer = make_synchronizer(windows, invalid=invalid)
+    result = synchronizer.match(final=final)
+    if expected is None:
+        assert result is None, name
+    else:
+        assert [entry.capture_time for entry in result] == expected, name
+        assert synchronizer.stats.sets == 1
+    assert synchronizer.stats.unmatched == unmatched, name
+    assert synchronizer.stats.overrun == overrun, name
+
+
+def test_match_consumes_sets_in_order():
+    synchronizer = make_synchronizer([[0.000, 0.033, 0.066], [0.001, 0.034, 0.067]])
+    sets = list()
+    while True:
+        result = synchronizer.match(final=True)
+        if result is None:
+            break
+        sets.append([entry.capture_time for entry in result])
+    assert sets == [[0.000, 0.001], [0.033, 0.034], [0.066, 0.067]]
+    assert synchronizer.stats.matched == [3, 3]
+    assert synchronizer.stats.to_dict()['skew_seconds']['max'] == pytest.approx(0.001)
+
+
+@pytest.mark.parametrize('name, times, expected_window, unmatched', [
+    ('duplicate', [0.0, 0.033, 0.033], [0.0, 0.033], 0),
+    ('source restart', [5.0, 5.033, 0.0, 0.033], [0.0, 0.033], 2),
+    ('window', [0.0, 0.5, 1.0, 1.5], [0.5, 1.0, 1.5], 1),
+])
+def test_add(name, times, expected_window, unmatched):
+    synchronizer = sy.FrameSynchronizer(2, window=1.0)
+    for t in times:
+        synchronizer.add(0, t, None, {})
+    assert [entry.capture_time for entry in synchronizer.windows[0]] == expected_window, name
+    assert synchronizer.stats.unmatched[0] == unmatched, name
+
+
+def test_source_restart_matches_new_frames():
+    synchronizer = make_synchronizer([[5.000, 5.033], [0.000, 0.033]])
+    synchronizer.add(0, 0.001, 'image', {})
+    result = synchronizer.match(final=True)
+    assert [entry.capture_time for entry in result] == [0.001, 0.000]
+    assert synchronizer.stats.unmatched == [2, 0]
+
+
+@pytest.mark.parametrize('name, mode, container, frames, expected', [
+    ('arrival',
+     sy.CAPTURE_CLOCK_ARRIVAL, None, [(0.0, 10.0), (0.033, 10.5)], [10.0, 10.5]),
+    ('without pts',
+     sy.CAPTURE_CLOCK_PTS, None, [(None, 10.0), (None, 10.2)], [10.0, 10.2]),
+    ('pts anchored by the fastest frame',
+     sy.CAPTURE_CLOCK_PTS, None, [(0.0, 10.0), (0.1, 10.15), (0.2, 10.19), (0.3, 10.32)], [10.0, 10.1, 10.19, 10.29]),
+    ('pts jump resyncs',
+     sy.CAPTURE_CLOCK_PTS, None, [(10.0, 20.0), (0.0, 22.5)], [20.0, 22.5]),
+    ('auto without a container',
+     sy.CAPTURE_CLOCK_AUTO, None, [(0.0, 10.0), (0.1, 10.2)], [10.0, 10.1]),
+    ('auto with sender reports',
+     sy.CAPTURE_CLOCK_AUTO, FakeContainer(1700000000000000), [(0.5, 10.0)], [1700000000.5]),
+    ('auto before the first sender report',
+     sy.CAPTURE_CLOCK_AUTO, FakeContainer(0), [(0.0, 10.0), (0.1, 10.2)], [10.0, 10.1]),
+    ('pts ignores sender reports',
+     sy.CAPTURE_CLOCK_PTS, FakeContainer(1700000000000000), [(0.5, 10.0)], [10.0]),
+])
+def test_capture_time(name, mode, container, frames, expected):
+    clock = sy.CaptureClock(mode)
+    clock.reset(container)
+    result = [clock.capture_time(FakeFrame(t), decoded_time) for t, decoded_time in frames]
+    assert result == pytest.approx(expected), name
+
+
+def test_capture_time_switches_to_sender_reports():
+    container = FakeContainer(0)
+    clock = sy.CaptureClock(sy.CAPTURE_CLOCK_AUTO)
+    clock.reset(container)
+    assert clock.capture_time(FakeFrame(0.0), 10.0) == pytest.approx(10.0)
+    container.start_time_realtime = 1700000000000000
+    assert clock.capture_time(FakeFrame(0.1), 10.2) == pytest.approx(1700000000.1)
+    clock.reset(container)
+    assert clock.ntp_origin is None and clock.pts_anchor is None
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+import av_stream_video_watchdog as wd
+
+
+@pytest.mark.parametrize('base_delay, max_delay, expected', [
+    (1.0, 30.0, [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0]),
+    (0.5, 2.0, [0.5, 1.0, 2.0, 2.0]),
+    (5.0, 1.0, [5.0, 5.0]),  # The maximum is at least the base delay.
+    (0.0, 30.0, [0.0, 0.0]),
+])
+def test_backoff_without_jitter(base_delay, max_delay, expected):
+    backoff = wd.Backoff(base_delay, max_delay, jitter=0.0)
+    assert [backoff.next_delay() for _ in expected] == expected
+
+
+def test_backoff_reset():
+    backoff = wd.Backoff(1.0, jitter=0.0)
+    for _ in range(4):
+        backoff.next_delay()
+    backoff.reset()
+    assert backoff.next_delay() == 1.0
+
+
+def test_backoff_many_attempts():
+    backoff = wd.Backoff(1.0, 30.0, jitter=0.0)
+    backoff.attempts = 1000
+    assert backoff.next_delay() == 30.0
+
+
+@pytest.mark.parametrize('sample, expected', [
+    (0.0, 8.0),
+    (0.5, 6.0),
+    (0.999999, 4.0),
+])
+def test_backoff_jitter(monkeypatch, sample, expected):
+    monkeypatch.setattr(wd.random, 'random', lambda: sample)
+    backoff = wd.Backoff(1.0, 30.0, jitter=0.5)
+    backoff.attempts = 3
+    assert backoff.next_delay() == pytest.approx(expected, abs=1e-5)
+
+
+def test_backoff_jitter_bounds():
+    random.seed(1)
+    backoff = wd.Backoff(1.0, 8.0)
+    for attempt in range(200):
+        nominal = min(2.0 ** attempt, 8.0)
+        delay = backoff.next_delay()
+        assert nominal * (1.0 - wd.BACKOFF_JITTER_RATIO) <= delay <= nominal
+
+
+@pytest.mark.parametrize('name, checks', [
+    ('healthy', [(99.0, 100.0, wd.WATCHDOG_OK)]),
+    ('escalates once per level', [
+        (0.0, 4.0, wd.WATCHDOG_OK),
+        (0.0, 5.0, wd.WATCHDOG_STALLED),
+        (0.0, 6.0, wd.WATCHDOG_OK),
+        (0.0, 10.0, wd.WATCHDOG_RECONNECT),
+        (0.0, 20.0, wd.WATCHDOG_OK),
+        (0.0, 30.0, wd.WATCHDOG_RESPAWN),
+        (0.0, 60.0, wd.WATCHDOG_OK),
+    ]),
+    ('skips to the level reached', [
+        (0.0, 12.0, wd.WATCHDOG_RECONNECT),
+        (0.0, 13.0, wd.WATCHDOG_OK),
+    ]),
+    ('recovery resets the level', [
+        (0.0, 5.0, wd.WATCHDOG_STALLED),
+        (5.5, 6.0, wd.WATCHDOG_OK),
+        (5.5, 10.5, wd.WATCHDOG_STALLED),
+        (5.5, 15.5, wd.WATCHDOG_RECONNECT),
+    ]),
+    ('no recovery without a frame', [
+        (0.0, 10.0, wd.WATCHDOG_RECONNECT),
+        (0.0, 5.0, wd.WATCHDOG_OK),  # Only below the reached level, not recovered.
+        (0.0, 10.0, wd.WATCHDOG_OK),
+    ]),
+])
+def test_watchdog_check(name, checks):
+    watchdog = wd.StallWatchdog(stall_seconds=5.0, reconnect_seconds=10.0, respawn_seconds=30.0)
+    for heartbeat, now, expected in checks:
+        assert watchdog.check(heartbeat, now) == expected, (name, heartbeat, now)
+        assert watchdog.idle_seconds == now - heartbeat
+
+
+def test_watchdog_reset():
+    watchdog = wd.StallWatchdog(stall_seconds=5.0, reconnect_seconds=10.0, respawn_seconds=30.0)
+    assert watchdog.check(0.0, 30.0) == wd.WATCHDOG_RESPAWN
+    assert watchdog.stalled
+    watchdog.reset(30.0)
+    assert not watchdog.stalled
+    # The idle time counts from the reset, not from the last heartbeat.
+    assert watchdog.check(0.0, 34.0) == wd.WATCHDOG_OK
+    assert watchdog.idle_seconds == 4.0
+    assert watchdog.check(0.0, 35.0) == wd.WATCHDOG_STALLED
+
+
+def test_watchdog_disabled_levels():
+    watchdog = wd.StallWatchdog(stall_seconds=0.0, reconnect_seconds=0.0, respawn_seconds=20.0)
+    assert watchdog.check(0.0, 15.0) == wd.WATCHDOG_OK
+    assert watchdog.check(0.0, 20.0) == wd.WATCHDOG_RESPAWN